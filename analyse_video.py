@@ -0,0 +1,140 @@
+"""
+Analyse des images des caméras
+Calculs vectorisés (NumPy/OpenCV) sur une version réduite en niveaux de gris de l'image,
+à une cadence propre, indépendante de la cadence d'affichage.
+"""
+import collections
+import os
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# Analyse de mouvement: images analysées par seconde (0 = désactivée)
+CAMERA_MOTION_FPS = float(os.environ.get('CAMERA_MOTION_FPS', 2))
+# Fraction de l'image en mouvement à partir de laquelle un événement commence
+CAMERA_MOTION_THRESHOLD = float(os.environ.get('CAMERA_MOTION_THRESHOLD', 0.02))
+
+def reduire_gris(frame, largeur=160):
+    """Image réduite (INTER_AREA) en niveaux de gris, en float32"""
+    hauteur_source, largeur_source = frame.shape[:2]
+    if largeur_source > largeur:
+        frame = cv2.resize(frame, (largeur, max(1, round(hauteur_source * largeur / largeur_source))),
+                           interpolation=cv2.INTER_AREA)
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return frame.astype(np.float32)
+
+class AnalyseMouvement:
+    """Détection de mouvement par différence avec un fond moyen glissant
+
+    `score` est la fraction lissée de l'image en mouvement (0 à 1). Un événement commence quand la
+    fraction dépasse `seuil_evenement` et se termine après `fin_evenement` secondes sans mouvement.
+    """
+
+    def __init__(self, largeur=160, alpha=0.05, seuil_pixel=25.0, seuil_evenement=CAMERA_MOTION_THRESHOLD,
+                 fin_evenement=3.0, lissage=0.3, historique=50):
+        self.largeur = largeur
+        self.alpha = alpha
+        self.seuil_pixel = seuil_pixel
+        self.seuil_evenement = seuil_evenement
+        self.fin_evenement = fin_evenement
+        self.lissage = lissage
+        self.fond = None
+        self.score = 0.0
+        self.evenement = None  # événement en cours
+        self.evenements = collections.deque(maxlen=historique)  # événements terminés
+        self._dernier_mouvement = None
+
+    @property
+    def en_mouvement(self):
+        return self.evenement is not None
+
+    def analyser(self, frame, horodatage=None):
+        """Analyse une image; retourne ('debut'|'fin'|None, événement) lorsqu'un événement change"""
+        horodatage = horodatage or datetime.now()
+        image = reduire_gris(frame, self.largeur)
+        if self.fond is None or self.fond.shape != image.shape:
+            self.fond = image
+            return None, None
+
+        fraction = float(np.count_nonzero(np.abs(image - self.fond) > self.seuil_pixel)) / image.size
+        # Fond glissant: les changements lents (lumière) ne sont pas du mouvement
+        self.fond *= 1.0 - self.alpha
+        self.fond += self.alpha * image
+        self.score = self.lissage * fraction + (1.0 - self.lissage) * self.score
+
+        if fraction >= self.seuil_evenement:
+            self._dernier_mouvement = horodatage
+            if self.evenement is None:
+                self.evenement = {'debut': horodatage, 'fin': None, 'pic': fraction}
+                return 'debut', self.evenement
+            self.evenement['pic'] = max(self.evenement['pic'], fraction)
+        elif self.evenement is not None and \
+                (horodatage - self._dernier_mouvement).total_seconds() >= self.fin_evenement:
+            evenement, self.evenement = self.evenement, None
+            evenement['fin'] = self._dernier_mouvement
+            self.evenements.append(evenement)
+            return 'fin', evenement
+        return None, None
+
+    def derniers_evenements(self, nombre=10):
+        """Événements les plus récents d'abord (l'événement en cours compris)"""
+        evenements = list(self.evenements)[-nombre:]
+        if self.evenement is not None:
+            evenements.append(self.evenement)
+        return [
+            {'start': e['debut'].isoformat(), 'end': e['fin'].isoformat() if e['fin'] else None,
+             'peak': round(e['pic'], 3)}
+            for e in reversed(evenements)
+        ][:nombre]
+
+# Qualité de l'image: vérification périodique et durée avant de signaler une image figée, noire ou uniforme
+CAMERA_IMAGE_CHECK_INTERVAL = float(os.environ.get('CAMERA_IMAGE_CHECK_INTERVAL', 1))
+CAMERA_IMAGE_ALERT_SECONDS = float(os.environ.get('CAMERA_IMAGE_ALERT_SECONDS', 10))
+
+class SanteImage:
+    """Détection des images figées, noires ou uniformes à partir d'une signature réduite
+
+    La signature est l'image réduite à 32 px de large en niveaux de gris, avec sa moyenne et son écart
+    type: un écart type quasi nul signale une image uniforme (noire si la moyenne est basse), deux
+    signatures identiques une image figée (un flux réel a toujours un peu de bruit). Un état n'est
+    signalé qu'après `delai` secondes; le retour à 'ok' est immédiat.
+    """
+
+    def __init__(self, delai=CAMERA_IMAGE_ALERT_SECONDS, seuil_noir=16.0, seuil_uniforme=3.0, seuil_fige=0.5):
+        self.delai = delai
+        self.seuil_noir = seuil_noir
+        self.seuil_uniforme = seuil_uniforme
+        self.seuil_fige = seuil_fige
+        self.etat = 'ok'
+        self.moyenne = None
+        self.ecart_type = None
+        self._precedente = None
+        self._candidat = 'ok'
+        self._depuis = None
+
+    def classer(self, reduite):
+        """État de l'image réduite, comparée à la précédente"""
+        self.moyenne = float(reduite.mean())
+        self.ecart_type = float(reduite.std())
+        if self.ecart_type < self.seuil_uniforme:
+            return 'black' if self.moyenne < self.seuil_noir else 'uniform'
+        if self._precedente is not None and self._precedente.shape == reduite.shape and \
+                np.abs(reduite - self._precedente).max() < self.seuil_fige:
+            return 'frozen'
+        return 'ok'
+
+    def analyser(self, frame, maintenant):
+        """Analyse une image (`maintenant` en secondes); retourne (ancien, nouveau) si l'état change"""
+        reduite = reduire_gris(frame, 32)
+        candidat = self.classer(reduite)
+        self._precedente = reduite
+
+        if candidat != self._candidat:
+            self._candidat, self._depuis = candidat, maintenant
+        if candidat == self.etat or (candidat != 'ok' and maintenant - self._depuis < self.delai):
+            return None
+
+        ancien, self.etat = self.etat, candidat
+        return ancien, candidat
@@ -4,6 +4,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from werkzeug.middleware.proxy_fix import ProxyFix
+from db_routing import RoutingSession, get_replica_binds, init_routage
+from db_pool import get_engine_options, instrumenter_engine
 
 # Configure logging
 logging.basicConfig(
@@ -11,7 +13,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 # Create the app
 app = Flask(__name__)
@@ -24,15 +26,32 @@ if database_url and database_url.startswith("postgres://"):
     database_url = database_url.replace("postgres://", "postgresql://", 1)
 
 app.config["SQLALCHEMY_DATABASE_URI"] = database_url or "sqlite:///monitoring_local.db"
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Pool de connexions réglable par rôle de processus (DB_ROLE, DB_POOL_SIZE, ...)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = get_engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Réplicas en lecture optionnels (DATABASE_REPLICA_URLS)
+app.config["SQLALCHEMY_BINDS"] = get_replica_binds()
+app.config["DATABASE_REPLICA_RYW_SECONDS"] = float(os.environ.get("DATABASE_REPLICA_RYW_SECONDS", 5))
+
 # Initialize the app with the extension
 db.init_app(app)
 
+# Profil SQLite (WAL, PRAGMA), métriques des pools, file d'écriture à thread unique et routage vers les réplicas
+from sqlite_profile import appliquer_profil_sqlite
+from write_queue import write_queue
+
+with app.app_context():
+    for bind_key, engine in db.engines.items():
+        appliquer_profil_sqlite(engine)
+        instrumenter_engine(bind_key or 'primary', engine)
+write_queue.init_app(app)
+init_routage(app)
+
+# Profilage SQL par route (/admin/perf, en-têtes Server-Timing)
+from query_stats import perf_registry
+perf_registry.init_app(app)
+
 # Configure Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
@@ -53,8 +72,15 @@ def load_user(user_id):
 def init_app():
     with app.app_context():
         db.create_all()
-        from scheduler import init_scheduler
-        init_scheduler(app)
+        from migrations import appliquer_migrations
+        appliquer_migrations(db.engine)
+        # Planificateur désactivable (benchmarks, processus web sans tâches de fond)
+        if os.environ.get('DISABLE_SCHEDULER') != '1':
+            from scheduler import init_scheduler
+            init_scheduler(app)
+            # Superviseur des flux: connecte dès le démarrage les caméras en veille active
+            if routes.camera_manager is not None:
+                routes.camera_manager.supervisor.ensure_started()
 
 # Only initialize if this is the main execution
 if __name__ != '__main__':
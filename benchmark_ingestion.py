@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Comparaison du débit de /api/ping: application Flask (gunicorn) et service d'ingestion asynchrone
+Peuple une base SQLite temporaire (generer_parc.py), démarre chaque serveur à tour de rôle et
+lui envoie la même charge avec charge_pings.py, puis affiche débit et latences côte à côte.
+
+Usage:
+    python benchmark_ingestion.py --equipements 2000 --intervalle 1 --duree 20
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+def port_libre():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def attendre_serveur(url, processus, timeout=60.0):
+    """Attend que le serveur réponde (n'importe quel code HTTP)"""
+    fin = time.monotonic() + timeout
+    while time.monotonic() < fin:
+        if processus.poll() is not None:
+            raise RuntimeError(f"Le serveur s'est arrêté (code {processus.returncode})")
+        try:
+            urllib.request.urlopen(url, timeout=1.0)
+            return
+        except urllib.error.HTTPError:
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Le serveur ne répond pas: {url}")
+
+def commandes_serveurs(port, config):
+    """Commandes de lancement et URL de disponibilité de chaque serveur"""
+    return {
+        'flask': (
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(config.workers),
+             '--threads', str(config.threads), '--bind', f'127.0.0.1:{port}', 'main:app'],
+            f'http://127.0.0.1:{port}/login',
+        ),
+        'async': (
+            [sys.executable, 'service_ingestion.py', '--hote', '127.0.0.1', '--port', str(port)],
+            f'http://127.0.0.1:{port}/sante',
+        ),
+    }
+
+def mesurer_serveur(nom, env, config):
+    port = port_libre()
+    commande, url_sante = commandes_serveurs(port, config)[nom]
+    processus = subprocess.Popen(commande, cwd=DOSSIER, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        attendre_serveur(url_sante, processus)
+        charge = subprocess.run(
+            [sys.executable, 'charge_pings.py', '--json', '--serveur', f'http://127.0.0.1:{port}',
+             '--equipements', str(config.equipements), '--intervalle', str(config.intervalle),
+             '--duree', str(config.duree), '--connexions', str(config.connexions), '--progression', '3600'],
+            cwd=DOSSIER, env=env, capture_output=True, text=True, check=True,
+        )
+        return json.loads(charge.stdout)
+    finally:
+        processus.terminate()
+        try:
+            processus.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            processus.kill()
+
+def afficher_comparaison(resultats, debit_offert):
+    print(f"\nCharge offerte: {debit_offert:.0f} req/s")
+    print(f"{'serveur':<8} {'débit':>12} {'réussis':>12} {'p50':>9} {'p95':>9} {'p99':>9}  statuts")
+    for nom, rapport in resultats.items():
+        latence = rapport['latence_ms']
+        valeurs = [f"{latence[p]:.1f}ms" if latence[p] is not None else '-' for p in ('p50', 'p95', 'p99')]
+        print(f"{nom:<8} {rapport['debit_rps']:>8.0f}/s {rapport['debit_reussi_rps']:>8.0f}/s "
+              f"{valeurs[0]:>9} {valeurs[1]:>9} {valeurs[2]:>9}  {rapport['statuts']}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Débit de /api/ping: Flask (gunicorn) et service asynchrone")
+    parser.add_argument('--equipements', type=int, default=2000, help="nombre d'équipements simulés")
+    parser.add_argument('--intervalle', type=float, default=1.0, help="secondes entre deux pings d'un équipement")
+    parser.add_argument('--duree', type=float, default=20.0, help="durée de la charge par serveur (secondes)")
+    parser.add_argument('--connexions', type=int, default=200, help="connexions HTTP simultanées maximum")
+    parser.add_argument('--workers', type=int, default=2, help="workers gunicorn de l'application Flask")
+    parser.add_argument('--threads', type=int, default=4, help="threads par worker gunicorn")
+    parser.add_argument('--serveurs', default='flask,async', help="serveurs à mesurer (séparés par des virgules)")
+    parser.add_argument('--json', action='store_true', help="afficher les rapports en JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    dossier = tempfile.mkdtemp(prefix='benchmark_ingestion_')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(dossier, 'ingestion.db')}",
+               DISABLE_SCHEDULER='1', DISABLE_CAMERA_STREAMS='1', LOG_LEVEL='WARNING',
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(dossier, 'prometheus'))
+    env.pop('DATABASE_REPLICA_URLS', None)
+    os.makedirs(env['PROMETHEUS_MULTIPROC_DIR'])
+
+    try:
+        print(f"Génération d'un parc de {config.equipements} équipements...", file=sys.stderr)
+        subprocess.run(
+            [sys.executable, 'generer_parc.py', '--equipements', str(config.equipements),
+             '--clients', str(max(config.equipements // 50, 1)), '--jours', '0.01', '--sans-pannes'],
+            cwd=DOSSIER, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+        resultats = {}
+        for nom in config.serveurs.split(','):
+            print(f"Charge sur le serveur {nom}...", file=sys.stderr)
+            resultats[nom] = mesurer_serveur(nom, env, config)
+    finally:
+        shutil.rmtree(dossier, ignore_errors=True)
+
+    if config.json:
+        print(json.dumps(resultats, indent=2))
+    else:
+        afficher_comparaison(resultats, config.equipements / config.intervalle)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Benchmarks des chemins critiques avec détection des régressions
+Réception des pings, vérification des équipements hors ligne (1k/10k/100k équipements),
+tableau de bord, statistiques, pagination de l'historique, encodage JPEG et purge de l'historique.
+Exécutés sur une base SQLite en mémoire peuplée par generer_parc.py; chaque benchmark est mesuré en
+plusieurs tours. Sa médiane, rapportée à celle d'un étalon (charge fixe mesurée pendant le même
+passage), est comparée aux références de benchmarks_baseline.json. Le seuil est élargi du bruit observé
+(écart entre tours) pour ne signaler que les régressions qui dépassent la variabilité des mesures.
+
+Usage:
+    python benchmarks.py                      # compare aux références (code retour 1 si régression)
+    python benchmarks.py --enregistrer        # enregistre les résultats comme nouvelles références
+    python benchmarks.py --filtre ping --tailles 1000,10000 --seuil 0.3 --tours 5
+"""
+import os
+import sys
+
+# Toujours une base en mémoire: les benchmarks vident et repeuplent les tables
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+os.environ.setdefault('DISABLE_CAMERA_STREAMS', '1')
+
+import argparse
+import json
+import logging
+import platform
+import hashlib
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import main  # noqa: F401  (enregistre les routes)
+from app import app, db
+from models import HistoriquePing, Alerte, User
+from generer_parc import generer_parc, inserer_en_masse
+
+FICHIER_REFERENCES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+
+# Tailles de parc par défaut pour la vérification des équipements hors ligne
+TAILLES_PARC = (1000, 10000, 100000)
+
+# Écart absolu toléré (ms) en plus du seuil relatif, pour les mesures très courtes
+MARGE_ABSOLUE_MS = 0.2
+
+# Tours de mesure par benchmark (médiane des médianes, bruit = écart relatif entre tours)
+TOURS = 3
+
+MOT_DE_PASSE_ADMIN = 'benchmark'
+
+def reinitialiser_base():
+    """Recrée un schéma vide"""
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+def peupler(nb_equipements, pings_par_equipement=0):
+    """Peuple la base d'un parc synthétique (50 équipements par client, un ping par minute)"""
+    if pings_par_equipement:
+        historique, intervalle = timedelta(minutes=pings_par_equipement), timedelta(minutes=1)
+    else:
+        # Une semaine de pannes simulées, un seul ping d'historique par équipement
+        historique, intervalle = timedelta(days=7), timedelta(days=7)
+    generer_parc(nb_clients=max(nb_equipements // 50, 1), nb_equipements=nb_equipements,
+                 historique=historique, intervalle=intervalle)
+
+def inserer_historique_ancien(nb_equipements, pings_par_equipement, rng):
+    """Insère des pings de plus de 30 jours (à purger)"""
+    depuis = datetime.utcnow() - timedelta(days=31)
+    inserer_en_masse(HistoriquePing.__table__, (
+        {
+            'equipement_id': equipement_id,
+            'timestamp': depuis - timedelta(minutes=n),
+            'statut': 'success',
+            'reponse_ms': rng.randint(20, 80),
+            'message': 'Ping benchmark',
+        }
+        for n in range(pings_par_equipement)
+        for equipement_id in range(1, nb_equipements + 1)
+    ))
+    db.session.commit()
+
+def client_admin():
+    """Client HTTP de test connecté en administrateur"""
+    admin = User(nom_utilisateur='admin', email='admin@benchmark.local', role='admin', statut='approuve')
+    admin.set_password(MOT_DE_PASSE_ADMIN)
+    db.session.add(admin)
+    db.session.commit()
+
+    client = app.test_client()
+    client.post('/login', data={'nom_utilisateur': 'admin', 'mot_de_passe': MOT_DE_PASSE_ADMIN})
+    return client
+
+def verifier_reponse(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"Réponse HTTP {response.status_code} inattendue")
+
+# Chaque benchmark prépare ses données et retourne (preparation, execution):
+# la préparation est exécutée avant chaque mesure, hors chronométrage
+
+def bench_recevoir_ping():
+    peupler(1000)
+    client = app.test_client()
+    rng = random.Random(1)
+
+    def executer():
+        response = client.post('/api/ping', json={'equipement_id': rng.randint(1, 1000), 'response_time': 42})
+        verifier_reponse(response)
+
+    return None, executer
+
+def bench_verifier_hors_ligne(taille):
+    from scheduler import _generer_alertes_hors_ligne
+
+    peupler(taille)
+
+    def preparation():
+        Alerte.query.delete()
+        db.session.commit()
+        db.session.expunge_all()
+
+    return preparation, _generer_alertes_hors_ligne
+
+def bench_page(url, pings_par_equipement=0):
+    def bench():
+        peupler(1000, pings_par_equipement=pings_par_equipement)
+        client = client_admin()
+        return None, lambda: verifier_reponse(client.get(url))
+    return bench
+
+def bench_purge_historique():
+    from scheduler import _supprimer_historique_ancien
+
+    peupler(1000, pings_par_equipement=20)
+    rng = random.Random(2)
+
+    def preparation():
+        inserer_historique_ancien(1000, 20, rng)
+
+    return preparation, _supprimer_historique_ancien
+
+def _flux_camera():
+    import numpy as np
+    from camera_stream import CameraStream
+
+    # Image synthétique: dégradé et bruit, plus proche d'une vraie scène qu'une image unie
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(0, 255, 640, dtype=np.uint8)
+    image = np.dstack([np.tile(gradient, (480, 1))] * 3)
+    image = np.clip(image.astype(np.int16) + rng.integers(-20, 20, image.shape), 0, 255).astype(np.uint8)
+
+    stream = CameraStream(camera_id=0, rtsp_url='rtsp://benchmark')
+    stream._publier_image(image)
+    return stream
+
+def bench_encodage_jpeg():
+    stream = _flux_camera()
+    return None, lambda: stream.get_frame_as_jpeg(75)
+
+def bench_diffusion_jpeg(spectateurs=10, profil='medium'):
+    def bench():
+        # Une nouvelle image diffusée à plusieurs spectateurs (rendue une fois, puis servie du cache)
+        stream = _flux_camera()
+        image = stream.last_frame
+
+        def executer():
+            stream._publier_image(image)
+            for _ in range(spectateurs):
+                stream.get_jpeg(profil)
+
+        return None, executer
+    return bench
+
+def bench_analyse_mouvement():
+    from analyse_video import AnalyseMouvement
+
+    image = _flux_camera().last_frame
+    analyse = AnalyseMouvement()
+    analyse.analyser(image)
+    return None, lambda: analyse.analyser(image)
+
+def bench_mosaique(cameras=16):
+    def bench():
+        # Nouvelle image sur chaque caméra puis composition et encodage de la mosaïque (tuiles 320x240)
+        from camera_stream import CameraStreamManager, Mosaique
+
+        manager = CameraStreamManager()
+        image = _flux_camera().last_frame
+        for camera_id in range(cameras):
+            manager.streams[camera_id] = _flux_camera()
+        mosaique = Mosaique(manager, range(cameras), 4, (320, 240))
+
+        def executer():
+            for stream in manager.streams.values():
+                stream._publier_image(image)
+            mosaique.get_jpeg()
+
+        return None, executer
+    return bench
+
+def lister_benchmarks(tailles):
+    """Retourne la liste (nom, fonction, répétitions)"""
+    benchmarks = [('recevoir_ping', bench_recevoir_ping, 300)]
+    for taille in tailles:
+        repetitions = max(3, min(30, 300000 // taille))
+        benchmarks.append((f'verifier_hors_ligne[{taille}]', lambda taille=taille: bench_verifier_hors_ligne(taille),
+                           repetitions))
+    benchmarks += [
+        ('dashboard', bench_page('/'), 30),
+        ('api_stats', bench_page('/api/stats'), 50),
+        ('historique[page=1]', bench_page('/historique?page=1', pings_par_equipement=50), 50),
+        ('historique[page=500]', bench_page('/historique?page=500', pings_par_equipement=50), 50),
+        ('purge_historique', bench_purge_historique, 10),
+        ('encodage_jpeg', bench_encodage_jpeg, 100),
+        ('diffusion_jpeg[10]', bench_diffusion_jpeg(10), 30),
+        ('diffusion_miniature[10]', bench_diffusion_jpeg(10, 'thumbnail'), 30),
+        ('mosaique[16]', bench_mosaique(16), 30),
+        ('analyse_mouvement', bench_analyse_mouvement, 100),
+    ]
+    return benchmarks
+
+def charge_etalon():
+    """Charge fixe (Python, SQLite, hachage) qui mesure la vitesse de la machine pendant ce passage"""
+    connexion = sqlite3.connect(':memory:')
+    connexion.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, groupe INTEGER, valeur TEXT)")
+    connexion.executemany("INSERT INTO t (groupe, valeur) VALUES (?, ?)",
+                          ((i % 50, hashlib.sha256(str(i).encode()).hexdigest()) for i in range(5000)))
+    connexion.execute("SELECT groupe, count(*), max(valeur) FROM t GROUP BY groupe ORDER BY 3").fetchall()
+    connexion.close()
+    sorted(json.dumps({'n': i, 'v': [i] * 5}) for i in range(5000))
+
+def mesurer_etalon(repetitions=30):
+    """Durée médiane (ms) de l'étalon"""
+    charge_etalon()
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        charge_etalon()
+        durees.append((time.perf_counter() - debut) * 1000)
+    return statistics.median(durees)
+
+def mesurer(fonction, repetitions, tours=TOURS):
+    """Exécute un benchmark et retourne ses durées en millisecondes, par tour"""
+    with app.app_context():
+        reinitialiser_base()
+        preparation, executer = fonction()
+
+        # Tour de chauffe (caches, compilation des requêtes)
+        if preparation:
+            preparation()
+        executer()
+
+        durees = []
+        for _ in range(tours):
+            durees_tour = []
+            for _ in range(repetitions):
+                if preparation:
+                    preparation()
+                debut = time.perf_counter()
+                executer()
+                durees_tour.append((time.perf_counter() - debut) * 1000)
+            durees.append(durees_tour)
+        db.session.remove()
+    return durees
+
+def resumer(durees_par_tour, etalon_ms):
+    """Médiane des médianes des tours, bruit (écart relatif entre tours) et durée relative à l'étalon"""
+    medianes = [statistics.median(durees_tour) for durees_tour in durees_par_tour]
+    durees = sorted(duree for durees_tour in durees_par_tour for duree in durees_tour)
+    mediane = statistics.median(medianes)
+    return {
+        'median_ms': round(mediane, 3),
+        'p95_ms': round(durees[max(int(len(durees) * 0.95) - 1, 0)], 3),
+        'min_ms': round(durees[0], 3),
+        'repetitions': len(durees),
+        'bruit': round((max(medianes) - min(medianes)) / mediane, 3) if mediane else 0.0,
+        'relatif': round(mediane / etalon_ms, 4),
+    }
+
+def comparer(resume, reference, etalon_ms, seuil):
+    """Retourne (écart relatif, seuil effectif, régression) par rapport à une référence
+
+    Les références récentes sont comparées en durée relative à l'étalon (indépendante de la machine);
+    le seuil est élargi du bruit des deux mesures.
+    """
+    if 'relatif' in reference:
+        attendu_ms = reference['relatif'] * etalon_ms
+    else:
+        attendu_ms = reference['median_ms']  # ancienne référence: durée absolue
+    ecart = resume['median_ms'] / attendu_ms - 1
+    seuil_effectif = seuil + resume['bruit'] + reference.get('bruit', 0.0)
+    regression = ecart > seuil_effectif and resume['median_ms'] - attendu_ms > MARGE_ABSOLUE_MS
+    return ecart, seuil_effectif, regression
+
+def charger_references():
+    if not os.path.exists(FICHIER_REFERENCES):
+        return {}
+    with open(FICHIER_REFERENCES, encoding='utf-8') as f:
+        return json.load(f).get('benchmarks', {})
+
+def enregistrer_references(resultats):
+    references = charger_references()
+    references.update(resultats)
+    with open(FICHIER_REFERENCES, 'w', encoding='utf-8') as f:
+        json.dump({
+            'machine': {'python': platform.python_version(), 'plateforme': platform.platform()},
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'benchmarks': dict(sorted(references.items())),
+        }, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins critiques")
+    parser.add_argument('--filtre', help="n'exécuter que les benchmarks dont le nom contient ce texte")
+    parser.add_argument('--tailles', default=','.join(str(t) for t in TAILLES_PARC),
+                        help="tailles de parc pour verifier_hors_ligne (séparées par des virgules)")
+    parser.add_argument('--seuil', type=float, default=0.30,
+                        help="ralentissement relatif toléré de la médiane, en plus du bruit mesuré (0.30 = +30%%)")
+    parser.add_argument('--tours', type=int, default=TOURS, help="tours de mesure par benchmark")
+    parser.add_argument('--enregistrer', action='store_true', help="enregistrer les résultats comme références")
+    return parser.parse_args(argv)
+
+def main_benchmarks(argv=None):
+    config = parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    tailles = [int(taille) for taille in config.tailles.split(',') if taille.strip()]
+    references = charger_references()
+    resultats = {}
+    regressions = []
+
+    # Étalon mesuré avant et après les benchmarks: vitesse de la machine pendant ce passage
+    etalon_ms = mesurer_etalon()
+    print(f"étalon: {etalon_ms:.2f}ms\n")
+    print(f"{'benchmark':<28} {'médiane':>10} {'p95':>10} {'bruit':>7} {'attendu':>10} {'écart':>8} {'seuil':>7}")
+    mesures = []
+    for nom, fonction, repetitions in lister_benchmarks(tailles):
+        if config.filtre and config.filtre not in nom:
+            continue
+
+        try:
+            mesures.append((nom, mesurer(fonction, repetitions, config.tours)))
+        except ImportError as e:
+            print(f"{nom:<28} ignoré ({e})")
+    etalon_ms = (etalon_ms + mesurer_etalon()) / 2
+
+    for nom, durees in mesures:
+        resume = resumer(durees, etalon_ms)
+        resultats[nom] = resume
+
+        reference = references.get(nom)
+        attendu = ecart = seuil = '-'
+        if reference:
+            ratio, seuil_effectif, regression = comparer(resume, reference, etalon_ms, config.seuil)
+            attendu = f"{resume['median_ms'] / (1 + ratio):.2f}ms"
+            ecart, seuil = f"{ratio:+.0%}", f"{seuil_effectif:.0%}"
+            if regression:
+                regressions.append(nom)
+                ecart += ' ⚠️'
+
+        print(f"{nom:<28} {resume['median_ms']:>8.2f}ms {resume['p95_ms']:>8.2f}ms {resume['bruit']:>7.0%} "
+              f"{attendu:>10} {ecart:>8} {seuil:>7}")
+
+    if config.enregistrer:
+        enregistrer_references(resultats)
+        print(f"\n✅ Références enregistrées dans {FICHIER_REFERENCES}")
+        return 0
+
+    if regressions:
+        print(f"\n❌ Régression (> {config.seuil:.0%} + bruit) : {', '.join(regressions)}")
+        return 1
+
+    print("\n✅ Aucune régression")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_benchmarks())
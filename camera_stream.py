@@ -6,17 +6,236 @@ Gère la capture et la diffusion des flux vidéo des caméras
 
 import cv2
 import logging
+import math
+import os
 import threading
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from io import BytesIO
 import base64
+import collections
+import functools
+import hashlib
 from PIL import Image
 import numpy as np
-from flask import Response, jsonify
+import socket
+from flask import Response, jsonify, request
+from enregistrement import TamponClips, ecrivain_clips, CAMERA_CLIPS, PROFIL_CLIP
+from diffusion_hls import masquer_identifiants
+from analyse_video import (AnalyseMouvement, SanteImage, CAMERA_MOTION_FPS, CAMERA_IMAGE_CHECK_INTERVAL,
+                           reduire_gris)
+from metrics import (CAMERA_STREAMS_ACTIVE, CAMERA_FRAMES_TOTAL, CAMERA_LAST_FRAME, CAMERA_ENCODE_SECONDS,
+                     CAMERA_VIEWERS, CAMERA_FRAMES_SKIPPED_TOTAL, CAMERA_RECONNECTS_TOTAL, CAMERA_EVICTIONS_TOTAL,
+                     CAMERA_SUPERVISOR_SECONDS, CAMERA_SUPERVISOR_LAST_RUN, CAMERA_MOTION_SCORE,
+                     CAMERA_MOTION_EVENTS_TOTAL, CAMERA_IMAGE_PROBLEMS_TOTAL, CAMERA_CONNECT_SECONDS, ALERTS_TOTAL)
 
 logger = logging.getLogger(__name__)
 
+# Flux sans spectateur: passage à une capture de maintien (CAMERA_KEEPALIVE_FPS) après
+# CAMERA_IDLE_SECONDS, puis arrêt après CAMERA_IDLE_STOP_SECONDS (0 = jamais)
+CAMERA_IDLE_SECONDS = float(os.environ.get('CAMERA_IDLE_SECONDS', 30))
+CAMERA_KEEPALIVE_FPS = float(os.environ.get('CAMERA_KEEPALIVE_FPS', 1))
+CAMERA_IDLE_STOP_SECONDS = float(os.environ.get('CAMERA_IDLE_STOP_SECONDS', 300))
+
+# Superviseur des flux: période de vérification, délai sans image avant reconnexion et recul maximum
+CAMERA_SUPERVISOR_INTERVAL = float(os.environ.get('CAMERA_SUPERVISOR_INTERVAL', 5))
+CAMERA_STALL_SECONDS = float(os.environ.get('CAMERA_STALL_SECONDS', 30))
+CAMERA_RECONNECT_MAX_SECONDS = float(os.environ.get('CAMERA_RECONNECT_MAX_SECONDS', 60))
+# Caméras en veille active (stream_standby): liste relue en base à cette période (secondes)
+CAMERA_STANDBY_REFRESH_SECONDS = float(os.environ.get('CAMERA_STANDBY_REFRESH_SECONDS', 60))
+
+# Profils de diffusion: largeur maximale (None = résolution de capture) et qualité JPEG
+PROFILS_FLUX = {
+    'thumbnail': (320, 50),
+    'medium': (640, 75),
+    'full': (None, 90),
+}
+# Valeurs de Equipement.stream_quality
+ALIAS_PROFILS = {'low': 'thumbnail', 'high': 'full'}
+
+def resoudre_profil(nom, defaut='medium'):
+    """Nom de profil canonique (accepte aussi low/medium/high), None si le profil demandé est inconnu"""
+    if not nom:
+        # Valeur configurée invalide: profil medium
+        defaut = ALIAS_PROFILS.get(defaut, defaut)
+        return defaut if defaut in PROFILS_FLUX else 'medium'
+    nom = ALIAS_PROFILS.get(nom, nom)
+    return nom if nom in PROFILS_FLUX else None
+
+# Instantanés: durée de cache navigateur et écart (niveaux de gris, image réduite) à partir duquel
+# le contenu est considéré comme modifié (nouvel ETag)
+CAMERA_SNAPSHOT_MAX_AGE = int(os.environ.get('CAMERA_SNAPSHOT_MAX_AGE', 5))
+CAMERA_SNAPSHOT_TOLERANCE = float(os.environ.get('CAMERA_SNAPSHOT_TOLERANCE', 4))
+
+# Mosaïque: images par seconde et nombre maximum de caméras
+CAMERA_MOSAIC_FPS = float(os.environ.get('CAMERA_MOSAIC_FPS', 5))
+CAMERA_MOSAIC_MAX = int(os.environ.get('CAMERA_MOSAIC_MAX', 36))
+
+# Tampon d'envoi des spectateurs MJPEG (octets, 0 = valeur du système): borné, il ne retient que
+# quelques images et l'écriture bloque dès que le lien sature (cadence adaptée au débit)
+CAMERA_SEND_BUFFER_BYTES = int(os.environ.get('CAMERA_SEND_BUFFER_BYTES', 65536))
+
+# Compatibilité gevent (gunicorn -k gevent): les spectateurs MJPEG sont alors des greenlets et un
+# processus en sert des centaines; les appels OpenCV bloquants restent dans des threads système
+try:
+    from gevent import monkey as gevent_monkey
+except ImportError:
+    gevent_monkey = None
+
+def gevent_actif():
+    """Indique si le module threading a été remplacé par gevent"""
+    return gevent_monkey is not None and gevent_monkey.is_module_patched('threading')
+
+def executer_bloquant(fonction, *args):
+    """Exécute un appel bloquant (ouverture RTSP...) sans bloquer les autres greenlets"""
+    if gevent_actif():
+        import gevent
+        return gevent.get_hub().threadpool.apply(fonction, args)
+    return fonction(*args)
+
+def pause_systeme(secondes):
+    """time.sleep d'origine, pour les threads système lorsque gevent est actif"""
+    if gevent_actif():
+        gevent_monkey.get_original('time', 'sleep')(secondes)
+    else:
+        time.sleep(secondes)
+
+class ThreadCapture:
+    """Thread système exécutant une fonction (pool de threads du hub lorsque gevent est actif)"""
+
+    def __init__(self, fonction, nom):
+        self._thread = None
+        self._resultat = None
+        if gevent_actif():
+            import gevent
+            pool = gevent.get_hub().threadpool
+            pool.maxsize = max(pool.maxsize, len(pool) + 1)
+            self._resultat = pool.spawn(fonction)
+        else:
+            self._thread = threading.Thread(target=fonction, name=nom, daemon=True)
+            self._thread.start()
+
+    def is_alive(self):
+        if self._thread is not None:
+            return self._thread.is_alive()
+        return not self._resultat.ready()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            self._resultat.wait(timeout)
+
+class SignalImage:
+    """Réveille les spectateurs en attente d'une nouvelle image
+
+    `notifier` est appelé par le thread de capture; sous gevent, le réveil des greenlets est
+    transmis à leur hub (seule opération gevent sûre depuis un autre thread).
+    """
+
+    def __init__(self):
+        if gevent_actif():
+            import gevent
+            import gevent.event
+            self._hub = gevent.get_hub()
+            self._fabrique = gevent.event.Event
+        else:
+            self._hub = None
+            self._fabrique = threading.Event
+        self._evenement = self._fabrique()
+
+    def courant(self):
+        """Événement déclenché à la prochaine notification"""
+        return self._evenement
+
+    def notifier(self):
+        evenement, self._evenement = self._evenement, self._fabrique()
+        if self._hub is not None:
+            self._hub.loop.run_callback_threadsafe(evenement.set)
+        else:
+            evenement.set()
+
+@functools.lru_cache(maxsize=32)
+def image_attente(largeur, hauteur, texte):
+    """JPEG d'attente (fond gris et texte centré) envoyé avant la première image réelle"""
+    image = np.full((hauteur, largeur, 3), 48, np.uint8)
+    echelle = max(0.4, largeur / 1000)
+    (largeur_texte, hauteur_texte), _ = cv2.getTextSize(texte, cv2.FONT_HERSHEY_SIMPLEX, echelle, 1)
+    cv2.putText(image, texte, ((largeur - largeur_texte) // 2, (hauteur + hauteur_texte) // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, echelle, (200, 200, 200), 1, cv2.LINE_AA)
+    result, encoded_img = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), 75])
+    return encoded_img.tobytes() if result else None
+
+class CadenceSpectateur:
+    """Cadence d'envoi d'un spectateur MJPEG, adaptée à son débit
+
+    Une écriture WSGI qui bloque signale un lien saturé: le tampon d'envoi se vide au débit du lien,
+    estimé par taille / durée de l'écriture. Les images sont alors espacées de MARGE fois leur durée
+    de transmission, pour que le tampon se vide au lieu de retenir des images périmées; les images
+    intermédiaires sont sautées (la plus récente est envoyée). Tant que les écritures ne bloquent
+    pas, le débit estimé remonte progressivement, jusqu'à la cadence complète du flux.
+    """
+
+    MARGE = 1.25
+    SEUIL_BLOCAGE = 0.005  # secondes: au-delà, l'écriture a attendu le lien
+    SONDAGE = 1.1  # hausse du débit estimé après chaque écriture non bloquante
+
+    def __init__(self, intervalle_max):
+        self.intervalle_max = intervalle_max
+        self.debit = None  # octets/s (None: lien jamais saturé)
+        self.fps = None  # cadence effective lissée
+        self._dernier = None
+
+    def intervalle(self, taille):
+        """Délai minimum avant l'envoi suivant, pour une image de `taille` octets"""
+        if self.debit is None:
+            return 0.0
+        return min(self.MARGE * taille / self.debit, self.intervalle_max)
+
+    def envoye(self, taille, debut, fin):
+        """Enregistre un envoi; retourne la date (monotonic) avant laquelle ne pas envoyer le suivant"""
+        duree = fin - debut
+        if duree > self.SEUIL_BLOCAGE:
+            mesure = taille / duree
+            self.debit = mesure if self.debit is None or mesure < self.debit else \
+                self.debit + 0.3 * (mesure - self.debit)
+        elif self.debit is not None:
+            self.debit *= self.SONDAGE
+            if self.intervalle(taille) < 0.001:
+                self.debit = None
+
+        if self._dernier is not None:
+            fps = 1.0 / max(debut - self._dernier, 1e-3)
+            self.fps = fps if self.fps is None else self.fps + 0.2 * (fps - self.fps)
+        self._dernier = debut
+        return debut + self.intervalle(taille)
+
+class ImageCapturee:
+    """Image capturée et ses rendus JPEG par profil (calculés une fois par image)"""
+    
+    __slots__ = ('sequence', 'image', 'horodatage', 'rendus', 'empreinte')
+    
+    def __init__(self, sequence, image):
+        self.sequence = sequence
+        self.image = image
+        self.horodatage = time.time()
+        self.rendus = {}
+        self.empreinte = None
+
+class Instantane:
+    """Instantané d'une caméra: validateurs HTTP (ETag, date de modification) et JPEG rendu à la demande"""
+    
+    def __init__(self, stream, image, profil):
+        self.stream = stream
+        self.image = image
+        self.profil = profil
+        empreinte, self.modifie = stream.empreinte(image)
+        self.etag = f"{stream.camera_id}-{profil}-{empreinte}"
+    
+    @property
+    def jpeg(self):
+        return self.stream.get_jpeg(self.profil, self.image)
+
 class CameraStream:
     """Classe pour gérer un flux de caméra individuel"""
     
@@ -27,101 +246,352 @@ class CameraStream:
         self.fps = fps
         self.capture = None
         self.is_active = False
+        self.closed = False  # arrêt définitif (les spectateurs sont déconnectés)
+        self.stop_reason = None  # 'idle' ou 'errors' lorsque la capture s'est arrêtée d'elle-même
+        self.started_at = None
+        self.start_lock = threading.Lock()
+        # Connexion RTSP ouverte par le thread de capture; une génération abandonnée (arrêt,
+        # reconnexion) libère sa connexion dès qu'elle aboutit
+        self.connecting = False
+        self.generation = 0
+        # Veille active: flux maintenu (capture de maintien) même sans spectateur
+        self.veille = False
+        # Reconnexions par le superviseur (recul exponentiel)
+        self.reconnecting = False
+        self.reconnect_attempts = 0
+        self.next_reconnect = 0.0
         self.last_frame = None
         self.last_frame_time = None
         self.thread = None
         self.error_count = 0
         self.max_errors = 10
+        # Numéro de la dernière image capturée et réveil des spectateurs
+        self.sequence = 0
+        self.signal_image = SignalImage()
+        # Image courante et ses rendus par profil (encodés une fois pour tous les spectateurs)
+        self.image_courante = None
+        self.cache_lock = threading.Lock()
+        # Contenu de référence des instantanés: (image réduite, empreinte, date de modification)
+        self._reference = None
+        # Spectateurs connectés (total et par profil) et dernière activité (mise en veille des flux non regardés)
+        self.viewers = 0
+        self.profils_regardes = dict.fromkeys(PROFILS_FLUX, 0)
+        self.viewers_lock = threading.Lock()
+        self.last_activity = time.monotonic()
+        # Cadences d'envoi des spectateurs MJPEG (adaptées à leur débit)
+        self.cadences = set()
+        # Analyse de mouvement à cadence réduite (CAMERA_MOTION_FPS, 0 = désactivée)
+        self.mouvement = AnalyseMouvement() if CAMERA_MOTION_FPS > 0 else None
+        self._prochaine_analyse = 0.0
+        # Image figée, noire ou uniforme (changements d'état transmis en alertes par le superviseur)
+        self.sante_image = SanteImage()
+        self.transitions_image = collections.deque(maxlen=20)
+        self._prochaine_verification = 0.0
+        # Clips d'événements (pré-enregistrement en mémoire), si CAMERA_CLIPS=1
+        self.clips = TamponClips(camera_id, ecrivain_clips) if CAMERA_CLIPS else None
         
+    @property
+    def config(self):
+        """Configuration de la connexion (un flux de même configuration est réutilisé)"""
+        return self.rtsp_url, tuple(self.resolution), self.fps
+    
     def start_stream(self):
-        """Démarre le flux de capture vidéo"""
+        """Démarre le flux sans attendre la connexion RTSP, ouverte par le thread de capture"""
         if self.is_active:
             return True
-            
+        
         try:
-            self.capture = cv2.VideoCapture(self.rtsp_url)
-            if not self.capture.isOpened():
-                logger.error(f"Impossible d'ouvrir le flux RTSP pour la caméra {self.camera_id}: {self.rtsp_url}")
-                return False
-            
-            # Configuration de la capture
-            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
-            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
-            self.capture.set(cv2.CAP_PROP_FPS, self.fps)
-            self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Réduire la latence
-            
+            self.generation += 1
+            self.connecting = True
             self.is_active = True
             self.error_count = 0
+            self.stop_reason = None
+            self.started_at = datetime.now()
+            self.last_activity = time.monotonic()
             
-            # Démarrer le thread de capture
-            self.thread = threading.Thread(target=self._capture_frames, daemon=True)
-            self.thread.start()
-            
-            logger.info(f"Flux démarré pour la caméra {self.camera_id}")
+            # Démarrer le thread de capture (connexion puis lecture des images)
+            self.thread = ThreadCapture(functools.partial(self._capture_frames, self.generation),
+                                        f"capture-camera-{self.camera_id}")
             return True
             
         except Exception as e:
             logger.error(f"Erreur lors du démarrage du flux caméra {self.camera_id}: {e}")
+            self.is_active = self.connecting = False
             return False
     
+    def _ouvrir_capture(self, generation):
+        """Ouvre la connexion RTSP dans le thread de capture (privé); False en cas d'échec"""
+        debut = time.monotonic()
+        capture = None
+        try:
+            capture = cv2.VideoCapture(self.rtsp_url)
+            ouverte = capture.isOpened()
+            if ouverte:
+                capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
+                capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
+                capture.set(cv2.CAP_PROP_FPS, self.fps)
+                capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Réduire la latence
+        except Exception as e:
+            logger.error(f"Erreur lors de la connexion au flux caméra {self.camera_id}: {e}")
+            ouverte = False
+        
+        if generation != self.generation or not self.is_active:
+            # Connexion abandonnée entre-temps (arrêt ou nouvelle connexion)
+            if capture is not None:
+                capture.release()
+            return False
+        
+        duree = time.monotonic() - debut
+        self.connecting = False
+        CAMERA_CONNECT_SECONDS.observe(duree)
+        if self.reconnect_attempts:
+            CAMERA_RECONNECTS_TOTAL.labels(camera=str(self.camera_id),
+                                           result='success' if ouverte else 'failure').inc()
+        if not ouverte:
+            logger.error(f"Impossible d'ouvrir le flux RTSP pour la caméra {self.camera_id}: "
+                         f"{masquer_identifiants(self.rtsp_url)}")
+            if capture is not None:
+                capture.release()
+            self.stop_reason = 'errors'
+            self.is_active = False
+            return False
+        
+        self.capture = capture
+        CAMERA_STREAMS_ACTIVE.inc()
+        logger.info(f"Flux démarré pour la caméra {self.camera_id} (connexion en {duree:.1f}s)")
+        return True
+    
     def stop_stream(self):
         """Arrête le flux de capture vidéo"""
+        self.closed = True
+        self._stop_capture()
+        self.signal_image.notifier()  # libérer les spectateurs en attente
+        logger.info(f"Flux arrêté pour la caméra {self.camera_id}")
+    
+    def reconnect(self, force=False):
+        """Rouvre la connexion RTSP sans déconnecter les spectateurs"""
+        with self.start_lock:
+            if self.closed or (self.is_active and not force):
+                return self.is_active
+            self.reconnecting = True
+            try:
+                self._stop_capture()
+                return self.start_stream()
+            finally:
+                self.reconnecting = False
+    
+    def _stop_capture(self):
+        """Arrête le thread de capture et libère la connexion (privé)"""
         self.is_active = False
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=5.0)
+        self._release_capture()
+    
+    def is_stalled(self, delai=CAMERA_STALL_SECONDS):
+        """Capture active mais sans nouvelle image depuis `delai` secondes"""
+        if not self.is_active:
+            return False
+        reference = self.last_frame_time or self.started_at
+        return reference is not None and (datetime.now() - reference).total_seconds() > delai
+    
+    def _release_capture(self, depuis_capture=False):
+        """Libère la connexion RTSP (privé)"""
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            CAMERA_STREAMS_ACTIVE.dec()
+            if depuis_capture:
+                capture.release()  # déjà dans un thread système
+            else:
+                executer_bloquant(capture.release)
+    
+    def add_viewer(self, profil=None):
+        """Enregistre un spectateur (reprise immédiate de la cadence normale)"""
+        with self.viewers_lock:
+            self.viewers += 1
+            if profil in self.profils_regardes:
+                self.profils_regardes[profil] += 1
+            self.last_activity = time.monotonic()
+    
+    def remove_viewer(self, profil=None):
+        with self.viewers_lock:
+            self.viewers = max(self.viewers - 1, 0)
+            if profil in self.profils_regardes:
+                self.profils_regardes[profil] = max(self.profils_regardes[profil] - 1, 0)
+            self.last_activity = time.monotonic()
+    
+    def touch(self):
+        """Signale une utilisation du flux sans spectateur (instantané)"""
+        self.last_activity = time.monotonic()
+    
+    def idle_seconds(self):
+        """Durée depuis le départ du dernier spectateur (0 s'il en reste)"""
+        if self.viewers:
+            return 0.0
+        return time.monotonic() - self.last_activity
+    
+    @property
+    def mode(self):
+        """'live' (cadence normale), 'keepalive' (sans spectateur), 'connecting', 'reconnecting' ou 'stopped'"""
+        if self.reconnecting:
+            return 'reconnecting'
+        if not self.is_active:
+            return 'stopped'
+        if self.connecting:
+            return 'connecting'
+        if CAMERA_IDLE_SECONDS and self.idle_seconds() >= CAMERA_IDLE_SECONDS:
+            return 'keepalive'
+        return 'live'
+    
+    def _pause_capture(self, frame_interval):
+        """Attend avant l'image suivante; en maintien, reprend dès l'arrivée d'un spectateur (privé)"""
+        if self.mode != 'keepalive':
+            pause_systeme(frame_interval)
+            return
         
-        if self.capture:
-            self.capture.release()
-            self.capture = None
-        
-        logger.info(f"Flux arrêté pour la caméra {self.camera_id}")
+        fin = time.monotonic() + 1.0 / CAMERA_KEEPALIVE_FPS
+        while self.is_active and not self.viewers and time.monotonic() < fin:
+            pause_systeme(min(frame_interval, fin - time.monotonic(), 0.1))
     
-    def _capture_frames(self):
+    def _capture_frames(self, generation):
         """Thread de capture des images (privé)"""
+        if not self._ouvrir_capture(generation):
+            return
         frame_interval = 1.0 / self.fps
         
-        while self.is_active and self.capture:
-            try:
-                ret, frame = self.capture.read()
+        try:
+            while self.is_active and self.capture and generation == self.generation:
+                if not self.veille and CAMERA_IDLE_STOP_SECONDS and self.idle_seconds() >= CAMERA_IDLE_STOP_SECONDS:
+                    logger.info(f"Flux de la caméra {self.camera_id} arrêté: aucun spectateur depuis "
+                                f"{CAMERA_IDLE_STOP_SECONDS:.0f}s")
+                    self.stop_reason = 'idle'
+                    self.is_active = False
+                    self._release_capture(depuis_capture=True)
+                    break
+            
+                try:
+                    ret, frame = self.capture.read()
                 
-                if not ret:
-                    self.error_count += 1
-                    if self.error_count >= self.max_errors:
-                        logger.error(f"Trop d'erreurs de capture pour la caméra {self.camera_id}, arrêt du flux")
-                        self.is_active = False
-                        break
+                    if not ret:
+                        self.error_count += 1
+                        if self.error_count >= self.max_errors:
+                            logger.error(f"Trop d'erreurs de capture pour la caméra {self.camera_id}, arrêt du flux")
+                            self.stop_reason = 'errors'
+                            self.is_active = False
+                            self._release_capture(depuis_capture=True)
+                            break
                     
-                    time.sleep(0.1)
-                    continue
+                        pause_systeme(0.1)
+                        continue
                 
-                # Redimensionner l'image si nécessaire
-                if frame.shape[:2] != (self.resolution[1], self.resolution[0]):
-                    frame = cv2.resize(frame, self.resolution)
+                    # Redimensionner l'image si nécessaire
+                    if frame.shape[:2] != (self.resolution[1], self.resolution[0]):
+                        frame = cv2.resize(frame, self.resolution)
                 
-                self.last_frame = frame
-                self.last_frame_time = datetime.now()
-                self.error_count = 0
+                    enregistrer = self.clips is not None and generation == self.generation and self.clips.image_due()
+                    self._publier_image(frame, (PROFIL_CLIP,) if enregistrer else ())
+                    if enregistrer and PROFIL_CLIP in self.image_courante.rendus:
+                        self.clips.ajouter(self.image_courante.horodatage, self.image_courante.rendus[PROFIL_CLIP])
+                    self._analyser_mouvement(frame)
+                    self._verifier_image(frame)
+                    self.error_count = 0
+                    CAMERA_FRAMES_TOTAL.labels(camera=str(self.camera_id)).inc()
+                    CAMERA_LAST_FRAME.labels(camera=str(self.camera_id)).set(time.time())
                 
-                time.sleep(frame_interval)
+                    self._pause_capture(frame_interval)
                 
-            except Exception as e:
-                logger.error(f"Erreur de capture pour la caméra {self.camera_id}: {e}")
-                self.error_count += 1
-                time.sleep(1.0)
+                except Exception as e:
+                    logger.error(f"Erreur de capture pour la caméra {self.camera_id}: {e}")
+                    self.error_count += 1
+                    pause_systeme(1.0)
     
-    def get_current_frame(self):
-        """Récupère l'image actuelle"""
-        return self.last_frame
+        finally:
+            # Le clip en cours est terminé ici, par le seul thread qui l'alimente
+            if self.clips is not None:
+                self.clips.terminer()
     
-    def get_frame_as_jpeg(self, quality=85):
-        """Convertit l'image actuelle en JPEG"""
-        if self.last_frame is None:
-            return None
+    def _publier_image(self, frame, profils=()):
+        """Rend les profils regardés (et `profils`) puis publie l'image et réveille les spectateurs (privé)
+
+        Le rendu se fait ici, dans le thread de capture (hors de la boucle gevent), une fois par image.
+        """
+        image = ImageCapturee(self.sequence + 1, frame)
+        for profil, spectateurs in self.profils_regardes.items():
+            if spectateurs or profil in profils:
+                jpeg_data = self._rendre(frame, profil)
+                if jpeg_data:
+                    image.rendus[profil] = jpeg_data
+        
+        self.image_courante = image
+        self.last_frame = frame
+        self.last_frame_time = datetime.now()
+        self.sequence = image.sequence
+        self.signal_image.notifier()
+    
+    def _analyser_mouvement(self, frame):
+        """Met à jour le score d'activité, au plus CAMERA_MOTION_FPS fois par seconde (privé)"""
+        maintenant = time.monotonic()
+        if self.mouvement is None or maintenant < self._prochaine_analyse:
+            return
+        self._prochaine_analyse = maintenant + 1.0 / CAMERA_MOTION_FPS
+        
+        changement, evenement = self.mouvement.analyser(frame, self.last_frame_time)
+        CAMERA_MOTION_SCORE.labels(camera=str(self.camera_id)).set(self.mouvement.score)
+        if changement == 'debut':
+            CAMERA_MOTION_EVENTS_TOTAL.labels(camera=str(self.camera_id)).inc()
+            logger.info(f"Mouvement détecté sur la caméra {self.camera_id}")
+            if self.clips is not None:
+                self.clips.declencher('mouvement')
+        elif changement == 'fin':
+            duree = (evenement['fin'] - evenement['debut']).total_seconds()
+            logger.info(f"Fin du mouvement sur la caméra {self.camera_id} ({duree:.0f}s)")
+    
+    def _verifier_image(self, frame):
+        """Détecte une image figée, noire ou uniforme, au plus une fois par CAMERA_IMAGE_CHECK_INTERVAL (privé)"""
+        maintenant = time.monotonic()
+        if maintenant < self._prochaine_verification:
+            return
+        self._prochaine_verification = maintenant + CAMERA_IMAGE_CHECK_INTERVAL
+        
+        changement = self.sante_image.analyser(frame, maintenant)
+        if changement is None:
+            return
         
+        ancien, nouveau = changement
+        self.transitions_image.append((ancien, nouveau, datetime.now(timezone.utc).replace(tzinfo=None)))
+        if nouveau == 'ok':
+            logger.info(f"Image de la caméra {self.camera_id} rétablie (était {ancien})")
+        else:
+            CAMERA_IMAGE_PROBLEMS_TOTAL.labels(camera=str(self.camera_id), state=nouveau).inc()
+            logger.warning(f"Image de la caméra {self.camera_id}: {nouveau}")
+            if self.clips is not None:
+                self.clips.declencher(ALERTES_IMAGE[nouveau][0])
+    
+    @property
+    def image_state(self):
+        """'ok', 'frozen', 'black' ou 'uniform'"""
+        return self.sante_image.etat
+    
+    @property
+    def activity(self):
+        """Score d'activité (fraction lissée de l'image en mouvement), None sans analyse"""
+        return round(self.mouvement.score, 3) if self.mouvement else None
+    
+    def _rendre(self, frame, profil):
+        """Réduit l'image à la largeur du profil (INTER_AREA) et l'encode en JPEG (privé)"""
+        largeur_max, qualite = PROFILS_FLUX[profil]
+        hauteur, largeur = frame.shape[:2]
+        if largeur_max and largeur > largeur_max:
+            taille = (largeur_max, max(1, round(hauteur * largeur_max / largeur)))
+            frame = cv2.resize(frame, taille, interpolation=cv2.INTER_AREA)
+        return self._encoder(frame, qualite)
+    
+    def _encoder(self, frame, quality):
+        """Encode une image en JPEG (privé)"""
         try:
-            # Encoder en JPEG
             encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-            result, encoded_img = cv2.imencode('.jpg', self.last_frame, encode_param)
+            debut = time.perf_counter()
+            result, encoded_img = cv2.imencode('.jpg', frame, encode_param)
+            CAMERA_ENCODE_SECONDS.labels(camera=str(self.camera_id)).observe(time.perf_counter() - debut)
             
             if result:
                 return encoded_img.tobytes()
@@ -131,6 +601,69 @@ class CameraStream:
         
         return None
     
+    def get_current_frame(self):
+        """Récupère l'image actuelle"""
+        return self.last_frame
+    
+    def get_frame_as_jpeg(self, quality=85):
+        """Convertit l'image actuelle en JPEG"""
+        if self.last_frame is None:
+            return None
+        return self._encoder(self.last_frame, quality)
+    
+    def get_jpeg(self, profil='medium', image=None):
+        """JPEG de l'image courante dans un profil, rendu une seule fois par image et par profil"""
+        image = image or self.image_courante
+        if image is None:
+            return None
+        
+        jpeg_data = image.rendus.get(profil)
+        if jpeg_data is None:
+            # Profil non rendu par la capture (instantané, premier spectateur de ce profil)
+            with self.cache_lock:
+                jpeg_data = image.rendus.get(profil)
+                if jpeg_data is None:
+                    jpeg_data = self._rendre(image.image, profil)
+                    if jpeg_data:
+                        image.rendus[profil] = jpeg_data
+        return jpeg_data
+    
+    def get_jpeg_attente(self, profil='medium'):
+        """Image d'attente aux dimensions du profil (connexion en cours ou caméra injoignable)"""
+        largeur, hauteur = self.resolution
+        largeur_profil = PROFILS_FLUX.get(profil, PROFILS_FLUX['medium'])[0]
+        if largeur_profil and largeur_profil < largeur:
+            largeur, hauteur = largeur_profil, max(1, round(hauteur * largeur_profil / largeur))
+        texte = 'Connexion en cours...' if self.is_active else 'Camera injoignable, nouvelle tentative...'
+        return image_attente(largeur, hauteur, texte)
+    
+    def empreinte(self, image):
+        """(empreinte, date de modification) du contenu de l'image
+
+        L'image réduite (16 px de large) est comparée au contenu de référence: tant que l'écart reste
+        sous CAMERA_SNAPSHOT_TOLERANCE (bruit du capteur, compression), l'empreinte et la date de
+        modification ne changent pas, même si la caméra produit de nouvelles images.
+        """
+        if image.empreinte is None:
+            with self.cache_lock:
+                if image.empreinte is None:
+                    reduite = reduire_gris(image.image, 16)
+                    reference = self._reference
+                    if reference is None or reference[0].shape != reduite.shape or \
+                            np.abs(reduite - reference[0]).max() > CAMERA_SNAPSHOT_TOLERANCE:
+                        empreinte = hashlib.blake2b(reduite.tobytes(), digest_size=8).hexdigest()
+                        self._reference = reference = (reduite, empreinte, image.horodatage)
+                    image.empreinte = reference[1:]
+        return image.empreinte
+    
+    def attendre_image(self, sequence, timeout=None):
+        """Attend une image plus récente que `sequence`, retourne False à l'expiration du délai"""
+        evenement = self.signal_image.courant()
+        if self.sequence != sequence:
+            return True
+        evenement.wait(timeout)
+        return self.sequence != sequence
+    
     def get_frame_as_base64(self, quality=85):
         """Convertit l'image actuelle en base64 pour affichage web"""
         jpeg_data = self.get_frame_as_jpeg(quality)
@@ -147,44 +680,128 @@ class CameraStream:
         time_diff = (datetime.now() - self.last_frame_time).total_seconds()
         return time_diff < 30.0
 
+class Mosaique:
+    """Mosaïque de plusieurs caméras composée côté serveur
+
+    Le canevas est alloué une fois: chaque tuile est une vue sur une tranche du canevas, dans
+    laquelle cv2.resize écrit directement, et seules les tuiles dont l'image a changé sont
+    recomposées. La mosaïque est encodée une fois par image pour tous ses spectateurs.
+    """
+    
+    GRIS_VIDE = 32
+    
+    def __init__(self, manager, camera_ids, colonnes, taille_tuile, qualite=75):
+        self.manager = manager
+        self.camera_ids = list(camera_ids)
+        self.cle = (tuple(self.camera_ids), colonnes, taille_tuile)
+        self.taille_tuile = taille_tuile
+        self.qualite = qualite
+        self.spectateurs = 0
+        
+        largeur, hauteur = taille_tuile
+        lignes = math.ceil(len(self.camera_ids) / colonnes)
+        self.canevas = np.full((lignes * hauteur, colonnes * largeur, 3), self.GRIS_VIDE, dtype=np.uint8)
+        self.tuiles = []
+        for index in range(len(self.camera_ids)):
+            y, x = (index // colonnes) * hauteur, (index % colonnes) * largeur
+            self.tuiles.append(self.canevas[y:y + hauteur, x:x + largeur])
+        
+        self.images = [None] * len(self.camera_ids)  # image composée dans chaque tuile
+        self.lock = threading.Lock()
+        self._jpeg = None
+    
+    def get_jpeg(self):
+        """JPEG de la mosaïque avec la dernière image de chaque caméra"""
+        with self.lock:
+            changements = []
+            for index, camera_id in enumerate(self.camera_ids):
+                stream = self.manager.streams.get(camera_id)
+                image = stream.image_courante if stream else None
+                if image is not self.images[index]:
+                    changements.append((index, image))
+            
+            if changements or self._jpeg is None:
+                # Composition et encodage hors de la boucle gevent
+                self._jpeg = executer_bloquant(self._composer, changements)
+            return self._jpeg
+    
+    def _composer(self, changements):
+        """Recompose les tuiles modifiées puis encode le canevas (privé)"""
+        for index, image in changements:
+            tuile = self.tuiles[index]
+            if image is None:
+                tuile[:] = self.GRIS_VIDE
+            else:
+                cv2.resize(image.image, self.taille_tuile, dst=tuile, interpolation=cv2.INTER_AREA)
+            self.images[index] = image
+        
+        result, encoded_img = cv2.imencode('.jpg', self.canevas, [int(cv2.IMWRITE_JPEG_QUALITY), self.qualite])
+        return encoded_img.tobytes() if result else None
+
 class CameraStreamManager:
     """Gestionnaire global des flux de caméras"""
     
+    # Sans nouvelle image pendant ce délai, la dernière image est renvoyée au spectateur:
+    # l'écriture échoue s'il s'est déconnecté, ce qui libère aussitôt son greenlet ou thread
+    INTERVALLE_RENVOI = 2.0
+    
     def __init__(self):
         self.streams = {}
+        self.mosaiques = {}
         self.lock = threading.Lock()
+        self.supervisor = StreamSupervisor(self)
     
-    def start_camera_stream(self, equipement):
-        """Démarre le flux pour un équipement"""
+    def start_camera_stream(self, equipement, veille=None):
+        """Démarre le flux d'un équipement, sans attendre la connexion RTSP
+
+        Un flux de même configuration est réutilisé avec sa connexion (rouverte s'il s'est arrêté faute
+        de spectateur; un flux en échec reste confié au superviseur); une configuration modifiée
+        remplace le flux. `veille` (None: inchangé) maintient le flux sans spectateur.
+        """
+        camera_id = equipement.id
+        if not equipement.has_stream_capability:
+            logger.warning(f"Équipement {camera_id} ne supporte pas le streaming")
+            return False
+        
+        resolution = equipement.get_stream_resolution()
+        config = (equipement.rtsp_stream_url, tuple(resolution), equipement.fps or 15)
+        reutilise = ancien = None
         with self.lock:
-            camera_id = equipement.id
-            
-            # Arrêter le flux existant si présent
-            if camera_id in self.streams:
-                self.streams[camera_id].stop_stream()
-                del self.streams[camera_id]
-            
-            # Vérifier si l'équipement supporte le streaming
-            if not equipement.has_stream_capability:
-                logger.warning(f"Équipement {camera_id} ne supporte pas le streaming")
-                return False
-            
-            # Créer et démarrer le nouveau flux
-            resolution = equipement.get_stream_resolution()
-            stream = CameraStream(
-                camera_id=camera_id,
-                rtsp_url=equipement.rtsp_stream_url,
-                resolution=resolution,
-                fps=equipement.fps or 15
-            )
-            
-            if stream.start_stream():
-                self.streams[camera_id] = stream
-                logger.info(f"Flux démarré pour l'équipement {camera_id}")
-                return True
+            stream = self.streams.get(camera_id)
+            if stream is not None and not stream.closed and stream.config == config:
+                # Connexion réutilisée
+                if veille is not None:
+                    stream.veille = veille
+                reutilise = stream
             else:
-                logger.error(f"Impossible de démarrer le flux pour l'équipement {camera_id}")
-                return False
+                # Configuration modifiée (ou flux arrêté): remplacer le flux
+                ancien = self.streams.pop(camera_id, None)
+                stream = CameraStream(
+                    camera_id=camera_id,
+                    rtsp_url=equipement.rtsp_stream_url,
+                    resolution=resolution,
+                    fps=equipement.fps or 15
+                )
+                stream.veille = bool(veille)
+                self.streams[camera_id] = stream
+        
+        if reutilise is not None:
+            # Réouverture hors du verrou du gestionnaire (elle peut attendre l'arrêt de l'ancien thread);
+            # reconnect() revérifie l'état sous le verrou du flux
+            if reutilise.stop_reason == 'idle' and not reutilise.is_active:
+                return reutilise.reconnect()
+            return True
+        
+        if ancien is not None:
+            ancien.stop_stream()
+        self.supervisor.ensure_started()
+        if CAMERA_CLIPS:
+            ecrivain_clips.ensure_started()
+        return stream.start_stream()
+    
+    def ensure_camera_stream(self, equipement):
+        """Démarre le flux s'il n'est pas déjà actif (spectateurs arrivant simultanément)"""
+        return self.start_camera_stream(equipement)
     
     def stop_camera_stream(self, camera_id):
         """Arrête le flux pour une caméra"""
@@ -200,38 +817,96 @@ class CameraStreamManager:
         """Récupère un flux existant"""
         return self.streams.get(camera_id)
     
-    def get_frame_stream(self, camera_id):
-        """Générateur pour flux MJPEG"""
+    def get_frame_stream(self, camera_id, profil='medium'):
+        """Générateur pour flux MJPEG: chaque nouvelle image est attendue (sans scrutation)
+
+        La cadence suit le débit du spectateur (CadenceSpectateur): un lien lent reçoit moins
+        d'images, toujours la plus récente, un lien rapide toutes les images du flux.
+        """
         stream = self.streams.get(camera_id)
         if not stream:
             return
         
-        while stream.is_alive():
-            jpeg_data = stream.get_frame_as_jpeg(quality=75)
-            if jpeg_data:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + jpeg_data + b'\r\n')
-            time.sleep(1.0 / (stream.fps or 15))
+        stream.add_viewer(profil)
+        CAMERA_VIEWERS.labels(camera=str(camera_id)).inc()
+        cadence = CadenceSpectateur(self.INTERVALLE_RENVOI)
+        stream.cadences.add(cadence)
+        try:
+            sequence = None
+            prochain_envoi = 0.0
+            while not stream.closed:
+                attente = prochain_envoi - time.monotonic()
+                if attente > 0:
+                    time.sleep(attente)
+                stream.attendre_image(sequence, self.INTERVALLE_RENVOI)
+                if sequence is not None and stream.sequence > sequence + 1:
+                    CAMERA_FRAMES_SKIPPED_TOTAL.labels(camera=str(camera_id)).inc(stream.sequence - sequence - 1)
+                sequence = stream.sequence
+                # Image d'attente jusqu'à la première image réelle
+                jpeg_data = stream.get_jpeg(profil) or stream.get_jpeg_attente(profil)
+                if jpeg_data:
+                    debut = time.monotonic()
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg_data + b'\r\n')
+                    prochain_envoi = cadence.envoye(len(jpeg_data), debut, time.monotonic())
+        finally:
+            # Déconnexion du spectateur (GeneratorExit) ou fin du flux
+            stream.cadences.discard(cadence)
+            stream.remove_viewer(profil)
+            CAMERA_VIEWERS.labels(camera=str(camera_id)).dec()
+            logger.debug(f"Spectateur du flux de la caméra {camera_id} déconnecté")
     
-    def get_snapshot(self, camera_id):
-        """Capture une image instantanée"""
+    def get_mosaic_stream(self, camera_ids, colonnes, taille_tuile, fps=CAMERA_MOSAIC_FPS):
+        """Générateur pour flux MJPEG d'une mosaïque (partagée par les spectateurs de la même grille)"""
+        with self.lock:
+            cle = (tuple(camera_ids), colonnes, taille_tuile)
+            mosaique = self.mosaiques.get(cle)
+            if mosaique is None:
+                mosaique = self.mosaiques[cle] = Mosaique(self, camera_ids, colonnes, taille_tuile)
+            mosaique.spectateurs += 1
+            streams = [self.streams[camera_id] for camera_id in camera_ids if camera_id in self.streams]
+        
+        # La mosaïque compte comme un spectateur de chaque caméra (cadence normale)
+        for stream in streams:
+            stream.add_viewer()
+        intervalle = 1.0 / fps
+        try:
+            while True:
+                debut = time.monotonic()
+                jpeg_data = mosaique.get_jpeg()
+                if jpeg_data:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + jpeg_data + b'\r\n')
+                time.sleep(max(intervalle - (time.monotonic() - debut), 0))
+        finally:
+            for stream in streams:
+                stream.remove_viewer()
+            with self.lock:
+                mosaique.spectateurs -= 1
+                if not mosaique.spectateurs and self.mosaiques.get(cle) is mosaique:
+                    del self.mosaiques[cle]
+    
+    def get_snapshot(self, camera_id, profil='full', attente_premiere_image=5.0):
+        """Instantané de la dernière image (attend la première image d'un flux qui démarre)"""
         stream = self.streams.get(camera_id)
-        if stream and stream.is_alive():
-            return stream.get_frame_as_jpeg(quality=90)
+        if stream and stream.is_active and stream.sequence == 0:
+            stream.attendre_image(0, attente_premiere_image)
+        if stream and stream.is_alive() and stream.image_courante is not None:
+            stream.touch()
+            return Instantane(stream, stream.image_courante, profil)
         return None
     
-    def cleanup_dead_streams(self):
-        """Nettoie les flux morts"""
+    def evict_stream(self, camera_id, stream, reason):
+        """Retire un flux du gestionnaire puis l'arrête (sans garder le verrou pendant l'arrêt)"""
         with self.lock:
-            dead_streams = []
-            for camera_id, stream in self.streams.items():
-                if not stream.is_alive():
-                    dead_streams.append(camera_id)
-            
-            for camera_id in dead_streams:
-                logger.info(f"Nettoyage du flux mort pour la caméra {camera_id}")
-                self.streams[camera_id].stop_stream()
-                del self.streams[camera_id]
+            if self.streams.get(camera_id) is not stream:
+                return False
+            del self.streams[camera_id]
+        
+        logger.info(f"Flux de la caméra {camera_id} retiré ({reason})")
+        stream.stop_stream()
+        CAMERA_EVICTIONS_TOTAL.labels(reason=reason).inc()
+        return True
     
     def get_streams_status(self):
         """Retourne le statut de tous les flux"""
@@ -243,10 +918,43 @@ class CameraStreamManager:
                     'alive': stream.is_alive(),
                     'last_frame': stream.last_frame_time.isoformat() if stream.last_frame_time else None,
                     'error_count': stream.error_count,
-                    'rtsp_url': stream.rtsp_url
+                    'rtsp_url': stream.rtsp_url,
+                    'mode': stream.mode,
+                    'standby': stream.veille,
+                    'viewers': stream.viewers,
+                    'profiles': {profil: n for profil, n in stream.profils_regardes.items() if n},
+                    'viewer_fps': sorted(round(c.fps, 1) for c in list(stream.cadences) if c.fps is not None),
+                    'idle_seconds': round(stream.idle_seconds(), 1),
+                    'reconnect_attempts': stream.reconnect_attempts,
+                    'image_state': stream.image_state,
+                    'activity': stream.activity,
+                    'recording': bool(stream.clips and stream.clips.en_cours),
+                    'motion': bool(stream.mouvement and stream.mouvement.en_mouvement)
                 }
         return status
     
+    def request_clip(self, camera_id):
+        """Demande un clip (pré-enregistrement + post-enregistrement) du flux d'une caméra"""
+        stream = self.streams.get(camera_id)
+        if stream is None or stream.clips is None or not stream.is_active:
+            return False
+        stream.clips.demander('manuel')
+        return True
+    
+    def get_activity(self, camera_ids=None):
+        """Caméras classées par activité décroissante, avec leurs derniers événements de mouvement"""
+        with self.lock:
+            streams = [stream for camera_id, stream in self.streams.items()
+                       if stream.mouvement and (camera_ids is None or camera_id in camera_ids)]
+        
+        activite = [{
+            'camera_id': stream.camera_id,
+            'activity': stream.activity,
+            'motion': stream.mouvement.en_mouvement,
+            'events': stream.mouvement.derniers_evenements(),
+        } for stream in streams]
+        return sorted(activite, key=lambda camera: camera['activity'], reverse=True)
+    
     def shutdown_all(self):
         """Arrête tous les flux"""
         with self.lock:
@@ -255,15 +963,191 @@ class CameraStreamManager:
             self.streams.clear()
             logger.info("Tous les flux de caméras arrêtés")
 
+class StreamSupervisor:
+    """Surveille les flux en arrière-plan, hors du chemin des requêtes
+
+    Un flux bloqué ou arrêté sur erreur est reconnecté tant qu'il a des spectateurs (ou qu'il est en
+    veille active), avec un recul exponentiel entre les tentatives; sans spectateur, il est retiré
+    (redémarré à la demande). Les caméras en veille active (stream_standby) sont maintenues connectées.
+    """
+    
+    RECUL_INITIAL = 2.0
+    
+    def __init__(self, manager, intervalle=CAMERA_SUPERVISOR_INTERVAL, delai_blocage=CAMERA_STALL_SECONDS,
+                 recul_max=CAMERA_RECONNECT_MAX_SECONDS):
+        self.manager = manager
+        self.intervalle = intervalle
+        self.delai_blocage = delai_blocage
+        self.recul_max = recul_max
+        self.lock = threading.Lock()
+        self.arret = threading.Event()
+        self.thread = None
+        self.pid = None
+        self.prochaine_veille = 0.0
+    
+    def ensure_started(self):
+        """Démarre le thread de supervision (une fois par processus, compatible fork de gunicorn)"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+            
+            self.arret = threading.Event()
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="superviseur-flux", daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        self.arret.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=10.0)
+    
+    def _run(self):
+        """Boucle de supervision (privé)"""
+        while not self.arret.wait(self.intervalle):
+            try:
+                self.check_streams()
+            except Exception as e:
+                logger.error(f"Erreur du superviseur de flux: {e}")
+    
+    def check_streams(self):
+        """Vérifie tous les flux une fois"""
+        debut = time.perf_counter()
+        if time.monotonic() >= self.prochaine_veille:
+            self.prochaine_veille = time.monotonic() + CAMERA_STANDBY_REFRESH_SECONDS
+            self._maintenir_veille()
+        
+        with self.manager.lock:
+            streams = list(self.manager.streams.items())
+        
+        alertes = []
+        for camera_id, stream in streams:
+            while stream.transitions_image:
+                alertes.append((camera_id,) + stream.transitions_image.popleft())
+            self._check_stream(camera_id, stream)
+        
+        if alertes:
+            self._enregistrer_alertes(alertes)
+        
+        CAMERA_SUPERVISOR_SECONDS.observe(time.perf_counter() - debut)
+        CAMERA_SUPERVISOR_LAST_RUN.set(time.time())
+    
+    def _check_stream(self, camera_id, stream):
+        if stream.closed:
+            self.manager.evict_stream(camera_id, stream, 'closed')
+            return
+        
+        if stream.is_active and not stream.is_stalled(self.delai_blocage) and stream.image_state != 'frozen':
+            stream.reconnect_attempts = 0
+            return
+        
+        # Capture arrêtée (inactivité, erreurs), bloquée ou image figée
+        if not stream.viewers and not stream.veille:
+            self.manager.evict_stream(camera_id, stream, 'idle' if stream.stop_reason == 'idle' else 'dead')
+            return
+        
+        maintenant = time.monotonic()
+        if maintenant < stream.next_reconnect:
+            return
+        
+        stream.reconnect_attempts += 1
+        stream.next_reconnect = maintenant + min(self.RECUL_INITIAL * 2 ** (stream.reconnect_attempts - 1),
+                                                 self.recul_max)
+        logger.warning(f"Reconnexion du flux de la caméra {camera_id} (tentative {stream.reconnect_attempts})")
+        # Connexion ouverte par le thread de capture, qui enregistre son résultat
+        stream.reconnect(force=True)
+    
+    def _maintenir_veille(self):
+        """Connecte les caméras en veille active et retire la veille des autres (privé)"""
+        from app import app
+        from models import Equipement
+        
+        try:
+            with app.app_context():
+                equipements = Equipement.query.filter_by(stream_standby=True, stream_enabled=True, actif=True).all()
+                for equipement in equipements:
+                    self.manager.start_camera_stream(equipement, veille=True)
+        except Exception as e:
+            logger.error(f"Erreur lors de la mise en veille active des caméras: {e}")
+            return
+        
+        en_veille = {equipement.id for equipement in equipements}
+        with self.manager.lock:
+            streams = list(self.manager.streams.items())
+        for camera_id, stream in streams:
+            if stream.veille and camera_id not in en_veille:
+                stream.veille = False
+
+    def _enregistrer_alertes(self, alertes):
+        """Crée les alertes d'image (figée, noire, uniforme, rétablie) via la file d'écriture (privé)"""
+        from app import app
+        from write_queue import write_queue
+        
+        try:
+            with app.app_context():
+                write_queue.execute(_creer_alertes_image, alertes)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'enregistrement des alertes d'image: {e}")
+
+# Types d'alerte et messages par état de l'image
+ALERTES_IMAGE = {
+    'frozen': ('image_figee', "l'image est figée"),
+    'black': ('image_noire', "l'image est noire"),
+    'uniform': ('image_uniforme', "l'image est uniforme (pas de signal ?)"),
+    'ok': ('image_retablie', "l'image est rétablie"),
+}
+
+def _creer_alertes_image(alertes):
+    """Enregistre les changements d'état des images (camera_id, ancien, nouveau, date)"""
+    from app import db
+    from models import Alerte, Equipement
+    
+    noms = dict(db.session.query(Equipement.id, Equipement.nom).filter(
+        Equipement.id.in_({camera_id for camera_id, _, _, _ in alertes})
+    ).all())
+    for camera_id, ancien, nouveau, date in alertes:
+        if camera_id not in noms:
+            continue
+        type_alerte, description = ALERTES_IMAGE[nouveau]
+        alerte = Alerte()
+        alerte.equipement_id = camera_id
+        alerte.type_alerte = type_alerte
+        alerte.message = f"Caméra {noms[camera_id]} : {description}"
+        alerte.timestamp = date
+        db.session.add(alerte)
+    
+    db.session.commit()
+    for _, _, nouveau, _ in alertes:
+        ALERTS_TOTAL.labels(type_alerte=ALERTES_IMAGE[nouveau][0]).inc()
+
 # Instance globale du gestionnaire
 camera_manager = CameraStreamManager()
 
 # Arrêter tous les flux au démarrage pour éviter les conflits
 camera_manager.shutdown_all()
 
-def generate_stream_response(camera_id):
+def generate_mosaic_response(camera_ids, colonnes, taille_tuile, fps=CAMERA_MOSAIC_FPS):
+    """Génère une réponse HTTP pour le flux MJPEG d'une mosaïque"""
+    return Response(
+        camera_manager.get_mosaic_stream(camera_ids, colonnes, taille_tuile, fps),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def limiter_tampon_envoi(environ, taille=CAMERA_SEND_BUFFER_BYTES):
+    """Borne le tampon d'envoi du socket du client (gunicorn ou serveur de développement)"""
+    connexion = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if not taille or connexion is None:
+        return
+    try:
+        connexion.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, taille)
+    except OSError as e:
+        logger.debug(f"Tampon d'envoi non modifié: {e}")
+
+def generate_stream_response(camera_id, profil='medium'):
     """Génère une réponse HTTP pour le flux MJPEG"""
+    limiter_tampon_envoi(request.environ)
     return Response(
-        camera_manager.get_frame_stream(camera_id),
-        mimetype='multipart/x-mixed-replace; boundary=frame'
+        camera_manager.get_frame_stream(camera_id, profil),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
\ No newline at end of file
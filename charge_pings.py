@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Générateur de charge pour l'endpoint de ping
+Simule des milliers d'équipements (asyncio + aiohttp) avec intervalle, gigue, pannes
+et mode rafale, puis rapporte le débit atteint et les percentiles de latence (p50/p95/p99)
+
+Exemple:
+    python charge_pings.py --serveur http://localhost:5000 --equipements 5000 --intervalle 60 --duree 300
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from simulateur_camera import construire_donnees_ping
+
+# Durée serveur de la requête, lue dans l'en-tête Server-Timing (app;dur=...)
+SERVER_TIMING_APP = re.compile(r'app;dur=([0-9.]+)')
+
+MOTIFS_PANNE = ('aucun', 'aleatoire', 'groupe')
+
+def adresse_ip_simulee(index):
+    """Adresse IP unique d'un équipement simulé (10.x.y.z)"""
+    return f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}"
+
+def percentile(valeurs_triees, p):
+    """Percentile (méthode du rang le plus proche) d'une liste déjà triée"""
+    if not valeurs_triees:
+        return None
+    rang = max(math.ceil(p / 100 * len(valeurs_triees)) - 1, 0)
+    return valeurs_triees[rang]
+
+class PlanDePannes:
+    """Décide quels équipements sont en panne à un instant donné
+
+    - aleatoire: chaque équipement tombe en panne indépendamment des autres
+    - groupe: un bloc d'équipements consécutifs (un site) tombe en panne ensemble
+    Le taux est la fraction moyenne d'équipements en panne.
+    """
+
+    def __init__(self, motif, taux, duree_panne, intervalle, nb_equipements, graine):
+        self.motif = motif if taux > 0 else 'aucun'
+        self.taux = taux
+        self.duree_panne = duree_panne
+        self.intervalle = intervalle
+        self.nb_equipements = nb_equipements
+        self.graine = graine
+        self.rng = random.Random(graine)
+        self.fin_panne = {}
+
+    def en_panne(self, index, maintenant):
+        if self.motif == 'aleatoire':
+            fin = self.fin_panne.get(index)
+            if fin is not None and maintenant < fin:
+                return True
+
+            # Probabilité d'entrer en panne à chaque ping pour obtenir le taux moyen visé
+            probabilite = min(self.taux * self.intervalle / self.duree_panne, 1.0)
+            if self.rng.random() < probabilite:
+                self.fin_panne[index] = maintenant + self.duree_panne
+                return True
+            return False
+
+        if self.motif == 'groupe':
+            # Un nouveau bloc tombe en panne à chaque période de duree_panne secondes
+            periode = int(maintenant // self.duree_panne)
+            taille = max(int(self.nb_equipements * self.taux), 1)
+            debut = random.Random(self.graine * 1_000_003 + periode).randrange(self.nb_equipements)
+            return (index - debut) % self.nb_equipements < taille
+
+        return False
+
+class Statistiques:
+    """Résultats cumulés de la charge"""
+
+    def __init__(self):
+        self.envoyes = 0
+        self.ignores_panne = 0
+        self.statuts = Counter()
+        self.erreurs = Counter()
+        self.latences_ms = []
+        self.latences_serveur_ms = []
+
+    def rapport(self, duree):
+        latences = sorted(self.latences_ms)
+        latences_serveur = sorted(self.latences_serveur_ms)
+        reussis = self.statuts.get(200, 0)
+        return {
+            'duree_s': round(duree, 1),
+            'envoyes': self.envoyes,
+            'reponses': sum(self.statuts.values()),
+            'reussis': reussis,
+            'ignores_panne': self.ignores_panne,
+            'debit_rps': round(sum(self.statuts.values()) / duree, 1) if duree else 0.0,
+            'debit_reussi_rps': round(reussis / duree, 1) if duree else 0.0,
+            'statuts': {str(statut): nombre for statut, nombre in sorted(self.statuts.items())},
+            'erreurs': dict(self.erreurs),
+            'latence_ms': {f'p{p}': _arrondi(percentile(latences, p)) for p in (50, 95, 99)},
+            'latence_serveur_ms': {f'p{p}': _arrondi(percentile(latences_serveur, p)) for p in (50, 95, 99)},
+        }
+
+def _arrondi(valeur):
+    return round(valeur, 2) if valeur is not None else None
+
+async def envoyer_ping(session, url, index, config, stats):
+    """Envoie un ping et enregistre sa latence"""
+    donnees = construire_donnees_ping(adresse_ip_simulee(index), None, f"Charge {index}")
+    if config.par_ip:
+        del donnees['equipement_id']
+    else:
+        donnees['equipement_id'] = config.premier_id + index
+
+    stats.envoyes += 1
+    debut = time.perf_counter()
+    try:
+        async with session.post(url, json=donnees) as response:
+            await response.read()
+            stats.latences_ms.append((time.perf_counter() - debut) * 1000)
+            stats.statuts[response.status] += 1
+
+            for valeur in response.headers.getall('Server-Timing', []):
+                correspondance = SERVER_TIMING_APP.search(valeur)
+                if correspondance:
+                    stats.latences_serveur_ms.append(float(correspondance.group(1)))
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        stats.erreurs[type(e).__name__] += 1
+
+class EnvoiUdp(asyncio.DatagramProtocol):
+    """Envoi des heartbeats UDP (sans réponse: seul le débit d'envoi est mesuré)"""
+
+    def __init__(self, config):
+        self.config = config
+        self.cle_maitre = config.cle_udp.encode() if config.cle_udp else None
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def envoyer(self, index, stats):
+        from ecoute_udp import encoder_heartbeat
+
+        donnees = construire_donnees_ping(None, self.config.premier_id + index, f"Charge {index}")
+        self.transport.sendto(encoder_heartbeat(donnees['equipement_id'], donnees['response_time'],
+                                                self.cle_maitre, self.config.binaire))
+        stats.envoyes += 1
+        stats.statuts['udp'] += 1
+
+async def simuler_equipement(index, session, url, config, pannes, stats, debut, fin):
+    """Boucle de ping d'un équipement simulé"""
+    if config.rafale:
+        # Mode rafale: tous les équipements pinguent au même instant, à chaque intervalle
+        prochain = debut
+    else:
+        # Répartit les premiers pings sur un intervalle
+        prochain = debut + random.uniform(0, config.intervalle)
+
+    while prochain < fin:
+        attente = prochain - time.monotonic()
+        if attente > 0:
+            await asyncio.sleep(attente)
+        maintenant = time.monotonic()
+
+        if pannes.en_panne(index, maintenant - debut):
+            stats.ignores_panne += 1
+        elif isinstance(session, EnvoiUdp):
+            session.envoyer(index, stats)
+        else:
+            await envoyer_ping(session, url, index, config, stats)
+
+        if config.rafale:
+            prochain += config.intervalle
+        else:
+            prochain += config.intervalle * (1 + random.uniform(-config.gigue, config.gigue))
+
+async def afficher_progression(stats, debut, periode):
+    """Affiche le débit sur la dernière période"""
+    precedent = 0
+    while True:
+        await asyncio.sleep(periode)
+        reponses = sum(stats.statuts.values()) + sum(stats.erreurs.values())
+        print(f"[{time.monotonic() - debut:6.0f}s] {(reponses - precedent) / periode:8.1f} req/s, "
+              f"{reponses} réponses, {sum(stats.erreurs.values())} erreurs", file=sys.stderr)
+        precedent = reponses
+
+async def lancer_charge(config):
+    """Lance la simulation et retourne le rapport"""
+    url = f"{config.serveur.rstrip('/')}/api/ping"
+    stats = Statistiques()
+    pannes = PlanDePannes(config.motif_panne, config.pannes, config.duree_panne,
+                          config.intervalle, config.equipements, config.graine)
+
+    async def simuler(session):
+        debut = time.monotonic()
+        fin = debut + config.duree
+        progression = asyncio.create_task(afficher_progression(stats, debut, config.progression))
+        try:
+            await asyncio.gather(*(
+                simuler_equipement(index, session, url, config, pannes, stats, debut, fin)
+                for index in range(config.equipements)
+            ))
+        finally:
+            progression.cancel()
+        return time.monotonic() - debut
+
+    if config.transport == 'udp':
+        hote = config.serveur.split('://')[-1].split('/')[0].rsplit(':', 1)[0]
+        transport, envoi = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: EnvoiUdp(config), remote_addr=(hote, config.port_udp)
+        )
+        try:
+            duree = await simuler(envoi)
+        finally:
+            transport.close()
+        return stats.rapport(duree)
+
+    connecteur = aiohttp.TCPConnector(limit=config.connexions)
+    timeout = aiohttp.ClientTimeout(total=config.timeout)
+    async with aiohttp.ClientSession(connector=connecteur, timeout=timeout) as session:
+        duree = await simuler(session)
+
+    return stats.rapport(duree)
+
+def afficher_rapport(rapport):
+    print("\n📊 Résultats de la charge")
+    print("=" * 50)
+    print(f"Durée:               {rapport['duree_s']} s")
+    print(f"Pings envoyés:       {rapport['envoyes']} ({rapport['ignores_panne']} ignorés pour panne simulée)")
+    print(f"Débit:               {rapport['debit_rps']} req/s ({rapport['debit_reussi_rps']} req/s réussies)")
+    print(f"Statuts HTTP:        {rapport['statuts']}")
+    if rapport['erreurs']:
+        print(f"Erreurs client:      {rapport['erreurs']}")
+    latence = rapport['latence_ms']
+    if latence['p50'] is not None:
+        print(f"Latence (client):    p50={latence['p50']} ms  p95={latence['p95']} ms  p99={latence['p99']} ms")
+    latence = rapport['latence_serveur_ms']
+    if latence['p50'] is not None:
+        print(f"Latence (serveur):   p50={latence['p50']} ms  p95={latence['p95']} ms  p99={latence['p99']} ms")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Générateur de charge pour /api/ping")
+    parser.add_argument('--serveur', default='http://localhost:5000', help="URL du serveur de monitoring")
+    parser.add_argument('--equipements', type=int, default=1000, help="nombre d'équipements simulés")
+    parser.add_argument('--premier-id', type=int, default=1, help="ID du premier équipement en base")
+    parser.add_argument('--transport', choices=('http', 'udp'), default='http',
+                        help="http (/api/ping) ou udp (heartbeats, voir ecoute_udp.py)")
+    parser.add_argument('--port-udp', type=int, default=5684, help="port des heartbeats UDP")
+    parser.add_argument('--binaire', action='store_true', help="heartbeats UDP au format binaire")
+    parser.add_argument('--cle-udp', help="clé maître HMAC des heartbeats UDP (UDP_HMAC_KEY du serveur)")
+    parser.add_argument('--par-ip', action='store_true',
+                        help="identifier les équipements par IP (10.x.y.z) plutôt que par ID")
+    parser.add_argument('--intervalle', type=float, default=60.0, help="secondes entre deux pings d'un équipement")
+    parser.add_argument('--gigue', type=float, default=0.1, help="variation relative de l'intervalle (0.1 = ±10%%)")
+    parser.add_argument('--rafale', action='store_true',
+                        help="mode rafale: tous les équipements pinguent en même temps, sans gigue")
+    parser.add_argument('--pannes', type=float, default=0.0, help="fraction moyenne d'équipements en panne")
+    parser.add_argument('--motif-panne', choices=MOTIFS_PANNE, default='aleatoire', help="répartition des pannes")
+    parser.add_argument('--duree-panne', type=float, default=300.0, help="durée d'une panne (secondes)")
+    parser.add_argument('--duree', type=float, default=120.0, help="durée de la simulation (secondes)")
+    parser.add_argument('--connexions', type=int, default=100, help="connexions HTTP simultanées maximum")
+    parser.add_argument('--timeout', type=float, default=10.0, help="timeout d'une requête (secondes)")
+    parser.add_argument('--progression', type=float, default=10.0, help="période d'affichage du débit (secondes)")
+    parser.add_argument('--graine', type=int, default=42, help="graine aléatoire (reproductibilité)")
+    parser.add_argument('--json', action='store_true', help="afficher le rapport en JSON")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    if aiohttp is None and config.transport == 'http':
+        print("❌ aiohttp est requis: uv sync --extra ingestion (ou pip install aiohttp)", file=sys.stderr)
+        return 1
+
+    random.seed(config.graine)
+    print(f"🚀 {config.equipements} équipements, un ping toutes les {config.intervalle}s, "
+          f"pendant {config.duree}s vers {config.serveur}", file=sys.stderr)
+    rapport = asyncio.run(lancer_charge(config))
+
+    if config.json:
+        print(json.dumps(rapport, indent=2))
+    else:
+        afficher_rapport(rapport)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
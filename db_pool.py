@@ -0,0 +1,224 @@
+"""
+Configuration et instrumentation du pool de connexions à la base de données
+Le pool est réglable par rôle de processus (web, scheduler, ingestion) via des variables d'environnement
+"""
+import os
+import time
+import logging
+import threading
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# Réglages par défaut de chaque rôle de processus
+ROLES_POOL = {
+    'web': {'pool_size': 10, 'max_overflow': 20, 'pool_timeout': 10},
+    'scheduler': {'pool_size': 2, 'max_overflow': 2, 'pool_timeout': 30},
+    'ingestion': {'pool_size': 20, 'max_overflow': 30, 'pool_timeout': 5},
+}
+
+# Stratégies de vérification des connexions au moment de l'emprunt
+PRE_PING_STRATEGIES = ('always', 'idle', 'never')
+
+def _env(role, nom, defaut):
+    """Lit DB_<ROLE>_<NOM>, puis DB_<NOM>, puis la valeur par défaut"""
+    return os.environ.get(f"DB_{role.upper()}_{nom}", os.environ.get(f"DB_{nom}", defaut))
+
+def get_db_role():
+    """Rôle du processus courant (DB_ROLE, 'web' par défaut)"""
+    role = os.environ.get('DB_ROLE', 'web')
+    if role not in ROLES_POOL:
+        logger.warning(f"Rôle de base de données inconnu '{role}', utilisation de 'web'")
+        role = 'web'
+    return role
+
+def get_engine_options(database_uri, role=None):
+    """Construit SQLALCHEMY_ENGINE_OPTIONS pour le rôle donné"""
+    role = role or get_db_role()
+    defauts = ROLES_POOL[role]
+
+    options = {
+        "pool_recycle": int(_env(role, 'POOL_RECYCLE', 300)),
+    }
+
+    # SQLite en mémoire: pool statique imposé par Flask-SQLAlchemy, pas de dimensionnement
+    if database_uri.startswith("sqlite") and (":memory:" in database_uri or database_uri.rstrip('/') == "sqlite:"):
+        return options
+
+    options.update({
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": int(_env(role, 'POOL_SIZE', defauts['pool_size'])),
+        "max_overflow": int(_env(role, 'MAX_OVERFLOW', defauts['max_overflow'])),
+        "pool_timeout": int(_env(role, 'POOL_TIMEOUT', defauts['pool_timeout'])),
+        "pool_use_lifo": _env(role, 'POOL_LIFO', '1') == '1',
+    })
+
+    strategie = get_pre_ping_strategy(role)
+    if strategie == 'always':
+        options["pool_pre_ping"] = True
+
+    return options
+
+def get_pre_ping_strategy(role=None):
+    """Stratégie de pre-ping: 'always' (à chaque emprunt), 'idle' (connexions inactives) ou 'never'"""
+    role = role or get_db_role()
+    strategie = _env(role, 'POOL_PRE_PING', 'idle')
+    if strategie not in PRE_PING_STRATEGIES:
+        logger.warning(f"Stratégie de pre-ping inconnue '{strategie}', utilisation de 'idle'")
+        strategie = 'idle'
+    return strategie
+
+class PoolMetrics:
+    """Compteurs d'utilisation d'un pool de connexions"""
+
+    # Bornes (secondes) de l'histogramme des temps d'attente à l'emprunt
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+    def __init__(self, nom):
+        self.nom = nom
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_buckets = [0] * len(self.BUCKETS)
+        self.overflow_events = 0
+        self.timeouts = 0
+        self.pre_pings = 0
+        self.invalidations = 0
+        self.pool = None
+
+    def record_checkout(self, attente, overflow_cree):
+        with self.lock:
+            self.checkouts += 1
+            self.wait_seconds_total += attente
+            self.wait_seconds_max = max(self.wait_seconds_max, attente)
+            for i, borne in enumerate(self.BUCKETS):
+                if attente <= borne:
+                    self.wait_buckets[i] += 1
+            if overflow_cree:
+                self.overflow_events += 1
+
+    def record_timeout(self):
+        with self.lock:
+            self.timeouts += 1
+
+    def record_pre_ping(self):
+        with self.lock:
+            self.pre_pings += 1
+
+    def record_invalidation(self):
+        with self.lock:
+            self.invalidations += 1
+
+    def snapshot(self):
+        """Retourne l'état courant du pool et les compteurs cumulés"""
+        with self.lock:
+            data = {
+                'pool': self.nom,
+                'checkouts': self.checkouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'wait_buckets': dict(zip(self.BUCKETS, self.wait_buckets)),
+                'overflow_events': self.overflow_events,
+                'timeouts': self.timeouts,
+                'pre_pings': self.pre_pings,
+                'invalidations': self.invalidations,
+            }
+
+        if self.pool is not None:
+            data.update({
+                'size': self.pool.size(),
+                'in_use': self.pool.checkedout(),
+                'idle': self.pool.checkedin(),
+                'overflow': max(self.pool.overflow(), 0),
+            })
+        return data
+
+# Métriques de chaque pool instrumenté, par nom de bind ('primary', 'replica_0', ...)
+pool_metrics = {}
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool qui mesure le temps d'attente à l'emprunt et les débordements"""
+
+    metrics = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Propre à chaque pool: un emprunt en cours sur un pool ne masque pas ceux des autres
+        self._local = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get peut se rappeler lui-même: ne mesurer que l'appel externe
+        if getattr(self._local, 'en_cours', False) or self.metrics is None:
+            return super()._do_get()
+
+        self._local.en_cours = True
+        overflow_avant = self._overflow
+        debut = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        finally:
+            self._local.en_cours = False
+
+        overflow_cree = self._overflow > overflow_avant and self._overflow > 0
+        self.metrics.record_checkout(time.perf_counter() - debut, overflow_cree)
+        return record
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+def instrumenter_engine(nom, engine, pre_ping_idle=None):
+    """Attache les métriques et le pre-ping des connexions inactives au pool d'un moteur"""
+    pool = engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return None
+
+    metrics = PoolMetrics(nom)
+    metrics.pool = pool
+    pool.metrics = metrics
+    pool_metrics[nom] = metrics
+
+    @event.listens_for(engine, "invalidate")
+    def _compter_invalidation(dbapi_connection, connection_record, exception):
+        metrics.record_invalidation()
+
+    if get_pre_ping_strategy() == 'idle':
+        if pre_ping_idle is None:
+            pre_ping_idle = float(_env(get_db_role(), 'POOL_PRE_PING_IDLE_SECONDS', 30))
+
+        @event.listens_for(engine, "checkin")
+        def _dater_retour(dbapi_connection, connection_record):
+            connection_record.info['checkin_time'] = time.monotonic()
+
+        @event.listens_for(engine, "checkout")
+        def _verifier_connexion_inactive(dbapi_connection, connection_record, connection_proxy):
+            retour = connection_record.info.get('checkin_time')
+            if retour is None or time.monotonic() - retour < pre_ping_idle:
+                return
+
+            metrics.record_pre_ping()
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute("SELECT 1")
+            except Exception as e:
+                # Le pool remplace la connexion et retente l'emprunt
+                raise exc.DisconnectionError(f"Connexion inactive invalide: {e}")
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    return metrics
+
+def get_pool_metrics():
+    """Retourne l'état de tous les pools instrumentés"""
+    return [metrics.snapshot() for metrics in pool_metrics.values()]
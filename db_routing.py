@@ -0,0 +1,92 @@
+"""
+Routage lecture/écriture entre la base principale et ses réplicas
+Les lectures des requêtes GET vont sur un réplica, tout le reste sur la base principale
+"""
+import os
+import time
+import random
+import logging
+from flask import g, session, request, current_app, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+logger = logging.getLogger(__name__)
+
+# Préfixe des binds SQLALCHEMY_BINDS correspondant aux réplicas
+REPLICA_BIND_PREFIX = 'replica_'
+
+# Méthodes HTTP dont les lectures peuvent aller sur un réplica
+METHODES_LECTURE = ('GET', 'HEAD')
+
+def get_replica_binds():
+    """Construit les binds des réplicas depuis DATABASE_REPLICA_URLS (URLs séparées par des virgules)"""
+    urls = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    binds = {}
+    for i, url in enumerate(urls):
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        binds[f"{REPLICA_BIND_PREFIX}{i}"] = url
+    return binds
+
+class RoutingSession(Session):
+    """Session qui envoie les SELECT des requêtes en lecture seule vers un réplica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._lecture_sur_replica(clause):
+            replica = self._choisir_replica()
+            if replica is not None:
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _lecture_sur_replica(self, clause):
+        """Indique si la requête peut être servie par un réplica"""
+        if self._flushing or not isinstance(clause, Select):
+            return False
+
+        # Hors requête HTTP (tâches planifiées, file d'écriture): base principale
+        if not has_request_context() or request.method not in METHODES_LECTURE:
+            return False
+
+        # La requête a déjà écrit: lire ses propres écritures
+        if g.get('_db_ecriture'):
+            return False
+
+        # Fenêtre "read-your-writes" après une écriture de la même session utilisateur
+        derniere_ecriture = session.get('_db_derniere_ecriture')
+        fenetre = current_app.config.get('DATABASE_REPLICA_RYW_SECONDS', 5)
+        if derniere_ecriture and time.time() - derniere_ecriture < fenetre:
+            return False
+
+        return True
+
+    def _choisir_replica(self):
+        """Choisit un réplica, le même pour toute la durée de la session"""
+        if not hasattr(self, '_replica'):
+            replicas = [engine for key, engine in self._db.engines.items()
+                        if key and key.startswith(REPLICA_BIND_PREFIX)]
+            self._replica = random.choice(replicas) if replicas else None
+        return self._replica
+
+@event.listens_for(RoutingSession, "after_flush")
+def _marquer_ecriture(session_db, flush_context):
+    """Mémorise qu'une écriture a eu lieu pendant la requête"""
+    if has_request_context():
+        g._db_ecriture = True
+
+def init_routage(app):
+    """Enregistre l'ouverture de la fenêtre "read-your-writes" si des réplicas sont configurés"""
+    replicas = [key for key in app.config.get("SQLALCHEMY_BINDS", {}) if key.startswith(REPLICA_BIND_PREFIX)]
+    if not replicas:
+        return
+
+    logger.info(f"Routage lecture/écriture activé: {len(replicas)} réplica(s)")
+
+    @app.after_request
+    def _ouvrir_fenetre_lecture_ecriture(response):
+        # Seulement pour une session de navigateur déjà ouverte: les équipements (pings) n'ont pas de
+        # cookie de session et ne doivent pas en recevoir un à chaque écriture
+        if g.get('_db_ecriture') and app.config['SESSION_COOKIE_NAME'] in request.cookies:
+            session['_db_derniere_ecriture'] = time.time()
+        return response
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Réception des pings (heartbeats) par UDP
+Transport léger pour les DVR qui ne savent envoyer que de petits paquets périodiques:
+les heartbeats sont décodés dans une boucle asyncio et écrits par lots (TamponPings),
+avec le même traitement que /api/ping.
+
+Formats acceptés (signature HMAC-SHA256 optionnelle, tronquée à 8 octets):
+    texte:   b"<equipement_id>[:<reponse_ms>]"                          ex: b"42:37"
+    signé:   b"<equipement_id>:<reponse_ms>:<horodatage_ms>:<signature hex>"
+    binaire: struct "!BIH" (version=1, equipement_id, reponse_ms ou 0xFFFF), non signé
+             struct "!BIHQ" (version=2, ..., horodatage_ms) + signature
+
+La signature porte sur le corps (texte "<id>:<reponse_ms>:<horodatage_ms>" ou les octets binaires),
+avec une clé dérivée par équipement de UDP_HMAC_KEY: un équipement ne peut pas signer pour un autre.
+L'horodatage signé (millisecondes Unix) empêche le rejeu: un heartbeat hors de la fenêtre
+UDP_HMAC_WINDOW_SECONDS, ou pas plus récent que le précédent du même équipement, est rejeté.
+
+Usage:
+    python ecoute_udp.py --port 5684
+"""
+import os
+import sys
+
+# Processus d'ingestion: pool dimensionné pour l'ingestion, pas de tâches planifiées
+os.environ.setdefault('DB_ROLE', 'ingestion')
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import logging
+import signal
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+FORMAT_BINAIRE = struct.Struct('!BIH')
+VERSION_BINAIRE = 1
+FORMAT_BINAIRE_SIGNE = struct.Struct('!BIHQ')
+VERSION_BINAIRE_SIGNE = 2
+REPONSE_INCONNUE = 0xFFFF
+TAILLE_SIGNATURE = 8
+
+PORT_DEFAUT = int(os.environ.get('UDP_HEARTBEAT_PORT', 5684))
+# Écart maximum entre l'horodatage d'un heartbeat signé et l'horloge du serveur
+FENETRE_DEFAUT = float(os.environ.get('UDP_HMAC_WINDOW_SECONDS', 30))
+
+class HeartbeatInvalide(ValueError):
+    """Heartbeat illisible ou mal signé"""
+
+def cle_equipement(cle_maitre, equipement_id):
+    """Clé HMAC propre à un équipement, dérivée de la clé maître"""
+    return hmac.new(cle_maitre, f"equipement:{equipement_id}".encode(), hashlib.sha256).digest()
+
+def signer(cle_maitre, equipement_id, corps):
+    return hmac.new(cle_equipement(cle_maitre, equipement_id), corps, hashlib.sha256).digest()[:TAILLE_SIGNATURE]
+
+def encoder_heartbeat(equipement_id, reponse_ms=None, cle_maitre=None, binaire=False, horodatage_ms=None):
+    """Construit un heartbeat (utilisé par les simulateurs et les tests de charge)
+
+    Un heartbeat signé porte l'horodatage `horodatage_ms` (par défaut l'heure courante).
+    """
+    reponse = REPONSE_INCONNUE if reponse_ms is None else min(int(reponse_ms), 0xFFFE)
+    if cle_maitre and horodatage_ms is None:
+        horodatage_ms = int(time.time() * 1000)
+
+    if binaire:
+        if not cle_maitre:
+            return FORMAT_BINAIRE.pack(VERSION_BINAIRE, equipement_id, reponse)
+        corps = FORMAT_BINAIRE_SIGNE.pack(VERSION_BINAIRE_SIGNE, equipement_id, reponse, horodatage_ms)
+        return corps + signer(cle_maitre, equipement_id, corps)
+
+    corps = f"{equipement_id}:{'' if reponse_ms is None else int(reponse_ms)}".encode()
+    if cle_maitre:
+        corps += f":{horodatage_ms}".encode()
+        return corps + b":" + signer(cle_maitre, equipement_id, corps).hex().encode()
+    return corps
+
+def decoder_heartbeat(datagramme, cle_maitre=None, signature_requise=False, fenetre=FENETRE_DEFAUT,
+                      derniers=None, maintenant=None):
+    """Décode un heartbeat et vérifie sa signature, retourne (equipement_id, reponse_ms)
+
+    `derniers` (dictionnaire equipement_id -> horodatage_ms, mis à jour) rejette les heartbeats
+    signés rejoués; `maintenant` (secondes Unix) sert aux tests.
+    """
+    if not datagramme:
+        raise HeartbeatInvalide("Datagramme vide")
+
+    horodatage_ms = None
+    if datagramme[0] == VERSION_BINAIRE:
+        if len(datagramme) != FORMAT_BINAIRE.size:
+            raise HeartbeatInvalide("Taille de heartbeat binaire invalide")
+        _, equipement_id, reponse_ms = FORMAT_BINAIRE.unpack(datagramme)
+        corps, signature = datagramme, b""
+    elif datagramme[0] == VERSION_BINAIRE_SIGNE:
+        if len(datagramme) != FORMAT_BINAIRE_SIGNE.size + TAILLE_SIGNATURE:
+            raise HeartbeatInvalide("Taille de heartbeat binaire invalide")
+        _, equipement_id, reponse_ms, horodatage_ms = FORMAT_BINAIRE_SIGNE.unpack_from(datagramme)
+        corps = datagramme[:FORMAT_BINAIRE_SIGNE.size]
+        signature = datagramme[FORMAT_BINAIRE_SIGNE.size:]
+    else:
+        champs = datagramme.split(b":")
+        if len(champs) not in (1, 2, 4):
+            raise HeartbeatInvalide("Heartbeat texte invalide")
+        try:
+            equipement_id = int(champs[0])
+            reponse_ms = int(champs[1]) if len(champs) > 1 and champs[1] else None
+            if len(champs) == 4:
+                horodatage_ms = int(champs[2])
+                signature = bytes.fromhex(champs[3].decode())
+            else:
+                signature = b""
+        except ValueError:
+            raise HeartbeatInvalide("Heartbeat texte invalide")
+        corps = b":".join(champs[:3]) if len(champs) == 4 else b":".join(champs[:2]) if len(champs) > 1 \
+            else champs[0] + b":"
+    if reponse_ms == REPONSE_INCONNUE:
+        reponse_ms = None
+
+    if equipement_id <= 0:
+        raise HeartbeatInvalide("ID d'équipement invalide")
+
+    if signature or signature_requise:
+        if not cle_maitre:
+            raise HeartbeatInvalide("Heartbeat signé mais UDP_HMAC_KEY non configurée")
+        if horodatage_ms is None:
+            raise HeartbeatInvalide("Heartbeat signé sans horodatage")
+        if not hmac.compare_digest(signature, signer(cle_maitre, equipement_id, corps)):
+            raise HeartbeatInvalide("Signature invalide")
+
+        # Anti-rejeu: horodatage proche de l'horloge du serveur et croissant par équipement
+        maintenant = time.time() if maintenant is None else maintenant
+        if abs(horodatage_ms / 1000 - maintenant) > fenetre:
+            raise HeartbeatInvalide("Horodatage hors de la fenêtre")
+        if derniers is not None:
+            if horodatage_ms <= derniers.get(equipement_id, 0):
+                raise HeartbeatInvalide("Heartbeat rejoué")
+            derniers[equipement_id] = horodatage_ms
+
+    return equipement_id, reponse_ms
+
+class ProtocoleHeartbeat(asyncio.DatagramProtocol):
+    """Décode les heartbeats reçus et les transmet par paquets au tampon d'écriture
+
+    Le chemin par datagramme reste minimal (décodage et ajout à une liste locale, sans verrou
+    ni métrique): les heartbeats sont transmis au tampon par `transmettre`.
+    """
+
+    # Nombre de heartbeats accumulés avant transmission immédiate au tampon
+    TAILLE_PAQUET = 1000
+
+    def __init__(self, tampon, cle_maitre=None, signature_requise=False, fenetre=FENETRE_DEFAUT):
+        self.tampon = tampon
+        self.cle_maitre = cle_maitre
+        self.signature_requise = signature_requise
+        self.fenetre = fenetre
+        # Dernier horodatage signé accepté par équipement (anti-rejeu)
+        self.derniers = {}
+        self.paquet = []
+        self.recus = 0
+        self.invalides = 0
+        self._recus_signales = 0
+        self._invalides_signales = 0
+
+    def datagram_received(self, data, addr):
+        try:
+            equipement_id, reponse_ms = decoder_heartbeat(data, self.cle_maitre, self.signature_requise,
+                                                          self.fenetre, self.derniers)
+        except HeartbeatInvalide as e:
+            self.invalides += 1
+            logger.debug(f"Heartbeat rejeté de {addr[0]}: {e}")
+            return
+
+        self.recus += 1
+        self.paquet.append({'equipement_id': equipement_id, 'reponse_ms': reponse_ms, 'message': 'Heartbeat UDP'})
+        if len(self.paquet) >= self.TAILLE_PAQUET:
+            self.transmettre()
+
+    def error_received(self, exc):
+        logger.warning(f"Erreur de réception UDP: {exc}")
+
+    def transmettre(self):
+        """Transmet les heartbeats accumulés au tampon et met à jour les métriques"""
+        from metrics import PINGS_TOTAL
+
+        if self.paquet:
+            paquet, self.paquet = self.paquet, []
+            self.tampon.ajouter_lot(paquet)
+
+        PINGS_TOTAL.labels(transport='udp', status='received').inc(self.recus - self._recus_signales)
+        PINGS_TOTAL.labels(transport='udp', status='invalid').inc(self.invalides - self._invalides_signales)
+        self._recus_signales, self._invalides_signales = self.recus, self.invalides
+
+async def ecouter(hote, port, tampon, cle_maitre=None, signature_requise=False, periode_journal=60.0):
+    """Écoute les heartbeats jusqu'à l'arrêt du processus (SIGINT/SIGTERM)"""
+    loop = asyncio.get_running_loop()
+
+    # Grand tampon de réception pour absorber les rafales sans perte
+    sock = socket.socket(socket.AF_INET6 if ':' in hote else socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind((hote, port))
+
+    transport, protocole = await loop.create_datagram_endpoint(
+        lambda: ProtocoleHeartbeat(tampon, cle_maitre, signature_requise), sock=sock
+    )
+    logger.info(f"Écoute des heartbeats UDP sur {hote}:{port}"
+                f"{' (signature obligatoire)' if signature_requise else ''}")
+
+    arret = asyncio.Event()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_arret, arret.set)
+        except NotImplementedError:
+            pass  # Windows
+
+    try:
+        precedent, dernier_journal = 0, loop.time()
+        while not arret.is_set():
+            try:
+                await asyncio.wait_for(arret.wait(), timeout=tampon.intervalle)
+            except asyncio.TimeoutError:
+                pass
+            protocole.transmettre()
+
+            if loop.time() - dernier_journal >= periode_journal:
+                duree, dernier_journal = loop.time() - dernier_journal, loop.time()
+                logger.info(f"Heartbeats UDP: {(protocole.recus - precedent) / duree:.0f}/s, "
+                            f"{protocole.recus} reçus, {protocole.invalides} rejetés")
+                precedent = protocole.recus
+    finally:
+        transport.close()
+        protocole.transmettre()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Réception des heartbeats UDP des équipements")
+    parser.add_argument('--hote', default=os.environ.get('UDP_HEARTBEAT_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=PORT_DEFAUT)
+    parser.add_argument('--taille-lot', type=int, default=int(os.environ.get('UDP_BATCH_SIZE', 5000)),
+                        help="nombre maximum de pings par écriture")
+    parser.add_argument('--intervalle', type=float, default=float(os.environ.get('UDP_FLUSH_SECONDS', 0.2)),
+                        help="délai maximum avant écriture des pings reçus (secondes)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+
+    from app import app
+    from ingestion import TamponPings
+
+    cle = os.environ.get('UDP_HMAC_KEY')
+    cle_maitre = cle.encode() if cle else None
+    signature_requise = os.environ.get('UDP_HMAC_REQUIRED') == '1'
+    if signature_requise and not cle_maitre:
+        logger.error("UDP_HMAC_REQUIRED=1 exige UDP_HMAC_KEY")
+        return 1
+
+    logging.getLogger().setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+    tampon = TamponPings(app, 'udp', taille_lot=config.taille_lot, intervalle=config.intervalle)
+    tampon.demarrer()
+    try:
+        asyncio.run(ecouter(config.hote, config.port, tampon, cle_maitre, signature_requise))
+    finally:
+        tampon.arreter()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,6 +5,7 @@ import os
 import logging
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content
+from metrics import EMAILS_TOTAL
 
 logger = logging.getLogger(__name__)
 
@@ -40,10 +41,12 @@ class EmailService:
             
             response = self.sg.send(message)
             logger.info(f"Email envoyé avec succès à {to_email}. Status: {response.status_code}")
+            EMAILS_TOTAL.labels(status='sent').inc()
             return True
             
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi de l'email à {to_email}: {e}")
+            EMAILS_TOTAL.labels(status='error').inc()
             return False
     
     def send_equipment_offline_alert(self, client_email, client_name, equipment_name, equipment_type, equipment_ip):
@@ -0,0 +1,235 @@
+"""
+Enregistrement de clips d'événements des caméras
+Chaque flux garde en mémoire un anneau des dernières images JPEG (pré-enregistrement); un mouvement,
+une alerte d'image ou une demande manuelle déclenche un clip (pré-enregistrement + post-enregistrement)
+écrit en AVI (MJPEG, sans réencodage) par un thread d'écriture, avec quota disque et rétention.
+"""
+import collections
+import logging
+import os
+import struct
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from metrics import CAMERA_CLIPS_TOTAL, CAMERA_CLIPS_DELETED_TOTAL
+
+logger = logging.getLogger(__name__)
+
+CAMERA_CLIPS = os.environ.get('CAMERA_CLIPS') == '1'
+CAMERA_CLIPS_DIR = os.environ.get('CAMERA_CLIPS_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'clips')
+CAMERA_CLIP_FPS = float(os.environ.get('CAMERA_CLIP_FPS', 5))
+CAMERA_CLIP_PREROLL_SECONDS = float(os.environ.get('CAMERA_CLIP_PREROLL_SECONDS', 10))
+CAMERA_CLIP_POSTROLL_SECONDS = float(os.environ.get('CAMERA_CLIP_POSTROLL_SECONDS', 10))
+CAMERA_CLIP_MAX_SECONDS = float(os.environ.get('CAMERA_CLIP_MAX_SECONDS', 120))
+CAMERA_CLIP_QUOTA_MB = float(os.environ.get('CAMERA_CLIP_QUOTA_MB', 1024))
+CAMERA_CLIP_RETENTION_DAYS = float(os.environ.get('CAMERA_CLIP_RETENTION_DAYS', 7))
+
+# Profil de diffusion des images enregistrées
+PROFIL_CLIP = 'medium'
+
+def _bloc(fourcc, donnees):
+    """Bloc RIFF (aligné sur 2 octets)"""
+    return fourcc + struct.pack('<I', len(donnees)) + donnees + (b'\0' if len(donnees) % 2 else b'')
+
+def _liste(type_liste, donnees):
+    return _bloc(b'LIST', type_liste + donnees)
+
+def ecrire_avi_mjpeg(chemin, images, fps, largeur, hauteur):
+    """Écrit des images JPEG dans un fichier AVI (MJPEG) sans les réencoder"""
+    movi = bytearray(b'movi')
+    index = bytearray()
+    for jpeg in images:
+        index += struct.pack('<4sIII', b'00dc', 0x10, len(movi), len(jpeg))  # 0x10: image clé
+        movi += _bloc(b'00dc', jpeg)
+
+    taille_max = max(len(jpeg) for jpeg in images)
+    avih = struct.pack('<14I', int(1e6 / fps), int(taille_max * fps), 0, 0x10, len(images), 0, 1,
+                       taille_max, largeur, hauteur, 0, 0, 0, 0)
+    strh = struct.pack('<4s4sIHHIIIIIIII4h', b'vids', b'MJPG', 0, 0, 0, 0, 1000, int(fps * 1000), 0,
+                       len(images), taille_max, 0xFFFFFFFF, 0, 0, 0, largeur, hauteur)
+    strf = struct.pack('<IiiHH4sIiiII', 40, largeur, hauteur, 1, 24, b'MJPG', largeur * hauteur * 3, 0, 0, 0, 0)
+    hdrl = _liste(b'hdrl', _bloc(b'avih', avih) + _liste(b'strl', _bloc(b'strh', strh) + _bloc(b'strf', strf)))
+
+    contenu = b'AVI ' + hdrl + _bloc(b'LIST', bytes(movi)) + _bloc(b'idx1', bytes(index))
+    with open(chemin, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', len(contenu)) + contenu)
+
+class TamponClips:
+    """Pré-enregistrement (anneau d'images JPEG) et clip en cours d'un flux
+
+    Utilisé uniquement par le thread de capture du flux, qui termine aussi le clip en cours à sa sortie;
+    une demande manuelle (`demander`) est prise en compte à l'image suivante.
+    """
+
+    def __init__(self, camera_id, ecrivain, fps=CAMERA_CLIP_FPS, pre=CAMERA_CLIP_PREROLL_SECONDS,
+                 post=CAMERA_CLIP_POSTROLL_SECONDS, duree_max=CAMERA_CLIP_MAX_SECONDS):
+        self.camera_id = camera_id
+        self.ecrivain = ecrivain
+        self.intervalle = 1.0 / fps
+        self.post = post
+        self.duree_max = duree_max
+        self.anneau = collections.deque(maxlen=max(1, int(pre * fps)))
+        self.clip = None
+        self.demande = None
+        self._prochaine = 0.0
+
+    @property
+    def en_cours(self):
+        return self.clip is not None
+
+    def image_due(self):
+        """Indique si la prochaine image doit être conservée (cadence CAMERA_CLIP_FPS)"""
+        return time.monotonic() >= self._prochaine
+
+    def ajouter(self, horodatage, jpeg):
+        """Conserve une image (anneau, ou clip en cours)"""
+        maintenant = time.monotonic()
+        self._prochaine = maintenant + self.intervalle
+        if self.demande is not None:
+            motif, self.demande = self.demande, None
+            self.declencher(motif)
+
+        if self.clip is None:
+            self.anneau.append((horodatage, jpeg))
+            return
+
+        self.clip['images'].append((horodatage, jpeg))
+        if maintenant >= self.clip['fin'] or maintenant - self.clip['debut'] >= self.duree_max:
+            self.terminer()
+
+    def declencher(self, motif):
+        """Démarre un clip avec le pré-enregistrement, ou prolonge le clip en cours"""
+        fin = time.monotonic() + self.post
+        if self.clip is not None:
+            self.clip['fin'] = max(self.clip['fin'], fin)
+            return
+        self.clip = {'motif': motif, 'debut': time.monotonic(), 'fin': fin, 'images': list(self.anneau)}
+        self.anneau.clear()
+        logger.info(f"Clip de la caméra {self.camera_id} déclenché ({motif})")
+
+    def demander(self, motif='manuel'):
+        """Demande un clip depuis un autre thread (requête HTTP)"""
+        self.demande = motif
+
+    def terminer(self):
+        """Termine le clip en cours et le confie au thread d'écriture"""
+        clip, self.clip = self.clip, None
+        if clip and clip['images']:
+            self.ecrivain.soumettre(self.camera_id, clip['motif'], clip['images'])
+
+class EcrivainClips:
+    """Thread d'écriture des clips, avec quota disque et rétention
+
+    Les clips terminés sont déposés dans une deque (sûre entre threads système et greenlets) et
+    écrits par un thread système qui la relève périodiquement.
+    """
+
+    def __init__(self, dossier=CAMERA_CLIPS_DIR, quota_mb=CAMERA_CLIP_QUOTA_MB,
+                 retention_jours=CAMERA_CLIP_RETENTION_DAYS, periode=0.5):
+        self.dossier = dossier
+        self.quota = quota_mb * 1024 * 1024
+        self.retention = retention_jours * 86400
+        self.periode = periode
+        self.file = collections.deque()
+        self.thread = None
+        self.pid = None
+
+    def ensure_started(self):
+        """Démarre le thread d'écriture (une fois par processus, compatible fork de gunicorn)"""
+        from camera_stream import ThreadCapture
+
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            return
+        self.file = collections.deque()
+        self.pid = os.getpid()
+        self.thread = ThreadCapture(self._run, "ecriture-clips")
+
+    def soumettre(self, camera_id, motif, images):
+        self.file.append((camera_id, motif, images))
+
+    def _run(self):
+        """Boucle du thread d'écriture (privé)"""
+        from camera_stream import pause_systeme
+
+        self.appliquer_quota()
+        while True:
+            if not self.file:
+                pause_systeme(self.periode)
+                continue
+            camera_id, motif, images = self.file.popleft()
+            try:
+                self.ecrire(camera_id, motif, images)
+                self.appliquer_quota()
+            except Exception as e:
+                logger.error(f"Erreur d'écriture d'un clip de la caméra {camera_id}: {e}")
+
+    def ecrire(self, camera_id, motif, images):
+        """Écrit un clip et retourne son chemin"""
+        dossier = os.path.join(self.dossier, str(camera_id))
+        os.makedirs(dossier, exist_ok=True)
+        debut = images[0][0]
+        # Millisecondes et pid: plusieurs workers peuvent enregistrer la même caméra dans la même seconde
+        base = f"{datetime.fromtimestamp(debut).strftime('%Y%m%d-%H%M%S-%f')[:-3]}_{motif}_{os.getpid()}"
+        temporaire = os.path.join(dossier, base + '.avi.part')
+
+        duree = images[-1][0] - debut
+        fps = (len(images) - 1) / duree if duree > 0 else CAMERA_CLIP_FPS
+        hauteur, largeur = cv2.imdecode(np.frombuffer(images[0][1], np.uint8), cv2.IMREAD_COLOR).shape[:2]
+        ecrire_avi_mjpeg(temporaire, [jpeg for _, jpeg in images], fps, largeur, hauteur)
+        chemin = self._publier(temporaire, os.path.join(dossier, base))
+
+        CAMERA_CLIPS_TOTAL.labels(camera=str(camera_id), trigger=motif).inc()
+        logger.info(f"Clip enregistré: {chemin} ({len(images)} images, {duree:.0f}s)")
+        return chemin
+
+    @staticmethod
+    def _publier(temporaire, base):
+        """Donne au fichier temporaire un nom libre (lien exclusif, jamais d'écrasement) et retourne son chemin"""
+        for essai in range(100):
+            chemin = f"{base}.avi" if essai == 0 else f"{base}-{essai}.avi"
+            try:
+                os.link(temporaire, chemin)
+            except FileExistsError:
+                continue
+            os.remove(temporaire)
+            return chemin
+        os.remove(temporaire)
+        raise FileExistsError(f"Aucun nom libre pour le clip {base}")
+
+    def lister(self, camera_id=None):
+        """Clips enregistrés (les plus récents d'abord): dictionnaires camera_id, nom, taille, date"""
+        clips = []
+        if not os.path.isdir(self.dossier):
+            return clips
+        dossiers = [str(camera_id)] if camera_id is not None else os.listdir(self.dossier)
+        for dossier_camera in dossiers:
+            chemin_dossier = os.path.join(self.dossier, dossier_camera)
+            if not dossier_camera.isdigit() or not os.path.isdir(chemin_dossier):
+                continue
+            for entree in os.scandir(chemin_dossier):
+                if entree.name.endswith('.avi'):
+                    infos = entree.stat()
+                    clips.append({'camera_id': int(dossier_camera), 'name': entree.name,
+                                  'size': infos.st_size, 'date': infos.st_mtime, 'path': entree.path})
+        return sorted(clips, key=lambda clip: clip['date'], reverse=True)
+
+    def appliquer_quota(self):
+        """Supprime les clips plus anciens que la rétention, puis les plus anciens au-delà du quota"""
+        limite = time.time() - self.retention
+        total = 0
+        for clip in self.lister():  # du plus récent au plus ancien
+            total += clip['size']
+            if clip['date'] < limite or total > self.quota:
+                raison = 'retention' if clip['date'] < limite else 'quota'
+                try:
+                    os.remove(clip['path'])
+                    CAMERA_CLIPS_DELETED_TOTAL.labels(reason=raison).inc()
+                except FileNotFoundError:
+                    pass  # supprimé par un autre worker
+
+# Instance globale du thread d'écriture
+ecrivain_clips = EcrivainClips()
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Génération d'un parc synthétique pour les tests de performance
+Crée clients, équipements, utilisateurs, des semaines d'historique de pings et les alertes
+correspondantes (pannes, retours en ligne), par insertions groupées (COPY sous PostgreSQL).
+Le parc est déterministe pour une graine donnée (les dates sont relatives à l'heure de génération).
+
+Usage:
+    python generer_parc.py --clients 200 --equipements 10000 --jours 14 --graine 42
+    python generer_parc.py --vider --equipements 1000 --intervalle 5
+"""
+import os
+import argparse
+import csv
+import hashlib
+import io
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, text
+
+# Pas de tâches planifiées pendant la génération
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+
+from app import app, db
+from models import Client, Equipement, HistoriquePing, Alerte, User
+
+TYPES_EQUIPEMENT = ('DVR', 'NVR', 'Camera IP', 'Camera Analogique')
+
+# Profils de fiabilité: (proportion, pannes par semaine, durée d'une panne en minutes (min, max))
+PROFILS_FIABILITE = (
+    (0.85, 0.5, (5, 60)),        # stable
+    (0.12, 6.0, (3, 30)),        # instable
+    (0.03, 1.0, (720, 4320)),    # pannes longues (souvent encore hors ligne)
+)
+
+# Taille des lots d'insertion
+TAILLE_LOT = 10000
+
+MOT_DE_PASSE_DEFAUT = 'demo123'
+
+def inserer_en_masse(table, lignes):
+    """Insère un itérable de dictionnaires par lots (COPY sous PostgreSQL), retourne le nombre de lignes"""
+    connexion = db.session.connection()
+    if connexion.dialect.name == 'postgresql':
+        return _copier(connexion, table, lignes)
+
+    nombre = 0
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= TAILLE_LOT:
+            connexion.execute(insert(table), lot)
+            nombre += len(lot)
+            lot = []
+    if lot:
+        connexion.execute(insert(table), lot)
+        nombre += len(lot)
+    return nombre
+
+def _copier(connexion, table, lignes):
+    """COPY ... FROM STDIN par lots, via le curseur psycopg2 de la connexion de la session"""
+    curseur = connexion.connection.cursor()
+    colonnes = None
+    nombre = 0
+    tampon = io.StringIO()
+    ecrivain = csv.writer(tampon)
+
+    def vider_tampon():
+        tampon.seek(0)
+        curseur.copy_expert(f"COPY {table.name} ({', '.join(colonnes)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                            tampon)
+        tampon.seek(0)
+        tampon.truncate()
+
+    for ligne in lignes:
+        if colonnes is None:
+            colonnes = list(ligne)
+        ecrivain.writerow(['\\N' if ligne[c] is None else ligne[c] for c in colonnes])
+        nombre += 1
+        if nombre % TAILLE_LOT == 0:
+            vider_tampon()
+    if colonnes is not None and tampon.tell():
+        vider_tampon()
+    return nombre
+
+def _prochain_id(modele):
+    return (db.session.query(func.max(modele.id)).scalar() or 0) + 1
+
+def _synchroniser_sequences(*modeles):
+    """Aligne les séquences PostgreSQL après l'insertion d'identifiants explicites"""
+    if db.session.connection().dialect.name != 'postgresql':
+        return
+    for modele in modeles:
+        table = modele.__table__.name
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))"
+        ))
+
+def vider_base():
+    """Supprime toutes les données (dans l'ordre des clés étrangères)"""
+    for modele in (HistoriquePing, Alerte, User, Equipement, Client):
+        db.session.query(modele).delete()
+    db.session.commit()
+
+def _pannes(rng, debut, fin):
+    """Tire les fenêtres de panne (debut, fin) d'un équipement sur la période"""
+    tirage = rng.random()
+    for proportion, pannes_par_semaine, (duree_min, duree_max) in PROFILS_FIABILITE:
+        if tirage < proportion:
+            break
+        tirage -= proportion
+
+    duree_totale = (fin - debut).total_seconds()
+    nombre = _tirer_poisson(rng, pannes_par_semaine * duree_totale / (7 * 86400))
+    pannes = []
+    for _ in range(nombre):
+        debut_panne = debut + timedelta(seconds=rng.uniform(0, duree_totale))
+        pannes.append((debut_panne, debut_panne + timedelta(minutes=rng.uniform(duree_min, duree_max))))
+    return sorted(pannes)
+
+def _tirer_poisson(rng, moyenne):
+    """Tirage d'une loi de Poisson (méthode de Knuth, moyennes faibles)"""
+    limite = math.exp(-moyenne)
+    nombre, produit = 0, rng.random()
+    while produit > limite:
+        nombre += 1
+        produit *= rng.random()
+    return nombre
+
+def generer_parc(nb_clients=100, nb_equipements=2000, historique=timedelta(days=14),
+                 intervalle=timedelta(minutes=30), graine=42, mot_de_passe=MOT_DE_PASSE_DEFAUT,
+                 avec_pannes=True, maintenant=None):
+    """Génère un parc synthétique complet, retourne le nombre de lignes créées par table
+
+    À appeler dans un contexte d'application. Les identifiants suivent ceux déjà en base.
+    """
+    rng = random.Random(graine)
+    maintenant = maintenant or datetime.utcnow()
+    debut_historique = maintenant - historique
+    nb_clients = max(min(nb_clients, nb_equipements), 1)
+
+    premier_client = _prochain_id(Client)
+    premier_equipement = _prochain_id(Equipement)
+    premier_utilisateur = _prochain_id(User)
+
+    clients = [{
+        'id': premier_client + i,
+        'nom': f'Client {premier_client + i}',
+        'adresse': f'{rng.randint(1, 200)} rue du Parc, {rng.choice(("Paris", "Lyon", "Marseille", "Lille", "Nantes"))}',
+        'telephone': f'0{rng.randint(100000000, 999999999)}',
+        'email': f'client{premier_client + i}@parc.local',
+        'date_creation': debut_historique - timedelta(days=rng.randint(1, 365)),
+        'actif': rng.random() > 0.02,
+    } for i in range(nb_clients)]
+
+    # Répartition inégale des équipements entre clients (quelques gros clients)
+    poids = [rng.paretovariate(1.5) for _ in range(nb_clients)]
+    clients_equipements = rng.choices([client['id'] for client in clients], weights=poids, k=nb_equipements)
+    noms_clients = {client['id']: client['nom'] for client in clients}
+
+    equipements = []
+    pannes_par_equipement = {}
+    for i, client_id in enumerate(clients_equipements):
+        equipement_id = premier_equipement + i
+        index = equipement_id - 1
+        pannes = _pannes(rng, debut_historique, maintenant) if avec_pannes else []
+        pannes_par_equipement[equipement_id] = pannes
+
+        # Dernier ping: maintenant, ou début de la panne en cours
+        dernier_ping = maintenant - timedelta(seconds=rng.uniform(0, 60))
+        for debut_panne, fin_panne in pannes:
+            if debut_panne <= maintenant < fin_panne:
+                dernier_ping = debut_panne
+        type_equipement = rng.choice(TYPES_EQUIPEMENT)
+        equipements.append({
+            'id': equipement_id,
+            'nom': f'{type_equipement} {equipement_id}',
+            'type_equipement': type_equipement,
+            'adresse_ip': f"10.{(index >> 16) & 255}.{(index >> 8) & 255}.{index & 255}",
+            'port': 554 if type_equipement.startswith('Camera') else 80,
+            'client_id': client_id,
+            'dernier_ping': dernier_ping,
+            'date_creation': debut_historique - timedelta(days=rng.randint(0, 30)),
+            'actif': rng.random() > 0.01,
+            'stream_enabled': False,
+            'resolution': '640x480',
+            'fps': 15,
+            'stream_quality': 'medium',
+        })
+
+    # Un compte approuvé par client, quelques inscriptions en attente
+    hash_mot_de_passe = hashlib.md5(mot_de_passe.encode('utf-8')).hexdigest()
+    utilisateurs = [{
+        'id': premier_utilisateur + i,
+        'nom_utilisateur': f'utilisateur{premier_utilisateur + i}',
+        'email': f'utilisateur{premier_utilisateur + i}@parc.local',
+        'mot_de_passe_hash': hash_mot_de_passe,
+        'nom_complet': f'Utilisateur {premier_utilisateur + i}',
+        'role': 'client',
+        'statut': 'approuve' if rng.random() > 0.05 else 'en_attente',
+        'date_creation': client['date_creation'],
+        'actif': True,
+        'client_id': client['id'],
+    } for i, client in enumerate(clients)]
+
+    db.session.execute(insert(Client), clients)
+    db.session.execute(insert(Equipement), equipements)
+    db.session.execute(insert(User), utilisateurs)
+
+    def pings():
+        pas = intervalle.total_seconds()
+        for equipement in equipements:
+            pannes = pannes_par_equipement[equipement['id']]
+            instant = debut_historique + timedelta(seconds=rng.uniform(0, pas))
+            while instant <= equipement['dernier_ping']:
+                if not any(debut_panne <= instant < fin_panne for debut_panne, fin_panne in pannes):
+                    yield {
+                        'equipement_id': equipement['id'],
+                        'timestamp': instant,
+                        'statut': 'success',
+                        'reponse_ms': int(rng.lognormvariate(3.7, 0.3)),
+                        'message': 'Ping reçu avec succès',
+                    }
+                instant += timedelta(seconds=pas * rng.uniform(0.95, 1.05))
+
+    def alertes():
+        for equipement in equipements:
+            for debut_panne, fin_panne in pannes_par_equipement[equipement['id']]:
+                alerte_hors_ligne = debut_panne + timedelta(minutes=2, seconds=rng.uniform(0, 60))
+                if alerte_hors_ligne >= maintenant or fin_panne <= alerte_hors_ligne:
+                    continue
+                ancienne = maintenant - alerte_hors_ligne > timedelta(days=2)
+                yield {
+                    'equipement_id': equipement['id'],
+                    'type_alerte': 'hors_ligne',
+                    'message': f"L'équipement {equipement['nom']} ({equipement['adresse_ip']}) du client "
+                               f"{noms_clients[equipement['client_id']]} est hors ligne depuis plus de 2 minutes",
+                    'timestamp': alerte_hors_ligne,
+                    'lue': ancienne and rng.random() < 0.9,
+                }
+                if fin_panne < maintenant:
+                    yield {
+                        'equipement_id': equipement['id'],
+                        'type_alerte': 'retour_en_ligne',
+                        'message': f"L'équipement {equipement['nom']} ({equipement['adresse_ip']}) est revenu en ligne",
+                        'timestamp': fin_panne,
+                        'lue': ancienne and rng.random() < 0.9,
+                    }
+
+    nb_pings = inserer_en_masse(HistoriquePing.__table__, pings())
+    nb_alertes = inserer_en_masse(Alerte.__table__, alertes())
+
+    _synchroniser_sequences(Client, Equipement, User)
+    db.session.commit()
+
+    return {
+        'clients': len(clients),
+        'equipements': len(equipements),
+        'utilisateurs': len(utilisateurs),
+        'historique_pings': nb_pings,
+        'alertes': nb_alertes,
+    }
+
+def creer_admin(mot_de_passe):
+    """Crée l'administrateur s'il n'existe pas"""
+    if User.query.filter_by(nom_utilisateur='admin').first():
+        return False
+    admin = User(nom_utilisateur='admin', email='admin@camerasystem.local', nom_complet='Administrateur Système',
+                 role='admin', statut='approuve')
+    admin.set_password(mot_de_passe)
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Génère un parc synthétique pour les tests de performance")
+    parser.add_argument('--clients', type=int, default=100, help="nombre de clients")
+    parser.add_argument('--equipements', type=int, default=2000, help="nombre d'équipements")
+    parser.add_argument('--jours', type=float, default=14, help="profondeur de l'historique des pings (jours)")
+    parser.add_argument('--intervalle', type=float, default=30,
+                        help="intervalle entre deux pings de l'historique (minutes)")
+    parser.add_argument('--sans-pannes', action='store_true', help="aucune panne (ni alerte) simulée")
+    parser.add_argument('--graine', type=int, default=42, help="graine aléatoire (reproductibilité)")
+    parser.add_argument('--mot-de-passe', default=MOT_DE_PASSE_DEFAUT, help="mot de passe des comptes créés")
+    parser.add_argument('--vider', action='store_true', help="supprimer toutes les données existantes avant")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    nb_pings_estime = int(config.equipements * config.jours * 1440 / config.intervalle)
+    print(f"🏗️  Génération de {config.clients} clients, {config.equipements} équipements "
+          f"et ~{nb_pings_estime} pings d'historique (graine {config.graine})")
+
+    with app.app_context():
+        try:
+            if config.vider:
+                vider_base()
+                print("🗑️  Données existantes supprimées")
+            if creer_admin(config.mot_de_passe):
+                print(f"👤 Administrateur créé (admin / {config.mot_de_passe})")
+
+            debut = time.perf_counter()
+            resultat = generer_parc(
+                nb_clients=config.clients,
+                nb_equipements=config.equipements,
+                historique=timedelta(days=config.jours),
+                intervalle=timedelta(minutes=config.intervalle),
+                graine=config.graine,
+                mot_de_passe=config.mot_de_passe,
+                avec_pannes=not config.sans_pannes,
+            )
+        except Exception as e:
+            print(f"❌ Erreur lors de la génération du parc: {e}")
+            db.session.rollback()
+            return 1
+
+    print(f"✅ Parc généré en {time.perf_counter() - debut:.1f}s :")
+    for table, nombre in resultat.items():
+        print(f"   {table}: {nombre}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Configuration gunicorn (chargée automatiquement depuis le répertoire courant)
+Workers gevent (flux MJPEG/HLS de longue durée), répertoire des métriques Prometheus partagé entre les workers
+"""
+import os
+import shutil
+
+# Un worker gevent sert des centaines de spectateurs; GUNICORN_WORKER_CLASS=sync pour revenir aux workers classiques
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+def on_starting(server):
+    """Vide le répertoire des métriques multi-processus au démarrage du maître"""
+    repertoire = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not repertoire:
+        return
+
+    shutil.rmtree(repertoire, ignore_errors=True)
+    os.makedirs(repertoire, exist_ok=True)
+
+def post_fork(server, worker):
+    """Rend psycopg2 coopératif dans les workers gevent (avant la première connexion du worker)
+
+    Sans psycogreen, une requête PostgreSQL bloque toute la boucle du worker, donc tous ses spectateurs.
+    SQLite reste bloquant: fichier local, requêtes de l'ordre de la milliseconde.
+    """
+    if 'gevent' not in type(worker).__module__:
+        return
+
+    try:
+        from psycogreen.gevent import patch_psycopg
+    except ImportError:
+        if os.environ.get('DATABASE_URL', '').startswith(('postgres://', 'postgresql://')):
+            server.log.warning("psycogreen non installé: les requêtes PostgreSQL bloquent les workers gevent")
+        return
+    patch_psycopg()
+
+def worker_exit(server, worker):
+    """Arrête les processus ffmpeg HLS lancés par le worker"""
+    try:
+        from diffusion_hls import gestionnaire_hls
+    except ImportError:
+        return
+    gestionnaire_hls.stop()
+
+def child_exit(server, worker):
+    """Retire les jauges "live" d'un worker terminé"""
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return
+
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
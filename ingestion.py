@@ -0,0 +1,245 @@
+"""
+Pipeline d'ingestion des pings des équipements
+Logique commune à /api/ping et aux autres modes de réception
+"""
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, or_
+from app import db
+from models import Equipement, HistoriquePing, Alerte
+from write_queue import write_queue
+from metrics import ALERTS_TOTAL, PINGS_TOTAL, PING_BATCH_SECONDS, PING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+class PingInvalide(ValueError):
+    """Données de ping invalides"""
+
+def valider_ping(data):
+    """Valide les données d'un ping et retourne (adresse_ip, equipement_id, reponse_ms, message)"""
+    if not data:
+        raise PingInvalide("Données JSON requises")
+
+    adresse_ip = data.get('ip')
+    equipement_id = data.get('equipement_id')
+
+    if not adresse_ip and not equipement_id:
+        raise PingInvalide("IP ou ID d'équipement requis")
+
+    return adresse_ip, equipement_id, data.get('response_time'), data.get('message', 'Ping reçu avec succès')
+
+def enregistrer_ping(adresse_ip=None, equipement_id=None, reponse_ms=None, message='Ping reçu avec succès'):
+    """Enregistre un ping reçu: dernier ping, historique et alerte de retour en ligne
+
+    Retourne l'identifiant de l'équipement, ou None s'il est introuvable.
+    """
+    # Trouver l'équipement
+    if equipement_id:
+        equipement = Equipement.query.get(equipement_id)
+    else:
+        equipement = Equipement.query.filter_by(adresse_ip=adresse_ip, actif=True).first()
+
+    if not equipement:
+        logger.warning(f"Équipement non trouvé pour IP: {adresse_ip}, ID: {equipement_id}")
+        return None
+
+    # Vérifier si l'équipement était hors ligne
+    etait_hors_ligne = not equipement.est_en_ligne
+
+    # Mettre à jour le dernier ping
+    maintenant = datetime.utcnow()
+    equipement.dernier_ping = maintenant
+
+    # Enregistrer dans l'historique
+    historique = HistoriquePing()
+    historique.equipement_id = equipement.id
+    historique.timestamp = maintenant
+    historique.statut = 'success'
+    historique.reponse_ms = reponse_ms
+    historique.message = message
+
+    db.session.add(historique)
+
+    # Créer une alerte si l'équipement revient en ligne
+    if etait_hors_ligne:
+        alerte = Alerte()
+        alerte.equipement_id = equipement.id
+        alerte.type_alerte = 'retour_en_ligne'
+        alerte.message = f"L'équipement {equipement.nom} ({equipement.adresse_ip}) est revenu en ligne"
+        alerte.timestamp = maintenant
+        db.session.add(alerte)
+        logger.info(f"Équipement {equipement.nom} revenu en ligne")
+
+    db.session.commit()
+
+    if etait_hors_ligne:
+        ALERTS_TOTAL.labels(type_alerte='retour_en_ligne').inc()
+
+    logger.debug(f"Ping reçu pour {equipement.nom} ({equipement.adresse_ip})")
+    return equipement.id
+
+_MAJ_DERNIER_PING = Equipement.__table__.update().where(
+    Equipement.__table__.c.id == bindparam('b_id')
+).values(dernier_ping=bindparam('b_dernier_ping'))
+
+def enregistrer_pings_par_lot(pings, session=None):
+    """Enregistre un lot de pings en quelques requêtes groupées
+
+    `pings` est une liste de dictionnaires avec les clés equipement_id ou adresse_ip, et
+    optionnellement reponse_ms, message, statut et timestamp. Même traitement que
+    enregistrer_ping: dernier ping, historique et alerte de retour en ligne.
+    Retourne le nombre de pings enregistrés (les équipements introuvables sont ignorés).
+    `session` permet d'utiliser une autre session que db.session (service d'ingestion asynchrone).
+    """
+    if not pings:
+        return 0
+    if session is None:
+        session = db.session
+
+    ids = {ping['equipement_id'] for ping in pings if ping.get('equipement_id')}
+    adresses = {ping['adresse_ip'] for ping in pings if not ping.get('equipement_id') and ping.get('adresse_ip')}
+
+    conditions = []
+    if ids:
+        conditions.append(Equipement.id.in_(ids))
+    if adresses:
+        conditions.append(Equipement.adresse_ip.in_(adresses) & (Equipement.actif == True))
+    if not conditions:
+        return 0
+
+    equipements = session.query(
+        Equipement.id, Equipement.nom, Equipement.adresse_ip, Equipement.dernier_ping, Equipement.actif
+    ).filter(or_(*conditions)).all()
+    par_id = {equipement.id: equipement for equipement in equipements}
+    par_adresse = {equipement.adresse_ip: equipement for equipement in equipements if equipement.actif}
+
+    maintenant = datetime.utcnow()
+    seuil_hors_ligne = maintenant - timedelta(minutes=2)
+    historique = []
+    derniers_pings = {}
+    for ping in pings:
+        if ping.get('equipement_id'):
+            equipement = par_id.get(ping['equipement_id'])
+        else:
+            equipement = par_adresse.get(ping.get('adresse_ip'))
+        if equipement is None:
+            continue
+
+        timestamp = ping.get('timestamp') or maintenant
+        historique.append({
+            'equipement_id': equipement.id,
+            'timestamp': timestamp,
+            'statut': ping.get('statut', 'success'),
+            'reponse_ms': ping.get('reponse_ms'),
+            'message': ping.get('message', 'Ping reçu avec succès'),
+        })
+        if ping.get('statut', 'success') == 'success':
+            derniers_pings[equipement.id] = max(timestamp, derniers_pings.get(equipement.id, timestamp))
+
+    if not historique:
+        return 0
+
+    # Équipements qui étaient hors ligne avant ce lot
+    alertes = [{
+        'equipement_id': equipement_id,
+        'type_alerte': 'retour_en_ligne',
+        'message': f"L'équipement {par_id[equipement_id].nom} ({par_id[equipement_id].adresse_ip}) est revenu en ligne",
+        'timestamp': dernier_ping,
+    } for equipement_id, dernier_ping in derniers_pings.items()
+        if par_id[equipement_id].dernier_ping is None or par_id[equipement_id].dernier_ping <= seuil_hors_ligne]
+
+    # Instructions Core (executemany) plutôt que l'ORM: plusieurs fois plus rapide sur de gros lots
+    if derniers_pings:
+        session.execute(_MAJ_DERNIER_PING, [
+            {'b_id': equipement_id, 'b_dernier_ping': dernier_ping}
+            for equipement_id, dernier_ping in derniers_pings.items()
+        ])
+    session.execute(HistoriquePing.__table__.insert(), historique)
+    if alertes:
+        session.execute(Alerte.__table__.insert(), alertes)
+    session.commit()
+
+    if alertes:
+        ALERTS_TOTAL.labels(type_alerte='retour_en_ligne').inc(len(alertes))
+        logger.info(f"{len(alertes)} équipement(s) revenu(s) en ligne")
+
+    return len(historique)
+
+class TamponPings:
+    """Regroupe les pings reçus et les écrit par lots depuis un thread dédié
+
+    `ajouter` ne bloque jamais: il peut être appelé depuis une boucle asyncio. Au-delà de
+    `taille_max` pings en attente (base trop lente), les nouveaux pings sont rejetés.
+    """
+
+    def __init__(self, app, transport, taille_lot=5000, intervalle=0.2, taille_max=200000):
+        self.app = app
+        self.transport = transport
+        self.taille_lot = taille_lot
+        self.intervalle = intervalle
+        self.taille_max = taille_max
+        self.lock = threading.Lock()
+        self.evenement = threading.Event()
+        self.en_attente = []
+        self.actif = False
+        self.thread = None
+
+    def demarrer(self):
+        self.actif = True
+        self.thread = threading.Thread(target=self._run, name=f"tampon-pings-{self.transport}", daemon=True)
+        self.thread.start()
+
+    def arreter(self):
+        """Arrête le thread après avoir écrit les pings en attente"""
+        self.actif = False
+        self.evenement.set()
+        if self.thread is not None:
+            self.thread.join(timeout=30.0)
+            self.thread = None
+
+    def ajouter(self, ping):
+        """Place un ping dans le tampon, retourne False s'il est rejeté"""
+        return self.ajouter_lot([ping]) == 1
+
+    def ajouter_lot(self, pings):
+        """Place plusieurs pings dans le tampon, retourne le nombre de pings acceptés"""
+        with self.lock:
+            acceptes = max(min(len(pings), self.taille_max - len(self.en_attente)), 0)
+            self.en_attente.extend(pings[:acceptes] if acceptes < len(pings) else pings)
+            plein = len(self.en_attente) >= self.taille_lot
+
+        if acceptes < len(pings):
+            PINGS_TOTAL.labels(transport=self.transport, status='dropped').inc(len(pings) - acceptes)
+        if plein:
+            self.evenement.set()
+        return acceptes
+
+    def _run(self):
+        """Boucle d'écriture (privé)"""
+        while self.actif or self.en_attente:
+            self.evenement.wait(self.intervalle)
+            self.evenement.clear()
+
+            with self.lock:
+                lot, self.en_attente = self.en_attente, []
+
+            for debut in range(0, len(lot), self.taille_lot):
+                self._ecrire(lot[debut:debut + self.taille_lot])
+
+    def _ecrire(self, lot):
+        debut = time.perf_counter()
+        try:
+            with self.app.app_context():
+                enregistres = write_queue.execute(enregistrer_pings_par_lot, lot)
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture d'un lot de {len(lot)} pings ({self.transport}): {e}")
+            PINGS_TOTAL.labels(transport=self.transport, status='error').inc(len(lot))
+            return
+
+        PING_BATCH_SECONDS.labels(transport=self.transport).observe(time.perf_counter() - debut)
+        PING_BATCH_SIZE.labels(transport=self.transport).observe(len(lot))
+        PINGS_TOTAL.labels(transport=self.transport, status='ok').inc(enregistres)
+        if enregistres < len(lot):
+            PINGS_TOTAL.labels(transport=self.transport, status='unknown').inc(len(lot) - enregistres)
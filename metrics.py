@@ -0,0 +1,167 @@
+"""
+Métriques Prometheus du système de monitoring
+Ingestion des pings, alertes, emails, tâches planifiées, flux de caméras et pools de connexions
+Compatible gunicorn multi-processus via PROMETHEUS_MULTIPROC_DIR (voir gunicorn.conf.py)
+"""
+import os
+import time
+import logging
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry,
+                                   generate_latest, CONTENT_TYPE_LATEST, REGISTRY, multiprocess)
+    from prometheus_client.core import GaugeMetricFamily
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = 'text/plain; version=0.0.4; charset=utf-8'
+
+class _MetriqueInactive:
+    """Métrique sans effet lorsque prometheus_client n'est pas installé"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, *args, **kwargs):
+        pass
+
+    def dec(self, *args, **kwargs):
+        pass
+
+    def set(self, *args, **kwargs):
+        pass
+
+    def observe(self, *args, **kwargs):
+        pass
+
+if not PROMETHEUS_AVAILABLE:
+    logger.warning("prometheus_client non installé: métriques désactivées")
+    Counter = Gauge = Histogram = _MetriqueInactive
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Ingestion des pings
+PING_LATENCY = Histogram('ping_handling_seconds', "Durée de traitement d'un ping",
+                         ['transport'], buckets=LATENCY_BUCKETS)
+PINGS_TOTAL = Counter('pings_received_total', 'Pings reçus', ['transport', 'status'])
+PING_BATCH_SECONDS = Histogram('ping_batch_write_seconds', "Durée d'écriture d'un lot de pings",
+                               ['transport'], buckets=JOB_BUCKETS)
+PING_BATCH_SIZE = Histogram('ping_batch_size', 'Nombre de pings par lot écrit', ['transport'],
+                            buckets=(1, 10, 100, 500, 1000, 5000, 10000, 50000))
+
+# Alertes et emails
+ALERTS_TOTAL = Counter('alerts_created_total', 'Alertes créées', ['type_alerte'])
+EMAILS_TOTAL = Counter('emails_sent_total', 'Emails envoyés', ['status'])
+
+# Tâches planifiées
+JOB_DURATION = Histogram('scheduler_job_duration_seconds', "Durée d'exécution des tâches planifiées",
+                         ['job'], buckets=JOB_BUCKETS)
+JOB_LAST_SUCCESS = Gauge('scheduler_job_last_success_timestamp_seconds',
+                         'Date de la dernière exécution réussie', ['job'], multiprocess_mode='max')
+JOB_FAILURES = Counter('scheduler_job_failures_total', 'Échecs des tâches planifiées', ['job'])
+EQUIPEMENTS_HORS_LIGNE = Gauge('equipements_hors_ligne', 'Équipements actifs hors ligne',
+                               multiprocess_mode='max')
+EQUIPEMENTS_ACTIFS = Gauge('equipements_actifs', 'Équipements actifs', multiprocess_mode='max')
+
+# Flux de caméras
+CAMERA_STREAMS_ACTIVE = Gauge('camera_streams_active', 'Flux de caméras actifs', multiprocess_mode='livesum')
+CAMERA_FRAMES_TOTAL = Counter('camera_frames_captured_total', 'Images capturées (rate() = fps)', ['camera'])
+CAMERA_LAST_FRAME = Gauge('camera_last_frame_timestamp_seconds', "Date de la dernière image capturée",
+                          ['camera'], multiprocess_mode='max')
+CAMERA_ENCODE_SECONDS = Histogram('camera_jpeg_encode_seconds', "Durée d'encodage JPEG d'une image",
+                                  ['camera'], buckets=LATENCY_BUCKETS)
+CAMERA_VIEWERS = Gauge('camera_viewers', 'Spectateurs MJPEG connectés', ['camera'], multiprocess_mode='livesum')
+CAMERA_FRAMES_SKIPPED_TOTAL = Counter('camera_frames_skipped_total',
+                                      'Images sautées pour les spectateurs lents (cadence adaptée)', ['camera'])
+CAMERA_RECONNECTS_TOTAL = Counter('camera_reconnects_total', 'Reconnexions de flux par le superviseur',
+                                  ['camera', 'result'])
+CAMERA_EVICTIONS_TOTAL = Counter('camera_streams_evicted_total', 'Flux retirés par le superviseur', ['reason'])
+CAMERA_CONNECT_SECONDS = Histogram('camera_connect_seconds', "Durée d'ouverture d'une connexion RTSP",
+                                   buckets=JOB_BUCKETS)
+CAMERA_SUPERVISOR_SECONDS = Histogram('camera_supervisor_check_seconds', "Durée d'une vérification des flux",
+                                      buckets=JOB_BUCKETS)
+CAMERA_SUPERVISOR_LAST_RUN = Gauge('camera_supervisor_last_run_timestamp_seconds',
+                                   'Date de la dernière vérification des flux', multiprocess_mode='max')
+CAMERA_MOTION_SCORE = Gauge('camera_motion_score', "Score d'activité (fraction de l'image en mouvement)",
+                            ['camera'], multiprocess_mode='max')
+CAMERA_MOTION_EVENTS_TOTAL = Counter('camera_motion_events_total', 'Événements de mouvement détectés', ['camera'])
+CAMERA_IMAGE_PROBLEMS_TOTAL = Counter('camera_image_problems_total', 'Images figées, noires ou uniformes détectées',
+                                      ['camera', 'state'])
+CAMERA_CLIPS_TOTAL = Counter('camera_clips_recorded_total', "Clips d'événements enregistrés", ['camera', 'trigger'])
+CAMERA_CLIPS_DELETED_TOTAL = Counter('camera_clips_deleted_total', 'Clips supprimés (quota ou rétention)', ['reason'])
+CAMERA_HLS_PROCESSES = Gauge('camera_hls_processes', 'Processus ffmpeg de diffusion HLS', multiprocess_mode='livesum')
+CAMERA_HLS_RESTARTS_TOTAL = Counter('camera_hls_restarts_total', 'Redémarrages des processus ffmpeg HLS',
+                                    ['camera', 'reason'])
+
+def mesurer_tache(nom):
+    """Décorateur: mesure la durée d'une tâche planifiée et date sa dernière exécution"""
+    def decorator(fonction):
+        @wraps(fonction)
+        def wrapper(*args, **kwargs):
+            debut = time.perf_counter()
+            try:
+                resultat = fonction(*args, **kwargs)
+            except Exception:
+                JOB_FAILURES.labels(job=nom).inc()
+                raise
+            finally:
+                JOB_DURATION.labels(job=nom).observe(time.perf_counter() - debut)
+            JOB_LAST_SUCCESS.labels(job=nom).set(time.time())
+            return resultat
+        return wrapper
+    return decorator
+
+if PROMETHEUS_AVAILABLE:
+    class PoolCollector:
+        """Expose l'état des pools de connexions du processus courant"""
+
+        def collect(self):
+            from db_pool import get_pool_metrics
+
+            pid = str(os.getpid())
+            in_use = GaugeMetricFamily('db_pool_in_use', 'Connexions empruntées', labels=['pool', 'pid'])
+            overflow = GaugeMetricFamily('db_pool_overflow', 'Connexions en débordement', labels=['pool', 'pid'])
+            checkouts = GaugeMetricFamily('db_pool_checkouts', 'Emprunts cumulés', labels=['pool', 'pid'])
+            wait = GaugeMetricFamily('db_pool_checkout_wait_seconds', "Temps d'attente cumulé à l'emprunt",
+                                     labels=['pool', 'pid'])
+            overflow_events = GaugeMetricFamily('db_pool_overflow_events', 'Débordements cumulés',
+                                                labels=['pool', 'pid'])
+            timeouts = GaugeMetricFamily('db_pool_timeouts', "Timeouts d'emprunt cumulés", labels=['pool', 'pid'])
+
+            for pool in get_pool_metrics():
+                labels = [pool['pool'], pid]
+                in_use.add_metric(labels, pool.get('in_use', 0))
+                overflow.add_metric(labels, pool.get('overflow', 0))
+                checkouts.add_metric(labels, pool['checkouts'])
+                wait.add_metric(labels, pool['wait_seconds_total'])
+                overflow_events.add_metric(labels, pool['overflow_events'])
+                timeouts.add_metric(labels, pool['timeouts'])
+
+            return [in_use, overflow, checkouts, wait, overflow_events, timeouts]
+
+def generer_metriques():
+    """Produit les métriques au format d'exposition texte de Prometheus"""
+    if not PROMETHEUS_AVAILABLE:
+        return None
+
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        # Agrège les métriques de tous les workers gunicorn
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(PoolCollector())
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry)
+
+if PROMETHEUS_AVAILABLE and not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # Mode mono-processus: le registre global expose aussi les pools
+    REGISTRY.register(PoolCollector())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Migrations du schéma de la base de données
+Chaque migration est appliquée une seule fois et enregistrée dans la table schema_migrations
+Usage: python migrations.py
+"""
+import logging
+import sys
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+def _creer_index_requetes_frequentes(connection):
+    """Ajoute les index des requêtes fréquentes (équipements, historique, alertes)"""
+    from models import Equipement, HistoriquePing, Alerte
+
+    for table in (Equipement.__table__, HistoriquePing.__table__, Alerte.__table__):
+        for index in table.indexes:
+            index.create(bind=connection, checkfirst=True)
+
+def _ajouter_veille_active(connection):
+    """Ajoute la colonne equipements.stream_standby (absente des bases créées avant elle)"""
+    colonnes = {colonne['name'] for colonne in inspect(connection).get_columns('equipements')}
+    if 'stream_standby' not in colonnes:
+        connection.execute(text("ALTER TABLE equipements ADD COLUMN stream_standby BOOLEAN DEFAULT FALSE"))
+
+# Liste ordonnée des migrations: (version, description, fonction)
+MIGRATIONS = [
+    (1, "Index des requêtes fréquentes", _creer_index_requetes_frequentes),
+    (2, "Veille active des flux de caméras", _ajouter_veille_active),
+]
+
+def _creer_table_versions(connection):
+    """Crée la table de suivi des migrations si nécessaire"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+def versions_appliquees(connection):
+    """Retourne l'ensemble des versions déjà appliquées"""
+    _creer_table_versions(connection)
+    rows = connection.execute(text("SELECT version FROM schema_migrations"))
+    return {row[0] for row in rows}
+
+def appliquer_migrations(engine):
+    """Applique les migrations manquantes dans l'ordre, chacune dans sa propre transaction"""
+    appliquees = []
+
+    with engine.begin() as connection:
+        deja_appliquees = versions_appliquees(connection)
+
+    for version, description, migration in MIGRATIONS:
+        if version in deja_appliquees:
+            continue
+
+        with engine.begin() as connection:
+            migration(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) "
+                     "VALUES (:version, :description, :applied_at)"),
+                {"version": version, "description": description, "applied_at": datetime.utcnow()}
+            )
+
+        logger.info(f"Migration {version} appliquée: {description}")
+        appliquees.append(version)
+
+    return appliquees
+
+if __name__ == '__main__':
+    from app import app, db
+
+    with app.app_context():
+        try:
+            versions = appliquer_migrations(db.engine)
+            if versions:
+                print(f"✅ Migrations appliquées: {', '.join(str(v) for v in versions)}")
+            else:
+                print("✅ Base de données à jour")
+        except Exception as e:
+            print(f"❌ Erreur lors de l'application des migrations: {e}")
+            sys.exit(1)
@@ -1,6 +1,6 @@
 from datetime import datetime, timedelta
 from app import db
-from sqlalchemy import func
+from sqlalchemy import func, case
 from flask_login import UserMixin
 import hashlib
 
@@ -57,19 +57,48 @@ class Client(db.Model):
     def __repr__(self):
         return f'<Client {self.nom}>'
     
+    @classmethod
+    def precharger_statistiques(cls, clients):
+        """Calcule en une seule requête les compteurs d'équipements d'une liste de clients"""
+        clients = [client for client in clients if client is not None]
+        if not clients:
+            return clients
+        
+        timeout = datetime.utcnow() - timedelta(minutes=2)
+        rows = db.session.query(
+            Equipement.client_id,
+            func.count(Equipement.id),
+            func.sum(case((Equipement.dernier_ping > timeout, 1), else_=0))
+        ).filter(
+            Equipement.client_id.in_([client.id for client in clients]),
+            Equipement.actif == True
+        ).group_by(Equipement.client_id).all()
+        
+        stats = {client_id: (total, int(en_ligne or 0)) for client_id, total, en_ligne in rows}
+        for client in clients:
+            client._stats_equipements = stats.get(client.id, (0, 0))
+        return clients
+    
+    def _get_stats_equipements(self):
+        """Retourne (total, en ligne), préchargés si possible"""
+        stats = getattr(self, '_stats_equipements', None)
+        if stats is None:
+            Client.precharger_statistiques([self])
+            stats = self._stats_equipements
+        return stats
+    
     @property
     def nb_equipements_total(self):
-        return db.session.query(Equipement).filter_by(client_id=self.id, actif=True).count()
+        return self._get_stats_equipements()[0]
     
     @property
     def nb_equipements_en_ligne(self):
-        equipements = db.session.query(Equipement).filter_by(client_id=self.id, actif=True).all()
-        return len([eq for eq in equipements if eq.est_en_ligne])
+        return self._get_stats_equipements()[1]
     
     @property
     def nb_equipements_hors_ligne(self):
-        equipements = db.session.query(Equipement).filter_by(client_id=self.id, actif=True).all()
-        return len([eq for eq in equipements if not eq.est_en_ligne])
+        total, en_ligne = self._get_stats_equipements()
+        return total - en_ligne
 
 class Equipement(db.Model):
     __tablename__ = 'equipements'
@@ -92,6 +121,7 @@ class Equipement(db.Model):
     resolution = db.Column(db.String(20), default='640x480')  # Résolution préférée
     fps = db.Column(db.Integer, default=15)  # Images par seconde
     stream_quality = db.Column(db.String(20), default='medium')  # low, medium, high
+    stream_standby = db.Column(db.Boolean, default=False)  # Veille active: connexion maintenue sans spectateur
     
     # Relation avec l'historique des pings
     historique_pings = db.relationship('HistoriquePing', backref='equipement', lazy=True, cascade='all, delete-orphan')
@@ -178,7 +208,7 @@ class Alerte(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     equipement_id = db.Column(db.Integer, db.ForeignKey('equipements.id'), nullable=False)
-    type_alerte = db.Column(db.String(50), nullable=False)  # 'hors_ligne', 'retour_en_ligne'
+    type_alerte = db.Column(db.String(50), nullable=False)  # 'hors_ligne', 'retour_en_ligne', 'image_figee', 'image_noire', 'image_uniforme', 'image_retablie'
     message = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     lue = db.Column(db.Boolean, default=False)
@@ -188,3 +218,12 @@ class Alerte(db.Model):
     
     def __repr__(self):
         return f'<Alerte {self.type_alerte} - {self.equipement_id}>'
+
+# Index pour les formes de requêtes fréquentes (voir migrations.py et verifier_index.py)
+db.Index('ix_equipements_client_actif', Equipement.client_id, Equipement.actif)
+db.Index('ix_equipements_adresse_ip', Equipement.adresse_ip)
+db.Index('ix_historique_pings_equipement_timestamp', HistoriquePing.equipement_id, HistoriquePing.timestamp.desc())
+db.Index('ix_historique_pings_timestamp', HistoriquePing.timestamp)
+db.Index('ix_alertes_equipement_type_timestamp', Alerte.equipement_id, Alerte.type_alerte, Alerte.timestamp)
+db.Index('ix_alertes_lue', Alerte.lue)
+db.Index('ix_alertes_timestamp', Alerte.timestamp)
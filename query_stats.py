@@ -0,0 +1,203 @@
+"""
+Comptage et chronométrage des requêtes SQL exécutées
+Permet de fixer un budget de requêtes par route (vérifié en mode test) et de
+profiler chaque route: nombre de requêtes, temps passé en base, requêtes les plus lentes
+"""
+import os
+import time
+import heapq
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+class QueryBudgetExceeded(AssertionError):
+    """Une route a exécuté plus de requêtes SQL que son budget"""
+
+class QueryCounter:
+    """Compte et chronomètre les requêtes SQL exécutées par le thread courant"""
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+        self.statements = []  # (durée en secondes, requête)
+
+    def __enter__(self):
+        if not hasattr(_local, 'counters'):
+            _local.counters = []
+        _local.counters.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self in _local.counters:
+            _local.counters.remove(self)
+        return False
+
+def compteurs_actifs():
+    """Compteurs actifs du thread courant (à transmettre au thread qui exécute une écriture pour lui)"""
+    return list(getattr(_local, 'counters', ()))
+
+@contextmanager
+def compter_pour(compteurs):
+    """Attribue aussi aux `compteurs` d'un autre thread les requêtes exécutées ici (thread d'écriture)"""
+    precedents = getattr(_local, 'counters', [])
+    _local.counters = precedents + [c for c in compteurs if c not in precedents]
+    try:
+        yield
+    finally:
+        _local.counters = precedents
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _debut_requete(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _fin_requete(conn, cursor, statement, parameters, context, executemany):
+    duree = time.perf_counter() - conn.info['query_start_time'].pop()
+
+    for counter in getattr(_local, 'counters', ()):
+        counter.count += 1
+        counter.db_time += duree
+        counter.statements.append((duree, statement))
+
+    if duree * 1000 >= perf_registry.slow_query_ms:
+        logger.warning(f"Requête SQL lente ({duree * 1000:.1f} ms): {statement}")
+
+@event.listens_for(Engine, "handle_error")
+def _erreur_requete(context):
+    # after_cursor_execute n'est pas appelé en cas d'erreur: dépiler le chronomètre
+    if context.connection is not None:
+        debuts = context.connection.info.get('query_start_time')
+        if debuts:
+            debuts.pop()
+
+def query_budget(budget):
+    """Décorateur de route: en mode test, échoue si la vue dépasse `budget` requêtes SQL"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.testing:
+                return view(*args, **kwargs)
+
+            with QueryCounter() as counter:
+                response = view(*args, **kwargs)
+
+            if counter.count > budget:
+                details = "\n".join(statement for _, statement in counter.statements)
+                raise QueryBudgetExceeded(
+                    f"{view.__name__}: {counter.count} requêtes SQL pour un budget de {budget}\n{details}"
+                )
+            return response
+        return wrapper
+    return decorator
+
+class EndpointStats:
+    """Statistiques cumulées d'une route"""
+
+    def __init__(self, endpoint, max_slowest):
+        self.endpoint = endpoint
+        self.max_slowest = max_slowest
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.total_time = 0.0
+        self.slowest = []  # tas des (durée, requête) les plus lentes
+
+    def record(self, counter, duree_totale):
+        self.requests += 1
+        self.queries += counter.count
+        self.max_queries = max(self.max_queries, counter.count)
+        self.db_time += counter.db_time
+        self.total_time += duree_totale
+
+        for duree, statement in counter.statements:
+            if len(self.slowest) < self.max_slowest:
+                heapq.heappush(self.slowest, (duree, statement))
+            elif duree > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (duree, statement))
+
+    def to_dict(self):
+        requests = self.requests or 1
+        return {
+            'endpoint': self.endpoint,
+            'requests': self.requests,
+            'queries': self.queries,
+            'avg_queries': round(self.queries / requests, 2),
+            'max_queries': self.max_queries,
+            'db_time_ms': round(self.db_time * 1000, 2),
+            'avg_db_time_ms': round(self.db_time * 1000 / requests, 2),
+            'avg_time_ms': round(self.total_time * 1000 / requests, 2),
+            'slowest': [{'duration_ms': round(duree * 1000, 2), 'statement': statement}
+                        for duree, statement in sorted(self.slowest, reverse=True)],
+        }
+
+class PerfRegistry:
+    """Profilage SQL par route, alimenté par les hooks de requête Flask"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.enabled = os.environ.get('PERF_PROFILING', '1') != '0'
+        self.slow_query_ms = float(os.environ.get('PERF_SLOW_QUERY_MS', 200))
+        self.max_slowest = int(os.environ.get('PERF_MAX_SLOWEST', 5))
+
+    def init_app(self, app):
+        """Enregistre les hooks before_request/after_request de profilage"""
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _demarrer_profilage():
+            if request.endpoint == 'static':
+                return
+            g._perf_debut = time.perf_counter()
+            g._perf_counter = QueryCounter().__enter__()
+
+        @app.after_request
+        def _terminer_profilage(response):
+            counter = g.pop('_perf_counter', None)
+            if counter is None:
+                return response
+
+            counter.__exit__(None, None, None)
+            duree_totale = time.perf_counter() - g._perf_debut
+            self.record(request.endpoint or 'inconnu', counter, duree_totale)
+
+            response.headers.add('Server-Timing', f'db;dur={counter.db_time * 1000:.2f};desc="SQL ({counter.count})"')
+            response.headers.add('Server-Timing', f'app;dur={duree_totale * 1000:.2f}')
+            return response
+
+        @app.teardown_request
+        def _nettoyer_profilage(exc):
+            # after_request n'est pas appelé si la vue a levé une exception
+            counter = g.pop('_perf_counter', None)
+            if counter is not None:
+                counter.__exit__(None, None, None)
+
+    def record(self, endpoint, counter, duree_totale):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(endpoint, self.max_slowest)
+            stats.record(counter, duree_totale)
+
+    def snapshot(self):
+        """Retourne les statistiques de toutes les routes, les plus coûteuses en base d'abord"""
+        with self.lock:
+            data = [stats.to_dict() for stats in self.endpoints.values()]
+        return sorted(data, key=lambda stats: stats['db_time_ms'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+# Instance globale du profilage
+perf_registry = PerfRegistry()
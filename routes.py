@@ -1,18 +1,34 @@
+import asyncio
 import logging
 import os
-from datetime import datetime, timedelta
-from flask import render_template, request, jsonify, flash, redirect, url_for, session, Response
+import hmac
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from flask import render_template, request, jsonify, flash, redirect, url_for, session, Response, send_from_directory
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
 from app import app, db
 from models import Client, Equipement, HistoriquePing, Alerte, User
 from email_service import email_service
+from ingestion import valider_ping, enregistrer_ping, enregistrer_pings_par_lot, PingInvalide
+from write_queue import write_queue
+from db_pool import get_db_role, get_pool_metrics
+from query_stats import query_budget, perf_registry
+from metrics import generer_metriques, CONTENT_TYPE_LATEST, PING_LATENCY, PINGS_TOTAL
+from sondeur import sonder_equipement
+from diffusion_hls import gestionnaire_hls, CAMERA_HLS, PLAYLIST_HLS, TYPES_HLS
 
 logger = logging.getLogger(__name__)
 
 # Importer le gestionnaire de caméras seulement si les streams sont activés
 if os.environ.get('DISABLE_CAMERA_STREAMS') != '1':
     try:
-        from camera_stream import camera_manager, generate_stream_response
+        from camera_stream import (camera_manager, generate_stream_response, generate_mosaic_response,
+                                   resoudre_profil, CAMERA_MOSAIC_MAX, CAMERA_SNAPSHOT_MAX_AGE)
+        from enregistrement import ecrivain_clips, CAMERA_CLIPS
     except ImportError as e:
         logger.warning(f"Camera streaming non disponible: {e}")
         camera_manager = None
@@ -125,6 +141,7 @@ def register():
     return render_template('register.html')
 
 @app.route('/')
+@query_budget(10)
 @login_required
 def dashboard():
     """Page d'accueil avec vue d'ensemble du système"""
@@ -134,7 +151,7 @@ def dashboard():
             total_clients = Client.query.filter_by(actif=True).count()
             total_equipements = Equipement.query.filter_by(actif=True).count()
             equipements = Equipement.query.filter_by(actif=True).all()
-            clients = Client.query.filter_by(actif=True).all()
+            clients = Client.query.options(selectinload(Client.equipements)).filter_by(actif=True).all()
         else:
             # Pour les clients, afficher seulement leurs données
             total_clients = 1 if current_user.client_id else 0
@@ -142,6 +159,8 @@ def dashboard():
             equipements = Equipement.query.filter_by(client_id=current_user.client_id, actif=True).all()
             clients = [current_user.client] if current_user.client else []
         
+        Client.precharger_statistiques(clients)
+        
         # Compter les équipements en ligne et hors ligne
         equipements_en_ligne = 0
         equipements_hors_ligne = 0
@@ -155,14 +174,16 @@ def dashboard():
         # Alertes non lues (filtrées par client si nécessaire)
         if current_user.role == 'admin':
             alertes_non_lues = Alerte.query.filter_by(lue=False).count()
-            dernieres_alertes = Alerte.query.order_by(Alerte.timestamp.desc()).limit(10).all()
+            dernieres_alertes = Alerte.query.options(joinedload(Alerte.equipement)).order_by(Alerte.timestamp.desc()).limit(10).all()
         else:
             # Pour les clients, ne montrer que leurs alertes
             alertes_non_lues = db.session.query(Alerte).join(Equipement).filter(
                 Equipement.client_id == current_user.client_id,
                 Alerte.lue == False
             ).count()
-            dernieres_alertes = db.session.query(Alerte).join(Equipement).filter(
+            dernieres_alertes = db.session.query(Alerte).join(Equipement).options(
+                contains_eager(Alerte.equipement)
+            ).filter(
                 Equipement.client_id == current_user.client_id
             ).order_by(Alerte.timestamp.desc()).limit(10).all()
         
@@ -184,6 +205,7 @@ def dashboard():
         return render_template('dashboard.html', stats={}, clients=[], dernieres_alertes=[])
 
 @app.route('/clients')
+@query_budget(4)
 @login_required
 def clients():
     """Page de gestion des clients (admin seulement)"""
@@ -192,7 +214,7 @@ def clients():
         return redirect(url_for('dashboard'))
     
     try:
-        clients_list = Client.query.filter_by(actif=True).all()
+        clients_list = Client.precharger_statistiques(Client.query.filter_by(actif=True).all())
         return render_template('clients.html', clients=clients_list)
     except Exception as e:
         logger.error(f"Erreur dans clients: {e}")
@@ -200,16 +222,19 @@ def clients():
         return render_template('clients.html', clients=[])
 
 @app.route('/equipements')
+@query_budget(5)
 @login_required
 def equipements():
     """Page de gestion des équipements"""
     try:
         if current_user.role == 'admin':
-            equipements_list = Equipement.query.filter_by(actif=True).all()
+            equipements_list = Equipement.query.options(joinedload(Equipement.client)).filter_by(actif=True).all()
             clients_list = Client.query.filter_by(actif=True).all()
         else:
             # Pour les clients, afficher seulement leurs équipements
-            equipements_list = Equipement.query.filter_by(client_id=current_user.client_id, actif=True).all()
+            equipements_list = Equipement.query.options(joinedload(Equipement.client)).filter_by(
+                client_id=current_user.client_id, actif=True
+            ).all()
             clients_list = [current_user.client] if current_user.client else []
         
         return render_template('equipements.html', equipements=equipements_list, clients=clients_list)
@@ -219,6 +244,7 @@ def equipements():
         return render_template('equipements.html', equipements=[], clients=[])
 
 @app.route('/historique')
+@query_budget(5)
 @login_required
 def historique():
     """Page d'historique des pings"""
@@ -227,10 +253,14 @@ def historique():
         per_page = 50
         
         if current_user.role == 'admin':
-            historique_query = HistoriquePing.query.order_by(HistoriquePing.timestamp.desc())
+            historique_query = HistoriquePing.query.options(
+                joinedload(HistoriquePing.equipement).joinedload(Equipement.client)
+            ).order_by(HistoriquePing.timestamp.desc())
         else:
             # Pour les clients, filtrer par leurs équipements
-            historique_query = db.session.query(HistoriquePing).join(Equipement).filter(
+            historique_query = db.session.query(HistoriquePing).join(Equipement).options(
+                contains_eager(HistoriquePing.equipement).joinedload(Equipement.client)
+            ).filter(
                 Equipement.client_id == current_user.client_id
             ).order_by(HistoriquePing.timestamp.desc())
         
@@ -265,15 +295,20 @@ def historique():
         return render_template('history.html', historique=None)
 
 @app.route('/alertes')
+@query_budget(3)
 @login_required
 def alertes():
     """Page des alertes"""
     try:
         if current_user.role == 'admin':
-            alertes_list = Alerte.query.order_by(Alerte.timestamp.desc()).all()
+            alertes_list = Alerte.query.options(
+                joinedload(Alerte.equipement).joinedload(Equipement.client)
+            ).order_by(Alerte.timestamp.desc()).all()
         else:
             # Pour les clients, filtrer par leurs équipements
-            alertes_list = db.session.query(Alerte).join(Equipement).filter(
+            alertes_list = db.session.query(Alerte).join(Equipement).options(
+                contains_eager(Alerte.equipement).joinedload(Equipement.client)
+            ).filter(
                 Equipement.client_id == current_user.client_id
             ).order_by(Alerte.timestamp.desc()).all()
         
@@ -287,71 +322,41 @@ def alertes():
 @app.route('/api/ping', methods=['POST'])
 def recevoir_ping():
     """Endpoint pour recevoir les pings des équipements"""
+    debut = time.perf_counter()
+    statut = 'error'
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({"error": "Données JSON requises"}), 400
-        
-        adresse_ip = data.get('ip')
-        equipement_id = data.get('equipement_id')
-        
-        if not adresse_ip and not equipement_id:
-            return jsonify({"error": "IP ou ID d'équipement requis"}), 400
+        try:
+            adresse_ip, equipement_id, reponse_ms, message = valider_ping(request.get_json(silent=True))
+        except PingInvalide as e:
+            statut = 'invalid'
+            return jsonify({"error": str(e)}), 400
         
-        # Trouver l'équipement
-        if equipement_id:
-            equipement = Equipement.query.get(equipement_id)
-        else:
-            equipement = Equipement.query.filter_by(adresse_ip=adresse_ip, actif=True).first()
+        # Écriture sérialisée par la file d'écriture (SQLite)
+        equipement_id = write_queue.execute(enregistrer_ping, adresse_ip, equipement_id, reponse_ms, message)
         
-        if not equipement:
-            logger.warning(f"Équipement non trouvé pour IP: {adresse_ip}, ID: {equipement_id}")
+        if not equipement_id:
+            statut = 'unknown'
             return jsonify({"error": "Équipement non trouvé"}), 404
         
-        # Vérifier si l'équipement était hors ligne
-        etait_hors_ligne = not equipement.est_en_ligne
-        
-        # Mettre à jour le dernier ping
-        equipement.dernier_ping = datetime.utcnow()
-        
-        # Enregistrer dans l'historique
-        historique = HistoriquePing()
-        historique.equipement_id = equipement.id
-        historique.timestamp = datetime.utcnow()
-        historique.statut = 'success'
-        historique.reponse_ms = data.get('response_time')
-        historique.message = data.get('message', 'Ping reçu avec succès')
-        
-        db.session.add(historique)
-        
-        # Créer une alerte si l'équipement revient en ligne
-        if etait_hors_ligne:
-            alerte = Alerte()
-            alerte.equipement_id = equipement.id
-            alerte.type_alerte = 'retour_en_ligne'
-            alerte.message = f"L'équipement {equipement.nom} ({equipement.adresse_ip}) est revenu en ligne"
-            alerte.timestamp = datetime.utcnow()
-            db.session.add(alerte)
-            logger.info(f"Équipement {equipement.nom} revenu en ligne")
-        
-        db.session.commit()
-        
-        logger.debug(f"Ping reçu pour {equipement.nom} ({equipement.adresse_ip})")
-        
+        statut = 'ok'
         return jsonify({
             "status": "success",
             "message": "Ping reçu",
-            "equipement_id": equipement.id,
+            "equipement_id": equipement_id,
             "timestamp": datetime.utcnow().isoformat()
         })
         
     except Exception as e:
         logger.error(f"Erreur lors du traitement du ping: {e}")
         return jsonify({"error": "Erreur interne du serveur"}), 500
+    
+    finally:
+        PINGS_TOTAL.labels(transport='http', status=statut).inc()
+        PING_LATENCY.labels(transport='http').observe(time.perf_counter() - debut)
 
 # Routes d'administration (admin seulement)
 @app.route('/admin/users')
+@query_budget(3)
 @login_required
 def admin_users():
     """Page d'administration des utilisateurs (admin seulement)"""
@@ -360,7 +365,7 @@ def admin_users():
         return redirect(url_for('dashboard'))
     
     try:
-        users_list = User.query.filter_by(actif=True).all()
+        users_list = User.query.options(joinedload(User.client)).filter_by(actif=True).all()
         return render_template('admin_users.html', users=users_list)
     except Exception as e:
         logger.error(f"Erreur dans admin_users: {e}")
@@ -427,8 +432,70 @@ def reject_user(user_id):
     
     return redirect(url_for('admin_users'))
 
+@app.route('/api/admin/db_pool')
+@login_required
+def api_db_pool():
+    """API des métriques des pools de connexions (admin seulement)"""
+    if current_user.role != 'admin':
+        return jsonify({"error": "Accès refusé"}), 403
+    
+    return jsonify({
+        'role': get_db_role(),
+        'pools': get_pool_metrics()
+    })
+
+@app.route('/admin/perf')
+@login_required
+def admin_perf():
+    """Profilage SQL par route (admin seulement)"""
+    if current_user.role != 'admin':
+        flash('Accès refusé : réservé aux administrateurs.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    return render_template('admin_perf.html',
+                         endpoints=perf_registry.snapshot(),
+                         slow_query_ms=perf_registry.slow_query_ms,
+                         pools=get_pool_metrics())
+
+@app.route('/admin/perf/reset', methods=['POST'])
+@login_required
+def admin_perf_reset():
+    """Remet à zéro le profilage SQL (admin seulement)"""
+    if current_user.role != 'admin':
+        flash('Accès refusé : réservé aux administrateurs.', 'error')
+        return redirect(url_for('dashboard'))
+    
+    perf_registry.reset()
+    flash('Statistiques de performance remises à zéro.', 'success')
+    return redirect(url_for('admin_perf'))
+
+@app.route('/api/admin/perf')
+@login_required
+def api_admin_perf():
+    """API du profilage SQL par route (admin seulement)"""
+    if current_user.role != 'admin':
+        return jsonify({"error": "Accès refusé"}), 403
+    
+    return jsonify(perf_registry.snapshot())
+
+@app.route('/metrics')
+def metrics():
+    """Métriques Prometheus (protégées par METRICS_TOKEN si défini)"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        fourni = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(fourni, token):
+            return Response("Accès refusé\n", status=401, mimetype='text/plain')
+    
+    donnees = generer_metriques()
+    if donnees is None:
+        return Response("prometheus_client non installé\n", status=503, mimetype='text/plain')
+    
+    return Response(donnees, content_type=CONTENT_TYPE_LATEST)
+
 # AJAX Routes pour les mises à jour en temps réel
 @app.route('/api/stats')
+@query_budget(6)
 @login_required
 def api_stats():
     """API pour obtenir les statistiques en temps réel"""
@@ -466,6 +533,7 @@ def api_stats():
         return jsonify({'error': 'Erreur lors du chargement des statistiques'}), 500
 
 @app.route('/api/equipements/status')
+@query_budget(3)
 @login_required
 def api_equipements_status():
     """API pour obtenir le statut des équipements en temps réel"""
@@ -493,6 +561,34 @@ def api_equipements_status():
         logger.error(f"Erreur dans api_equipements_status: {e}")
         return jsonify({'error': 'Erreur lors du chargement du statut des équipements'}), 500
 
+@app.route('/api/equipement/<int:equipement_id>/test-connexion', methods=['POST'])
+@login_required
+def tester_connexion_equipement(equipement_id):
+    """Sonde immédiatement un équipement (TCP ou RTSP OPTIONS) et enregistre le résultat"""
+    try:
+        equipement = Equipement.query.get(equipement_id)
+        if not equipement:
+            return jsonify({"error": "Équipement non trouvé"}), 404
+
+        if current_user.role == 'client' and equipement.client_id != current_user.client_id:
+            return jsonify({"error": "Accès refusé"}), 403
+
+        resultat = asyncio.run(sonder_equipement(equipement.adresse_ip, equipement.port, equipement.rtsp_url))
+        write_queue.execute(enregistrer_pings_par_lot, [{
+            'equipement_id': equipement.id,
+            'statut': resultat.statut,
+            'reponse_ms': resultat.reponse_ms,
+            'message': f"Test de connexion {resultat.message}",
+        }])
+
+        if resultat.succes:
+            return jsonify({"status": "success", "message": f"{resultat.message} ({resultat.reponse_ms} ms)"})
+        return jsonify({"error": resultat.message}), 502
+
+    except Exception as e:
+        logger.error(f"Erreur test de connexion équipement {equipement_id}: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
 # Routes pour les flux de caméras RTSP
 @app.route('/camera/<int:camera_id>/stream')
 @login_required
@@ -516,13 +612,17 @@ def camera_stream(camera_id):
         if not equipement.has_stream_capability:
             return jsonify({"error": "Streaming non configuré pour cette caméra"}), 400
         
+        # Profil demandé (?profile=thumbnail|medium|full), sinon qualité configurée pour la caméra
+        profil = resoudre_profil(request.args.get('profile'), equipement.stream_quality)
+        if profil is None:
+            return jsonify({"error": "Profil de flux inconnu"}), 400
+        
         # Démarrer le flux si pas encore actif
-        if not camera_manager.get_stream(camera_id):
-            if not camera_manager.start_camera_stream(equipement):
-                return jsonify({"error": "Impossible de démarrer le flux"}), 500
+        if not camera_manager.ensure_camera_stream(equipement):
+            return jsonify({"error": "Impossible de démarrer le flux"}), 500
         
         # Retourner le flux MJPEG
-        return generate_stream_response(camera_id)
+        return generate_stream_response(camera_id, profil)
         
     except Exception as e:
         logger.error(f"Erreur flux caméra {camera_id}: {e}")
@@ -548,12 +648,33 @@ def camera_snapshot(camera_id):
         if not equipement.has_stream_capability:
             return jsonify({"error": "Streaming non configuré"}), 400
         
-        # Obtenir l'instantané
-        jpeg_data = camera_manager.get_snapshot(camera_id)
-        if jpeg_data:
-            return Response(jpeg_data, mimetype='image/jpeg')
-        else:
+        profil = resoudre_profil(request.args.get('profile'), 'full')
+        if profil is None:
+            return jsonify({"error": "Profil de flux inconnu"}), 400
+        
+        # Obtenir l'instantané (flux redémarré s'il a été arrêté faute de spectateur)
+        if not camera_manager.ensure_camera_stream(equipement):
+            return jsonify({"error": "Impossible de démarrer le flux"}), 500
+        instantane = camera_manager.get_snapshot(camera_id, profil)
+        if instantane is None:
+            return jsonify({"error": "Pas d'image disponible"}), 404
+        
+        # Scène inchangée depuis la dernière requête du client: 304 sans encodage
+        reponse = Response(mimetype='image/jpeg')
+        reponse.set_etag(instantane.etag, weak=True)
+        reponse.last_modified = datetime.fromtimestamp(int(instantane.modifie), timezone.utc)
+        reponse.cache_control.private = True
+        reponse.cache_control.max_age = CAMERA_SNAPSHOT_MAX_AGE
+        if not is_resource_modified(request.environ, etag=instantane.etag,
+                                    last_modified=reponse.last_modified):
+            reponse.status_code = 304
+            return reponse
+        
+        jpeg_data = instantane.jpeg
+        if not jpeg_data:
             return jsonify({"error": "Pas d'image disponible"}), 404
+        reponse.set_data(jpeg_data)
+        return reponse
             
     except Exception as e:
         logger.error(f"Erreur snapshot caméra {camera_id}: {e}")
@@ -597,12 +718,123 @@ def stop_camera_stream_route(camera_id):
             return jsonify({"error": "Accès refusé"}), 403
         
         success = camera_manager.stop_camera_stream(camera_id)
+        success = gestionnaire_hls.arreter(camera_id) or success
         return jsonify({"status": "success", "stopped": success})
         
     except Exception as e:
         logger.error(f"Erreur arrêt flux caméra {camera_id}: {e}")
         return jsonify({"error": "Erreur interne du serveur"}), 500
 
+@app.route('/camera/<int:camera_id>/clip', methods=['POST'])
+@login_required
+def request_camera_clip(camera_id):
+    """Demande l'enregistrement d'un clip (pré-enregistrement + post-enregistrement)"""
+    try:
+        if camera_manager is None or not CAMERA_CLIPS:
+            return jsonify({"error": "Enregistrement des clips non disponible"}), 503
+        
+        equipement = Equipement.query.get(camera_id)
+        if not equipement:
+            return jsonify({"error": "Caméra non trouvée"}), 404
+        
+        if current_user.role == 'client' and equipement.client_id != current_user.client_id:
+            return jsonify({"error": "Accès refusé"}), 403
+        
+        if not camera_manager.ensure_camera_stream(equipement) or not camera_manager.request_clip(camera_id):
+            return jsonify({"error": "Flux inactif"}), 409
+        return jsonify({"status": "success", "message": "Clip demandé"}), 202
+        
+    except Exception as e:
+        logger.error(f"Erreur demande de clip caméra {camera_id}: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
+@app.route('/api/camera/<int:camera_id>/clips')
+@login_required
+def camera_clips_api(camera_id):
+    """Clips enregistrés d'une caméra (les plus récents d'abord)"""
+    try:
+        if camera_manager is None:
+            return jsonify({"error": "Streaming de caméras non disponible"}), 503
+        
+        equipement = Equipement.query.get(camera_id)
+        if not equipement:
+            return jsonify({"error": "Caméra non trouvée"}), 404
+        
+        if current_user.role == 'client' and equipement.client_id != current_user.client_id:
+            return jsonify({"error": "Accès refusé"}), 403
+        
+        return jsonify([{
+            'name': clip['name'],
+            'size': clip['size'],
+            'date': datetime.fromtimestamp(clip['date']).isoformat(),
+            'url': url_for('camera_clip_file', camera_id=camera_id, nom=clip['name']),
+        } for clip in ecrivain_clips.lister(camera_id)])
+        
+    except Exception as e:
+        logger.error(f"Erreur liste des clips caméra {camera_id}: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
+@app.route('/camera/<int:camera_id>/clips/<nom>')
+@login_required
+def camera_clip_file(camera_id, nom):
+    """Téléchargement d'un clip (AVI MJPEG)"""
+    if camera_manager is None:
+        return jsonify({"error": "Streaming de caméras non disponible"}), 503
+    
+    equipement = Equipement.query.get(camera_id)
+    if not equipement:
+        return jsonify({"error": "Caméra non trouvée"}), 404
+    
+    if current_user.role == 'client' and equipement.client_id != current_user.client_id:
+        return jsonify({"error": "Accès refusé"}), 403
+    
+    return send_from_directory(os.path.join(ecrivain_clips.dossier, str(camera_id)), nom,
+                               mimetype='video/x-msvideo')
+
+@app.route('/camera/<int:camera_id>/hls/<nom>')
+@login_required
+def camera_hls(camera_id, nom):
+    """Flux HLS (playlist et segments) remultiplexé par ffmpeg sans réencodage"""
+    try:
+        if not CAMERA_HLS or not gestionnaire_hls.disponible:
+            return jsonify({"error": "Diffusion HLS non disponible"}), 503
+        
+        type_mime = TYPES_HLS.get(os.path.splitext(nom)[1])
+        if type_mime is None:
+            return jsonify({"error": "Fichier inconnu"}), 404
+        
+        equipement = Equipement.query.get(camera_id)
+        if not equipement:
+            return jsonify({"error": "Caméra non trouvée"}), 404
+        
+        if current_user.role == 'client' and equipement.client_id != current_user.client_id:
+            return jsonify({"error": "Accès refusé"}), 403
+        
+        if not equipement.has_stream_capability:
+            return jsonify({"error": "Streaming non configuré pour cette caméra"}), 400
+        
+        if nom == PLAYLIST_HLS:
+            # Démarre ffmpeg au premier spectateur; la première playlist arrive après un segment
+            if not gestionnaire_hls.acceder(equipement):
+                return jsonify({"error": "Impossible de démarrer le flux HLS"}), 500
+            if not gestionnaire_hls.playlist_prete(camera_id):
+                # Pas d'attente dans la requête: le lecteur réessaie après Retry-After
+                return jsonify({"status": "starting", "message": "Flux HLS en cours de démarrage"}), 202, \
+                    {'Retry-After': '1', 'Cache-Control': 'no-store'}
+        else:
+            gestionnaire_hls.signaler_acces(camera_id)
+        
+        response = send_from_directory(gestionnaire_hls.dossier_camera(camera_id), nom, mimetype=type_mime)
+        # Segments: noms uniques, mis en cache; playlist et segment d'initialisation: toujours revalidés
+        response.headers['Cache-Control'] = 'private, max-age=60' if nom.endswith('.m4s') else 'no-cache'
+        return response
+        
+    except NotFound:
+        return jsonify({"error": "Segment expiré"}), 404
+    except Exception as e:
+        logger.error(f"Erreur flux HLS caméra {camera_id}: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
 @app.route('/api/cameras/streams_status')
 @login_required
 def streams_status_api():
@@ -622,6 +854,70 @@ def streams_status_api():
         logger.error(f"Erreur API statut streams: {e}")
         return jsonify({"error": "Erreur interne du serveur"}), 500
 
+@app.route('/cameras/mosaic')
+@login_required
+def cameras_mosaic():
+    """Mosaïque MJPEG de plusieurs caméras: une seule connexion et un encodage par image
+
+    Paramètres: ids=1,2,3 (toutes les caméras accessibles par défaut), cols (colonnes),
+    tile=320x240 (taille d'une tuile), order=activity (caméras les plus actives en premier).
+    """
+    try:
+        if camera_manager is None:
+            return jsonify({"error": "Streaming de caméras non disponible"}), 503
+        
+        try:
+            ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip()]
+            largeur, hauteur = (int(v) for v in request.args.get('tile', '320x240').lower().split('x'))
+            colonnes = request.args.get('cols', type=int)
+        except ValueError:
+            return jsonify({"error": "Paramètres de mosaïque invalides"}), 400
+        if not (32 <= largeur <= 1920 and 32 <= hauteur <= 1080) or (colonnes is not None and colonnes < 1):
+            return jsonify({"error": "Paramètres de mosaïque invalides"}), 400
+        
+        query = Equipement.query.filter_by(stream_enabled=True)
+        if current_user.role == 'client':
+            query = query.filter_by(client_id=current_user.client_id)
+        if ids:
+            query = query.filter(Equipement.id.in_(ids))
+        equipements = {eq.id: eq for eq in query.all() if eq.has_stream_capability}
+        
+        camera_ids = [i for i in dict.fromkeys(ids) if i in equipements] if ids else sorted(equipements)
+        if request.args.get('order') == 'activity':
+            rang = {camera['camera_id']: n for n, camera in enumerate(camera_manager.get_activity(set(camera_ids)))}
+            camera_ids.sort(key=lambda i: rang.get(i, len(rang)))
+        camera_ids = camera_ids[:CAMERA_MOSAIC_MAX]
+        if not camera_ids:
+            return jsonify({"error": "Aucune caméra disponible"}), 404
+        
+        # Démarrer les flux (une caméra injoignable reste une tuile vide)
+        for camera_id in camera_ids:
+            camera_manager.ensure_camera_stream(equipements[camera_id])
+        
+        colonnes = min(colonnes or math.ceil(math.sqrt(len(camera_ids))), len(camera_ids))
+        return generate_mosaic_response(camera_ids, colonnes, (largeur, hauteur))
+        
+    except Exception as e:
+        logger.error(f"Erreur mosaïque caméras: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
+@app.route('/api/cameras/activity')
+@login_required
+def cameras_activity_api():
+    """Caméras classées par activité (détection de mouvement) et derniers événements"""
+    try:
+        if camera_manager is None:
+            return jsonify({"error": "Streaming de caméras non disponible"}), 503
+        
+        camera_ids = None
+        if current_user.role == 'client':
+            camera_ids = {eq.id for eq in Equipement.query.filter_by(client_id=current_user.client_id).all()}
+        return jsonify(camera_manager.get_activity(camera_ids))
+        
+    except Exception as e:
+        logger.error(f"Erreur API activité caméras: {e}")
+        return jsonify({"error": "Erreur interne du serveur"}), 500
+
 # Route pour la page de détail d'une caméra avec flux vidéo
 @app.route('/camera/<int:camera_id>')
 @login_required
@@ -678,11 +974,16 @@ def configure_stream(equipement_id):
             # Sauvegarder la configuration RTSP
             equipement.rtsp_url = request.form.get('rtsp_url')
             equipement.rtsp_username = request.form.get('rtsp_username')
-            equipement.rtsp_password = request.form.get('rtsp_password')
+            if request.form.get('rtsp_password'):
+                # Mot de passe jamais réaffiché: un champ vide conserve le mot de passe enregistré
+                equipement.rtsp_password = request.form.get('rtsp_password')
             equipement.stream_enabled = bool(request.form.get('stream_enabled'))
             equipement.resolution = request.form.get('resolution', '640x480')
             equipement.fps = int(request.form.get('fps', 15))
             equipement.stream_quality = request.form.get('stream_quality', 'medium')
+            if 'stream_standby' in request.form:
+                # Case à cocher précédée d'un champ caché à 0: la dernière valeur transmise fait foi
+                equipement.stream_standby = request.form.getlist('stream_standby')[-1] == '1'
             
             db.session.commit()
             flash('Configuration RTSP sauvegardée avec succès.', 'success')
@@ -694,19 +995,3 @@ def configure_stream(equipement_id):
         logger.error(f"Erreur configuration stream {equipement_id}: {e}")
         flash(f"Erreur lors de la configuration: {e}", "error")
         return redirect(url_for('equipements'))
-
-# Nettoyage automatique des flux morts (désactivé pour Windows)
-@app.before_request
-def cleanup_dead_streams():
-    """Nettoie les flux morts avant chaque requête"""
-    # Désactiver sur Windows pour éviter les erreurs OpenCV
-    if os.environ.get('DISABLE_CAMERA_STREAMS') == '1':
-        return
-    
-    # Ne nettoyer que de temps en temps pour éviter la surcharge
-    import random
-    if random.randint(1, 100) == 1:  # 1% de chance à chaque requête
-        try:
-            camera_manager.cleanup_dead_streams()
-        except Exception as e:
-            logger.debug(f"Erreur nettoyage streams: {e}")
\ No newline at end of file
@@ -2,119 +2,159 @@ import logging
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy.orm import joinedload
 from app import db
 from models import Equipement, Alerte
 from email_service import email_service
+from write_queue import write_queue
+from metrics import mesurer_tache, ALERTS_TOTAL, EQUIPEMENTS_ACTIFS, EQUIPEMENTS_HORS_LIGNE
 
 logger = logging.getLogger(__name__)
 
+@mesurer_tache('verifier_equipements')
+def _generer_alertes_hors_ligne():
+    """Crée les alertes des équipements hors ligne et retourne les notifications email à envoyer"""
+    # Définir le seuil de timeout (2 minutes)
+    timeout = datetime.utcnow() - timedelta(minutes=2)
+    notifications = []
+    nb_hors_ligne = 0
+    nb_alertes = 0
+    
+    # Trouver tous les équipements actifs (avec leur client, utilisé pour le message et l'email)
+    equipements = Equipement.query.options(joinedload(Equipement.client)).filter_by(actif=True).all()
+    
+    # Équipements ayant déjà une alerte hors ligne récente, en une seule requête
+    equipements_deja_alertes = {
+        equipement_id for (equipement_id,) in db.session.query(Alerte.equipement_id).filter(
+            Alerte.type_alerte == 'hors_ligne',
+            Alerte.timestamp > datetime.utcnow() - timedelta(hours=1)
+        ).distinct()
+    }
+    
+    for equipement in equipements:
+        # Vérifier si l'équipement était en ligne mais est maintenant hors ligne
+        etait_en_ligne = True
+        if equipement.dernier_ping is None or equipement.dernier_ping <= timeout:
+            etait_en_ligne = False
+            nb_hors_ligne += 1
+        
+        # Vérifier s'il y a déjà une alerte récente pour cet équipement
+        alerte_recente = equipement.id in equipements_deja_alertes
+        
+        # Si l'équipement est hors ligne et qu'il n'y a pas d'alerte récente
+        if not etait_en_ligne and not alerte_recente:
+            # Créer une nouvelle alerte
+            alerte = Alerte()
+            alerte.equipement_id = equipement.id
+            alerte.type_alerte = 'hors_ligne'
+            alerte.message = f"L'équipement {equipement.nom} ({equipement.adresse_ip}) du client {equipement.client.nom} est hors ligne depuis plus de 2 minutes"
+            alerte.timestamp = datetime.utcnow()
+            
+            # Email d'alerte au client, envoyé après l'écriture
+            if equipement.client.email:
+                notifications.append({
+                    'client_email': equipement.client.email,
+                    'client_name': equipement.client.nom,
+                    'equipment_name': equipement.nom,
+                    'equipment_type': equipement.type_equipement,
+                    'equipment_ip': equipement.adresse_ip
+                })
+            
+            db.session.add(alerte)
+            nb_alertes += 1
+            logger.warning(f"Alerte générée: {equipement.nom} hors ligne")
+    
+    db.session.commit()
+    
+    EQUIPEMENTS_ACTIFS.set(len(equipements))
+    EQUIPEMENTS_HORS_LIGNE.set(nb_hors_ligne)
+    ALERTS_TOTAL.labels(type_alerte='hors_ligne').inc(nb_alertes)
+    return notifications
+
 def verifier_equipements_hors_ligne():
     """Vérifie périodiquement les équipements hors ligne et génère des alertes"""
     from app import app
     
     with app.app_context():
         try:
-            # Définir le seuil de timeout (2 minutes)
-            timeout = datetime.utcnow() - timedelta(minutes=2)
-            
-            # Trouver tous les équipements actifs
-            equipements = Equipement.query.filter_by(actif=True).all()
+            notifications = write_queue.execute(_generer_alertes_hors_ligne)
             
-            for equipement in equipements:
-                # Vérifier si l'équipement était en ligne mais est maintenant hors ligne
-                etait_en_ligne = True
-                if equipement.dernier_ping is None or equipement.dernier_ping <= timeout:
-                    etait_en_ligne = False
-                
-                # Vérifier s'il y a déjà une alerte récente pour cet équipement
-                alerte_recente = Alerte.query.filter_by(
-                    equipement_id=equipement.id,
-                    type_alerte='hors_ligne'
-                ).filter(
-                    Alerte.timestamp > datetime.utcnow() - timedelta(hours=1)
-                ).first()
-                
-                # Si l'équipement est hors ligne et qu'il n'y a pas d'alerte récente
-                if not etait_en_ligne and not alerte_recente:
-                    # Créer une nouvelle alerte
-                    alerte = Alerte()
-                    alerte.equipement_id = equipement.id
-                    alerte.type_alerte = 'hors_ligne'
-                    alerte.message = f"L'équipement {equipement.nom} ({equipement.adresse_ip}) du client {equipement.client.nom} est hors ligne depuis plus de 2 minutes"
-                    alerte.timestamp = datetime.utcnow()
-                    
-                    # Envoyer email d'alerte au client
-                    if equipement.client.email:
-                        email_service.send_equipment_offline_alert(
-                            client_email=equipement.client.email,
-                            client_name=equipement.client.nom,
-                            equipment_name=equipement.nom,
-                            equipment_type=equipement.type_equipement,
-                            equipment_ip=equipement.adresse_ip
-                        )
-                        logger.info(f"Email d'alerte envoyé à {equipement.client.email} pour l'équipement {equipement.nom}")
-                    
-                    db.session.add(alerte)
-                    logger.warning(f"Alerte générée: {equipement.nom} hors ligne")
+            # Envoyer les emails d'alerte hors de la file d'écriture
+            for notification in notifications:
+                email_service.send_equipment_offline_alert(**notification)
+                logger.info(f"Email d'alerte envoyé à {notification['client_email']} pour l'équipement {notification['equipment_name']}")
             
-            db.session.commit()
             logger.debug("Vérification des équipements hors ligne terminée")
             
         except Exception as e:
             logger.error(f"Erreur lors de la vérification des équipements: {e}")
             db.session.rollback()
 
+@mesurer_tache('nettoyer_historique')
+def _supprimer_historique_ancien():
+    """Supprime les entrées d'historique plus anciennes que 30 jours, retourne leur nombre"""
+    from models import HistoriquePing
+    
+    limite = datetime.utcnow() - timedelta(days=30)
+    
+    # Compter les entrées à supprimer
+    nb_a_supprimer = HistoriquePing.query.filter(
+        HistoriquePing.timestamp < limite
+    ).count()
+    
+    if nb_a_supprimer > 0:
+        # Supprimer les entrées anciennes
+        HistoriquePing.query.filter(
+            HistoriquePing.timestamp < limite
+        ).delete()
+        
+        db.session.commit()
+    
+    return nb_a_supprimer
+
 def nettoyer_historique():
     """Nettoie l'historique ancien pour éviter l'accumulation excessive de données"""
     from app import app
     
     with app.app_context():
         try:
-            # Supprimer les entrées d'historique plus anciennes que 30 jours
-            limite = datetime.utcnow() - timedelta(days=30)
-            
-            from models import HistoriquePing
-            
-            # Compter les entrées à supprimer
-            nb_a_supprimer = HistoriquePing.query.filter(
-                HistoriquePing.timestamp < limite
-            ).count()
-            
-            if nb_a_supprimer > 0:
-                # Supprimer les entrées anciennes
-                HistoriquePing.query.filter(
-                    HistoriquePing.timestamp < limite
-                ).delete()
-                
-                db.session.commit()
-                logger.info(f"Historique nettoyé: {nb_a_supprimer} entrées supprimées")
+            nb_supprimes = write_queue.execute(_supprimer_historique_ancien)
+            if nb_supprimes > 0:
+                logger.info(f"Historique nettoyé: {nb_supprimes} entrées supprimées")
             
         except Exception as e:
             logger.error(f"Erreur lors du nettoyage de l'historique: {e}")
             db.session.rollback()
 
+@mesurer_tache('nettoyer_alertes')
+def _supprimer_alertes_lues():
+    """Supprime les alertes lues plus anciennes que 7 jours, retourne leur nombre"""
+    limite = datetime.utcnow() - timedelta(days=7)
+    
+    nb_a_supprimer = Alerte.query.filter(
+        Alerte.timestamp < limite,
+        Alerte.lue == True
+    ).count()
+    
+    if nb_a_supprimer > 0:
+        Alerte.query.filter(
+            Alerte.timestamp < limite,
+            Alerte.lue == True
+        ).delete()
+        
+        db.session.commit()
+    
+    return nb_a_supprimer
+
 def nettoyer_alertes():
     """Nettoie les alertes anciennes déjà lues"""
     from app import app
     
     with app.app_context():
         try:
-            # Supprimer les alertes lues plus anciennes que 7 jours
-            limite = datetime.utcnow() - timedelta(days=7)
-            
-            nb_a_supprimer = Alerte.query.filter(
-                Alerte.timestamp < limite,
-                Alerte.lue == True
-            ).count()
-            
-            if nb_a_supprimer > 0:
-                Alerte.query.filter(
-                    Alerte.timestamp < limite,
-                    Alerte.lue == True
-                ).delete()
-                
-                db.session.commit()
-                logger.info(f"Alertes nettoyées: {nb_a_supprimer} alertes supprimées")
+            nb_supprimes = write_queue.execute(_supprimer_alertes_lues)
+            if nb_supprimes > 0:
+                logger.info(f"Alertes nettoyées: {nb_supprimes} alertes supprimées")
             
         except Exception as e:
             logger.error(f"Erreur lors du nettoyage des alertes: {e}")
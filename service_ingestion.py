@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Service d'ingestion des pings, séparé de l'application Flask
+Sert POST /api/ping (même contrat que la route Flask) dans une boucle asyncio (aiohttp), avec un
+accès asynchrone à la base (SQLAlchemy asyncio: aiosqlite ou asyncpg): les pages HTML et les flux
+MJPEG servis par gunicorn ne retardent plus les heartbeats.
+
+Les équipements connus sont gardés en mémoire (rechargés périodiquement) pour répondre 404 sans
+requête; les pings reçus pendant une écriture sont enregistrés ensemble à l'écriture suivante
+(une transaction par lot), et chaque requête reçoit sa réponse une fois son ping écrit.
+
+Usage:
+    python service_ingestion.py --port 5001
+"""
+import os
+import sys
+
+# Processus d'ingestion: pool dimensionné pour l'ingestion, pas de tâches planifiées ni de flux caméras
+os.environ.setdefault('DB_ROLE', 'ingestion')
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+os.environ.setdefault('DISABLE_CAMERA_STREAMS', '1')
+
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+PORT_DEFAUT = int(os.environ.get('INGESTION_PORT', 5001))
+
+# Pilotes asynchrones par type de base
+PILOTES_ASYNC = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+def creer_moteur_async(url):
+    """Crée le moteur asynchrone équivalent au moteur synchrone de l'application"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from db_pool import get_engine_options
+    from sqlite_profile import appliquer_profil_sqlite
+
+    url = make_url(url)
+    pilote = PILOTES_ASYNC.get(url.get_backend_name())
+    if pilote is None:
+        raise ValueError(f"Base de données non prise en charge par le service d'ingestion: {url.get_backend_name()}")
+
+    options = get_engine_options(url.render_as_string(hide_password=False))
+    options.pop('poolclass', None)  # le pool instrumenté est synchrone
+    if pilote == 'postgresql+asyncpg':
+        url = url.difference_update_query(['sslmode'])  # option libpq inconnue d'asyncpg
+
+    moteur = create_async_engine(url.set(drivername=pilote), **options)
+    appliquer_profil_sqlite(moteur.sync_engine)
+    return moteur
+
+class AnnuaireEquipements:
+    """Équipements connus (IDs, et IP des équipements actifs), rechargés périodiquement"""
+
+    def __init__(self, moteur, rafraichissement=60.0):
+        self.moteur = moteur
+        self.rafraichissement = rafraichissement
+        self.ids = set()
+        self.par_adresse = {}
+
+    async def charger(self):
+        from models import Equipement
+
+        async with self.moteur.connect() as connexion:
+            lignes = (await connexion.execute(
+                select(Equipement.id, Equipement.adresse_ip, Equipement.actif)
+            )).all()
+
+        self.ids = {equipement_id for equipement_id, _, _ in lignes}
+        self.par_adresse = {adresse_ip: equipement_id for equipement_id, adresse_ip, actif in lignes if actif}
+        logger.debug(f"Annuaire rechargé: {len(self.ids)} équipements")
+
+    async def rafraichir(self):
+        """Tâche de fond: recharge l'annuaire (équipements ajoutés, désactivés ou supprimés)"""
+        while True:
+            await asyncio.sleep(self.rafraichissement)
+            try:
+                await self.charger()
+            except Exception as e:
+                logger.error(f"Erreur lors du rechargement des équipements: {e}")
+
+    async def resoudre(self, equipement_id=None, adresse_ip=None):
+        """Retourne l'ID de l'équipement (comme enregistrer_ping), ou None s'il est introuvable"""
+        from models import Equipement
+
+        if equipement_id:
+            if equipement_id in self.ids:
+                return equipement_id
+            requete = select(Equipement.id).where(Equipement.id == equipement_id)
+        else:
+            if adresse_ip in self.par_adresse:
+                return self.par_adresse[adresse_ip]
+            requete = select(Equipement.id).where(Equipement.adresse_ip == adresse_ip, Equipement.actif == True)
+
+        # Équipement ajouté depuis le dernier rechargement
+        async with self.moteur.connect() as connexion:
+            trouve = (await connexion.execute(requete.limit(1))).scalar()
+        if trouve is not None:
+            if equipement_id:
+                self.ids.add(trouve)
+            else:
+                self.par_adresse[adresse_ip] = trouve
+        return trouve
+
+class EcrituresGroupees:
+    """Écrit les pings par lots avec un seul écrivain (commit groupé)
+
+    `enregistrer` attend l'écriture du ping; les pings arrivés pendant une écriture forment le
+    lot suivant, si bien que la taille des lots suit la charge sans délai ajouté.
+    """
+
+    def __init__(self, moteur, taille_lot=2000, transport='async'):
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        self.fabrique_sessions = async_sessionmaker(moteur, expire_on_commit=False)
+        self.taille_lot = taille_lot
+        self.transport = transport
+        self.file = asyncio.Queue()
+
+    async def enregistrer(self, ping):
+        future = asyncio.get_running_loop().create_future()
+        self.file.put_nowait((ping, future))
+        await future
+
+    async def executer(self):
+        """Tâche d'écriture"""
+        while True:
+            lot = [await self.file.get()]
+            while len(lot) < self.taille_lot and not self.file.empty():
+                lot.append(self.file.get_nowait())
+            await self._ecrire(lot)
+
+    async def _ecrire(self, lot):
+        from ingestion import enregistrer_pings_par_lot
+        from metrics import PING_BATCH_SECONDS, PING_BATCH_SIZE
+
+        pings = [ping for ping, _ in lot]
+        debut = time.perf_counter()
+        try:
+            async with self.fabrique_sessions() as session:
+                await session.run_sync(lambda session_sync: enregistrer_pings_par_lot(pings, session=session_sync))
+        except Exception as e:
+            logger.error(f"Erreur lors de l'écriture d'un lot de {len(lot)} pings: {e}")
+            for _, future in lot:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        PING_BATCH_SECONDS.labels(transport=self.transport).observe(time.perf_counter() - debut)
+        PING_BATCH_SIZE.labels(transport=self.transport).observe(len(lot))
+        for _, future in lot:
+            if not future.done():  # client déconnecté entre-temps
+                future.set_result(None)
+
+class ServiceIngestion:
+    """Application aiohttp servant /api/ping"""
+
+    def __init__(self, url_base, taille_lot=2000, rafraichissement=60.0):
+        self.moteur = creer_moteur_async(url_base)
+        self.annuaire = AnnuaireEquipements(self.moteur, rafraichissement)
+        self.ecritures = EcrituresGroupees(self.moteur, taille_lot)
+        self.taches = []
+
+    def application(self):
+        application = web.Application()
+        application.router.add_post('/api/ping', self.recevoir_ping)
+        application.router.add_get('/sante', self.sante)
+        application.on_startup.append(self.demarrer)
+        application.on_cleanup.append(self.arreter)
+        return application
+
+    async def demarrer(self, application):
+        await self.annuaire.charger()
+        self.taches = [
+            asyncio.create_task(self.ecritures.executer()),
+            asyncio.create_task(self.annuaire.rafraichir()),
+        ]
+        logger.info(f"Service d'ingestion prêt ({len(self.annuaire.ids)} équipements)")
+
+    async def arreter(self, application):
+        for tache in self.taches:
+            tache.cancel()
+        await asyncio.gather(*self.taches, return_exceptions=True)
+        await self.moteur.dispose()
+
+    async def recevoir_ping(self, request):
+        """Endpoint pour recevoir les pings des équipements (même contrat que la route Flask)"""
+        from ingestion import valider_ping, PingInvalide
+        from metrics import PING_LATENCY, PINGS_TOTAL
+
+        debut = time.perf_counter()
+        statut = 'error'
+        try:
+            try:
+                data = await request.json()
+            except ValueError:
+                data = None
+
+            try:
+                adresse_ip, equipement_id, reponse_ms, message = valider_ping(data)
+                equipement_id = int(equipement_id) if equipement_id else None
+            except (PingInvalide, TypeError, ValueError) as e:
+                statut = 'invalid'
+                return self._reponse({"error": str(e) if isinstance(e, PingInvalide) else "ID d'équipement invalide"},
+                                     400, debut)
+
+            equipement_id = await self.annuaire.resoudre(equipement_id, adresse_ip)
+            if not equipement_id:
+                statut = 'unknown'
+                return self._reponse({"error": "Équipement non trouvé"}, 404, debut)
+
+            await self.ecritures.enregistrer({
+                'equipement_id': equipement_id,
+                'reponse_ms': reponse_ms,
+                'message': message,
+            })
+
+            statut = 'ok'
+            return self._reponse({
+                "status": "success",
+                "message": "Ping reçu",
+                "equipement_id": equipement_id,
+                "timestamp": datetime.utcnow().isoformat()
+            }, 200, debut)
+
+        except Exception as e:
+            logger.error(f"Erreur lors du traitement du ping: {e}")
+            return self._reponse({"error": "Erreur interne du serveur"}, 500, debut)
+
+        finally:
+            PINGS_TOTAL.labels(transport='async', status=statut).inc()
+            PING_LATENCY.labels(transport='async').observe(time.perf_counter() - debut)
+
+    async def sante(self, request):
+        return web.json_response({
+            "status": "ok",
+            "equipements": len(self.annuaire.ids),
+            "pings_en_attente": self.ecritures.file.qsize(),
+        })
+
+    @staticmethod
+    def _reponse(donnees, statut, debut):
+        # Même en-tête Server-Timing que les routes Flask (lu par charge_pings.py)
+        duree_ms = (time.perf_counter() - debut) * 1000
+        return web.json_response(donnees, status=statut, headers={'Server-Timing': f'app;dur={duree_ms:.2f}'})
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Service d'ingestion asynchrone des pings")
+    parser.add_argument('--hote', default=os.environ.get('INGESTION_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=PORT_DEFAUT)
+    parser.add_argument('--taille-lot', type=int, default=int(os.environ.get('INGESTION_BATCH_SIZE', 2000)),
+                        help="nombre maximum de pings par transaction")
+    parser.add_argument('--rafraichissement', type=float,
+                        default=float(os.environ.get('INGESTION_REFRESH_SECONDS', 60)),
+                        help="période de rechargement de la liste des équipements (secondes)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    config = parse_args(argv)
+    if web is None:
+        print("❌ aiohttp est requis: uv sync --extra ingestion (ou pip install aiohttp)", file=sys.stderr)
+        return 1
+
+    from app import app, db
+
+    logging.getLogger().setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+    with app.app_context():
+        # URL résolue par Flask-SQLAlchemy (chemin SQLite relatif au dossier instance)
+        url_base = db.engine.url
+
+    try:
+        service = ServiceIngestion(url_base, config.taille_lot, config.rafraichissement)
+    except ImportError as e:
+        print(f"❌ Pilote asynchrone manquant ({e}): uv sync --extra ingestion "
+              "(ou pip install aiosqlite pour SQLite, asyncpg pour PostgreSQL)",
+              file=sys.stderr)
+        return 1
+
+    web.run_app(service.application(), host=config.hote, port=config.port, access_log=None, print=None)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
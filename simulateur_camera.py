@@ -8,6 +8,16 @@ import json
 import random
 from datetime import datetime
 
+def construire_donnees_ping(ip, equipement_id, nom):
+    """Construit le corps JSON d'un ping (format attendu par /api/ping)"""
+    return {
+        "ip": ip,
+        "equipement_id": equipement_id,
+        # Temps de réponse simulé (comme une vraie caméra)
+        "response_time": round(random.uniform(20.0, 80.0), 1),
+        "message": f"Ping depuis {nom} - Simulation PC"
+    }
+
 class SimulateurCamera:
     def __init__(self, serveur_monitoring, ma_ip, equipement_id, nom_equipement="Camera Simulée"):
         """
@@ -34,16 +44,9 @@ class SimulateurCamera:
     def envoyer_ping(self):
         """Envoie un ping vers le serveur de monitoring"""
         try:
-            # Temps de réponse simulé (comme une vraie caméra)
-            response_time = round(random.uniform(20.0, 80.0), 1)
-            
             # Données à envoyer (format attendu par votre API)
-            data = {
-                "ip": self.ma_ip,
-                "equipement_id": self.equipement_id,
-                "response_time": response_time,
-                "message": f"Ping depuis {self.nom} - Simulation PC"
-            }
+            data = construire_donnees_ping(self.ma_ip, self.equipement_id, self.nom)
+            response_time = data["response_time"]
             
             print(f"📡 {datetime.now().strftime('%H:%M:%S')} - Envoi ping...")
             
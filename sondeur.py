@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Sondage actif des équipements qui n'envoient pas de pings
+Vérifie adresse_ip:port (connexion TCP, ou requête RTSP OPTIONS pour les caméras ayant une URL RTSP)
+pour des milliers d'équipements en parallèle (asyncio, parallélisme borné), avec des intervalles
+adaptatifs, et écrit les résultats dans l'historique par lots (TamponPings).
+
+Les équipements qui envoient eux-mêmes leurs pings ne sont pas sondés (sauf SONDAGE_TOUS=1).
+
+Usage:
+    python sondeur.py
+"""
+import os
+import sys
+
+# Processus d'ingestion: pool dimensionné pour l'ingestion, pas de tâches planifiées
+os.environ.setdefault('DB_ROLE', 'ingestion')
+os.environ.setdefault('DISABLE_SCHEDULER', '1')
+
+import asyncio
+import heapq
+import logging
+import random
+import signal
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+PORT_RTSP = 554
+
+class ResultatSondage:
+    """Résultat d'une sonde: succès, temps de réponse (ms), message et statut d'historique
+    (success, error ou timeout, fixé par la sonde qui a constaté le délai dépassé)"""
+
+    def __init__(self, succes, reponse_ms=None, message='', statut=None):
+        self.succes = succes
+        self.reponse_ms = reponse_ms
+        self.message = message
+        self.statut = statut or ('success' if succes else 'error')
+
+def cible_invalide(hote, port):
+    """Motif d'invalidité d'une cible (hôte manquant, port hors limites), None si elle est valide"""
+    if not hote:
+        return "hôte manquant"
+    if not 0 < port < 65536:
+        return f"port invalide ({port})"
+    return None
+
+async def sonder_tcp(hote, port, timeout=3.0):
+    """Teste l'ouverture d'une connexion TCP"""
+    invalidite = cible_invalide(hote, port)
+    if invalidite:
+        return ResultatSondage(False, message=f"TCP {hote}:{port}: adresse invalide ({invalidite})")
+    debut = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(hote, port), timeout)
+    except asyncio.TimeoutError:
+        return ResultatSondage(False, message=f"TCP {hote}:{port}: délai dépassé ({timeout}s)",
+                               statut='timeout')
+    except OSError as e:
+        return ResultatSondage(False, message=f"TCP {hote}:{port}: {e.strerror or e}")
+
+    reponse_ms = int((time.perf_counter() - debut) * 1000)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return ResultatSondage(True, reponse_ms, f"TCP {hote}:{port} joignable")
+
+async def sonder_rtsp(url, timeout=3.0):
+    """Envoie une requête RTSP OPTIONS: toute réponse RTSP (même 401) prouve que la caméra répond"""
+    try:
+        cible = urlparse(url)
+        hote, port = cible.hostname, cible.port or PORT_RTSP
+    except ValueError as e:
+        return ResultatSondage(False, message=f"RTSP: URL invalide ({e})")
+    # Sans hôte, la connexion viserait la machine locale
+    invalidite = cible_invalide(hote, port)
+    if invalidite:
+        return ResultatSondage(False, message=f"RTSP: URL invalide ({invalidite})")
+    debut = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(hote, port), timeout)
+        # URL sans identifiants: OPTIONS ne nécessite pas d'authentification
+        url_publique = f"rtsp://{hote}:{port}{cible.path or '/'}"
+        writer.write(f"OPTIONS {url_publique} RTSP/1.0\r\nCSeq: 1\r\nUser-Agent: sondeur\r\n\r\n".encode())
+        await writer.drain()
+        ligne = await asyncio.wait_for(reader.readline(), timeout)
+    except asyncio.TimeoutError:
+        return ResultatSondage(False, message=f"RTSP {hote}:{port}: délai dépassé ({timeout}s)",
+                               statut='timeout')
+    except OSError as e:
+        return ResultatSondage(False, message=f"RTSP {hote}:{port}: {e.strerror or e}")
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not ligne.startswith(b"RTSP/1."):
+        return ResultatSondage(False, message=f"RTSP {hote}:{port}: réponse invalide")
+
+    reponse_ms = int((time.perf_counter() - debut) * 1000)
+    return ResultatSondage(True, reponse_ms, f"RTSP {hote}:{port}: {ligne.decode(errors='replace').strip()}")
+
+async def sonder_equipement(adresse_ip, port, rtsp_url=None, timeout=3.0):
+    """Sonde un équipement: RTSP OPTIONS s'il a une URL RTSP, connexion TCP sinon"""
+    if rtsp_url and rtsp_url.startswith('rtsp://'):
+        return await sonder_rtsp(rtsp_url, timeout)
+    return await sonder_tcp(adresse_ip, port or 80, timeout)
+
+class CibleSondage:
+    """État de sondage d'un équipement"""
+
+    __slots__ = ('equipement_id', 'adresse_ip', 'port', 'rtsp_url', 'echecs', 'derniere_sonde', 'dernier_ping')
+
+    def __init__(self, equipement_id, adresse_ip, port, rtsp_url, dernier_ping):
+        self.equipement_id = equipement_id
+        self.adresse_ip = adresse_ip
+        self.port = port
+        self.rtsp_url = rtsp_url
+        self.dernier_ping = dernier_ping
+        self.echecs = 0
+        self.derniere_sonde = None
+
+class Sondeur:
+    """Sonde périodiquement les équipements actifs
+
+    Intervalles adaptatifs: un équipement joignable est resondé toutes les `intervalle` secondes
+    (inférieur au seuil hors ligne de 2 minutes); après un échec, l'intervalle repart de
+    `intervalle_echec` et double à chaque nouvel échec jusqu'à `intervalle_max`.
+    """
+
+    def __init__(self, app, tampon, parallelisme=500, timeout=3.0, intervalle=60.0, intervalle_echec=15.0,
+                 intervalle_max=300.0, rafraichissement=60.0, tous=False):
+        self.app = app
+        self.tampon = tampon
+        self.parallelisme = parallelisme
+        self.timeout = timeout
+        self.intervalle = intervalle
+        self.intervalle_echec = intervalle_echec
+        self.intervalle_max = intervalle_max
+        self.rafraichissement = rafraichissement
+        self.tous = tous
+        self.cibles = {}
+        self.file = []  # tas des (instant de la prochaine sonde, equipement_id)
+        self.sondes = 0
+        self.succes = 0
+
+    def charger_equipements(self):
+        """Recharge la liste des équipements actifs (nouveaux, supprimés, modifiés)"""
+        from models import Equipement
+
+        with self.app.app_context():
+            lignes = Equipement.query.with_entities(
+                Equipement.id, Equipement.adresse_ip, Equipement.port, Equipement.rtsp_url, Equipement.dernier_ping
+            ).filter_by(actif=True).all()
+
+        maintenant = time.monotonic()
+        vus = set()
+        for equipement_id, adresse_ip, port, rtsp_url, dernier_ping in lignes:
+            vus.add(equipement_id)
+            cible = self.cibles.get(equipement_id)
+            if cible is None:
+                self.cibles[equipement_id] = CibleSondage(equipement_id, adresse_ip, port, rtsp_url, dernier_ping)
+                # Premières sondes réparties sur un intervalle
+                heapq.heappush(self.file, (maintenant + random.uniform(0, self.intervalle), equipement_id))
+            else:
+                cible.adresse_ip, cible.port, cible.rtsp_url = adresse_ip, port, rtsp_url
+                cible.dernier_ping = dernier_ping
+
+        for equipement_id in set(self.cibles) - vus:
+            del self.cibles[equipement_id]
+
+    def envoie_ses_pings(self, cible):
+        """Indique si l'équipement a envoyé lui-même un ping récent (inutile de le sonder)"""
+        if self.tous or cible.dernier_ping is None:
+            return False
+        recent = cible.dernier_ping > datetime.utcnow() - timedelta(seconds=self.intervalle * 2)
+        propre_sonde = cible.derniere_sonde is not None and cible.dernier_ping <= cible.derniere_sonde
+        return recent and not propre_sonde
+
+    async def sonder(self, cible, semaphore):
+        # L'équipement est toujours replanifié, même après une erreur inattendue
+        delai = self.intervalle_max
+        try:
+            async with semaphore:
+                try:
+                    resultat = await sonder_equipement(cible.adresse_ip, cible.port, cible.rtsp_url, self.timeout)
+                except Exception as e:
+                    logger.error(f"Erreur de sondage de l'équipement {cible.equipement_id}: {e}")
+                    resultat = ResultatSondage(False, message=f"erreur: {e}")
+
+            self.sondes += 1
+            maintenant = datetime.utcnow()
+            if resultat.succes:
+                self.succes += 1
+                cible.echecs = 0
+                cible.derniere_sonde = maintenant
+                cible.dernier_ping = maintenant
+                delai = self.intervalle
+            else:
+                cible.echecs += 1
+                delai = min(self.intervalle_echec * 2 ** (cible.echecs - 1), self.intervalle_max)
+
+            self.tampon.ajouter({
+                'equipement_id': cible.equipement_id,
+                'timestamp': maintenant,
+                'statut': resultat.statut,
+                'reponse_ms': resultat.reponse_ms,
+                'message': f"Sondage {resultat.message}",
+            })
+        finally:
+            heapq.heappush(self.file, (time.monotonic() + delai * random.uniform(0.9, 1.1), cible.equipement_id))
+
+    async def executer(self, arret):
+        """Boucle principale jusqu'à ce que l'événement `arret` soit positionné"""
+        semaphore = asyncio.Semaphore(self.parallelisme)
+        taches = set()
+        prochain_rafraichissement = 0.0
+        dernier_journal = time.monotonic()
+
+        while not arret.is_set():
+            maintenant = time.monotonic()
+            if maintenant >= prochain_rafraichissement:
+                await asyncio.get_running_loop().run_in_executor(None, self.charger_equipements)
+                prochain_rafraichissement = maintenant + self.rafraichissement
+
+            # Lancer les sondes échues (le sémaphore borne le nombre de connexions simultanées)
+            while self.file and self.file[0][0] <= maintenant:
+                _, equipement_id = heapq.heappop(self.file)
+                cible = self.cibles.get(equipement_id)
+                if cible is None:
+                    continue
+                if self.envoie_ses_pings(cible):
+                    heapq.heappush(self.file, (maintenant + self.intervalle, equipement_id))
+                    continue
+                tache = asyncio.create_task(self.sonder(cible, semaphore))
+                taches.add(tache)
+                tache.add_done_callback(taches.discard)
+
+            if maintenant - dernier_journal >= 60:
+                logger.info(f"Sondage: {len(self.cibles)} équipements, {self.sondes} sondes "
+                            f"({self.succes} réussies), {len(taches)} en cours")
+                dernier_journal = maintenant
+
+            attente = self.file[0][0] - maintenant if self.file else 1.0
+            try:
+                await asyncio.wait_for(arret.wait(), timeout=min(max(attente, 0.01), 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+        for tache in taches:
+            tache.cancel()
+
+async def _executer(sondeur):
+    loop = asyncio.get_running_loop()
+    arret = asyncio.Event()
+    for signal_arret in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signal_arret, arret.set)
+        except NotImplementedError:
+            pass  # Windows
+    await sondeur.executer(arret)
+
+def main():
+    from app import app
+    from ingestion import TamponPings
+
+    logging.getLogger().setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+    tampon = TamponPings(app, 'sonde', intervalle=float(os.environ.get('SONDAGE_FLUSH_SECONDS', 1.0)))
+    sondeur = Sondeur(
+        app, tampon,
+        parallelisme=int(os.environ.get('SONDAGE_PARALLELISME', 500)),
+        timeout=float(os.environ.get('SONDAGE_TIMEOUT', 3.0)),
+        intervalle=float(os.environ.get('SONDAGE_INTERVALLE', 60)),
+        intervalle_echec=float(os.environ.get('SONDAGE_INTERVALLE_ECHEC', 15)),
+        intervalle_max=float(os.environ.get('SONDAGE_INTERVALLE_MAX', 300)),
+        tous=os.environ.get('SONDAGE_TOUS') == '1',
+    )
+    logger.info(f"Sondeur démarré (parallélisme {sondeur.parallelisme}, intervalle {sondeur.intervalle}s)")
+
+    tampon.demarrer()
+    try:
+        asyncio.run(_executer(sondeur))
+    finally:
+        tampon.arreter()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Profil de performance SQLite pour les accès concurrents
+Active le journal WAL et règle les PRAGMA à chaque nouvelle connexion
+"""
+import os
+import logging
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+def get_sqlite_pragmas():
+    """Retourne les PRAGMA à appliquer, configurables par variables d'environnement"""
+    return {
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),  # négatif = en Ko
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+
+def appliquer_profil_sqlite(engine):
+    """Enregistre l'application des PRAGMA sur un moteur SQLite (sans effet sur les autres)"""
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    pragmas = get_sqlite_pragmas()
+
+    @event.listens_for(engine, "connect")
+    def _configurer_connexion(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for nom, valeur in pragmas.items():
+                cursor.execute(f"PRAGMA {nom}={valeur}")
+        finally:
+            cursor.close()
+
+    logger.info(f"Profil SQLite appliqué: {pragmas}")
+    return True
@@ -77,6 +77,32 @@ function refreshCameraFeeds() {
         setTimeout(() => {
             feed.classList.remove('pulse');
         }, 1000);
+
+        // Revalidate snapshot images: the server answers 304 while the scene is unchanged
+        const snapshotUrl = feed.dataset.snapshotUrl;
+        if (snapshotUrl && feed.tagName === 'IMG') {
+            fetch(snapshotUrl, { cache: 'no-cache' })
+                .then(response => {
+                    const etag = response.headers.get('ETag');
+                    if (!response.ok || (etag && etag === feed.dataset.etag)) {
+                        return null;
+                    }
+                    feed.dataset.etag = etag || '';
+                    return response.blob();
+                })
+                .then(blob => {
+                    if (!blob) {
+                        return;
+                    }
+                    if (feed.src.startsWith('blob:')) {
+                        URL.revokeObjectURL(feed.src);
+                    }
+                    feed.src = URL.createObjectURL(blob);
+                })
+                .catch(error => {
+                    console.error('Error refreshing snapshot:', error);
+                });
+        }
     });
 }
 
@@ -0,0 +1,56 @@
+"""
+Configuration des tests: base SQLite temporaire, sans tâches planifiées
+Les variables d'environnement doivent être fixées avant le premier import de `app`.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+from jinja2 import ChainableUndefined
+
+_DOSSIER = tempfile.mkdtemp(prefix='tests-monitoring-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_DOSSIER, 'tests.db')}"
+os.environ['DISABLE_SCHEDULER'] = '1'
+os.environ.pop('DATABASE_REPLICA_URLS', None)
+
+from app import app as application, db  # noqa: E402
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_DOSSIER, ignore_errors=True)
+
+@pytest.fixture(scope='session')
+def app():
+    """Application en mode test (budgets de requêtes vérifiés, exceptions propagées)"""
+    application.config.update(TESTING=True)
+    return application
+
+@pytest.fixture
+def app_context(app):
+    with app.app_context():
+        yield
+
+@pytest.fixture(scope='session')
+def base_vide(app):
+    """Vide la base (les modules de test remplissent leur propre parc)"""
+    from generer_parc import vider_base
+
+    def vider():
+        with app.app_context():
+            vider_base()
+    return vider
+
+@pytest.fixture(scope='session')
+def gabarits_tolerants(app):
+    """Certains gabarits citent des routes absentes (ajouter_client...) ou des variables non fournies
+    (stats d'admin_users): rendus quand même, seules les requêtes sont mesurées ici"""
+    def lien_absent(error, endpoint, values):
+        return '#'
+
+    app.url_build_error_handlers.append(lien_absent)
+    undefined, app.jinja_env.undefined = app.jinja_env.undefined, ChainableUndefined
+    app.jinja_env.cache.clear()
+    yield
+    app.url_build_error_handlers.remove(lien_absent)
+    app.jinja_env.undefined = undefined
+    app.jinja_env.cache.clear()
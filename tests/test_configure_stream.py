@@ -0,0 +1,49 @@
+"""
+Configuration RTSP (`configure_stream`): le mot de passe enregistré n'est jamais réaffiché
+"""
+from datetime import timedelta
+
+import pytest
+
+from app import db
+from generer_parc import creer_admin, generer_parc, MOT_DE_PASSE_DEFAUT
+from models import Equipement
+
+MOT_DE_PASSE_RTSP = 'secret-rtsp-42'
+
+@pytest.fixture
+def camera(app, base_vide, gabarits_tolerants):
+    """Parc minimal avec un équipement configuré en RTSP, et un client HTTP admin connecté"""
+    base_vide()
+    with app.app_context():
+        generer_parc(nb_clients=1, nb_equipements=1, historique=timedelta(hours=1), graine=1)
+        creer_admin(MOT_DE_PASSE_DEFAUT)
+        equipement = Equipement.query.first()
+        equipement.rtsp_url = 'rtsp://192.168.1.10:554/stream1'
+        equipement.rtsp_password = MOT_DE_PASSE_RTSP
+        db.session.commit()
+        equipement_id = equipement.id
+
+    client = app.test_client()
+    client.post('/login', data={'nom_utilisateur': 'admin', 'mot_de_passe': MOT_DE_PASSE_DEFAUT})
+    return client, equipement_id
+
+def _mot_de_passe(app, equipement_id):
+    with app.app_context():
+        return db.session.get(Equipement, equipement_id).rtsp_password
+
+def test_mot_de_passe_absent_de_la_page(camera):
+    client, equipement_id = camera
+    reponse = client.get(f'/equipements/{equipement_id}/configure_stream')
+    assert reponse.status_code == 200
+    assert MOT_DE_PASSE_RTSP not in reponse.get_data(as_text=True)
+
+def test_champ_vide_conserve_le_mot_de_passe(app, camera):
+    client, equipement_id = camera
+    formulaire = {'rtsp_url': 'rtsp://192.168.1.10:554/stream1', 'rtsp_password': ''}
+    client.post(f'/equipements/{equipement_id}/configure_stream', data=formulaire)
+    assert _mot_de_passe(app, equipement_id) == MOT_DE_PASSE_RTSP
+
+    client.post(f'/equipements/{equipement_id}/configure_stream',
+                data=dict(formulaire, rtsp_password='nouveau'))
+    assert _mot_de_passe(app, equipement_id) == 'nouveau'
@@ -0,0 +1,68 @@
+"""
+Budgets de requêtes SQL des routes (`query_budget`)
+Chaque route décorée est appelée avec un petit parc puis un parc dix fois plus grand: le nombre de
+requêtes doit rester le même (pas de N+1) et le décorateur échoue si le budget est dépassé.
+"""
+from datetime import timedelta
+
+import pytest
+
+from generer_parc import creer_admin, generer_parc, MOT_DE_PASSE_DEFAUT
+from models import User
+from query_stats import QueryCounter
+
+ROUTES = ['/', '/clients', '/equipements', '/historique', '/alertes', '/admin/users',
+          '/api/stats', '/api/equipements/status']
+
+# (clients, équipements) du petit parc; le grand parc en a dix fois plus
+PARC = (3, 20)
+
+def _compter_requetes(app, base_vide, facteur):
+    """Génère un parc (`facteur` × PARC) et retourne {(rôle, route): nombre de requêtes}"""
+    base_vide()
+    with app.app_context():
+        generer_parc(nb_clients=PARC[0] * facteur, nb_equipements=PARC[1] * facteur,
+                     historique=timedelta(days=1), graine=facteur)
+        creer_admin(MOT_DE_PASSE_DEFAUT)
+        utilisateur_client = User.query.filter_by(role='client', statut='approuve', actif=True).first()
+        comptes = {'admin': 'admin', 'client': utilisateur_client.nom_utilisateur}
+
+    resultats = {}
+    for role, nom_utilisateur in comptes.items():
+        client = app.test_client()
+        reponse = client.post('/login', data={'nom_utilisateur': nom_utilisateur,
+                                              'mot_de_passe': MOT_DE_PASSE_DEFAUT})
+        assert reponse.status_code == 302, f"connexion de {nom_utilisateur} refusée"
+        for route in ROUTES:
+            with QueryCounter() as compteur:
+                reponse = client.get(route)
+            assert reponse.status_code in (200, 302), f"{route} ({role}): {reponse.status_code}"
+            resultats[role, route] = compteur.count
+    return resultats
+
+@pytest.fixture(scope='module')
+def requetes(app, base_vide, gabarits_tolerants):
+    return _compter_requetes(app, base_vide, 1), _compter_requetes(app, base_vide, 10)
+
+@pytest.mark.parametrize('role', ['admin', 'client'])
+@pytest.mark.parametrize('route', ROUTES)
+def test_requetes_independantes_du_parc(requetes, role, route):
+    petit, grand = requetes
+    assert petit[role, route] > 0
+    assert grand[role, route] == petit[role, route], \
+        f"{route} ({role}): {petit[role, route]} requêtes avec le petit parc, {grand[role, route]} avec le grand"
+
+def test_budget_depasse(app, app_context):
+    """Le décorateur échoue en mode test quand la vue dépasse son budget"""
+    from query_stats import query_budget, QueryBudgetExceeded
+    from app import db
+
+    @query_budget(1)
+    def vue():
+        db.session.execute(db.text('SELECT 1'))
+        db.session.execute(db.text('SELECT 2'))
+        return 'ok'
+
+    with app.test_request_context('/'):
+        with pytest.raises(QueryBudgetExceeded):
+            vue()
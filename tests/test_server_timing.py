@@ -0,0 +1,23 @@
+"""
+En-tête Server-Timing: les requêtes SQL exécutées par le thread d'écriture sont attribuées à la route
+"""
+import re
+from datetime import timedelta
+
+from generer_parc import generer_parc
+from models import Equipement
+from write_queue import write_queue
+
+def test_ecritures_du_thread_d_ecriture_comptees(app, app_context, base_vide):
+    base_vide()
+    generer_parc(nb_clients=1, nb_equipements=1, historique=timedelta(hours=1), graine=1)
+    equipement = Equipement.query.first()
+    assert write_queue.enabled
+
+    reponse = app.test_client().post('/api/ping', json={'ip': equipement.adresse_ip})
+    assert reponse.status_code == 200
+    assert write_queue.thread is not None and write_queue.thread.is_alive()
+
+    server_timing = reponse.headers.get('Server-Timing')
+    requetes = int(re.search(r'SQL \((\d+)\)', server_timing).group(1))
+    assert requetes > 0, server_timing
@@ -0,0 +1,27 @@
+"""
+Usage des index par les requêtes réelles des chemins fréquents (verifier_index.py)
+"""
+from datetime import timedelta
+
+import pytest
+
+from generer_parc import creer_admin, generer_parc, MOT_DE_PASSE_DEFAUT
+from verifier_index import CHEMINS_FREQUENTS, verifier_index
+
+@pytest.fixture(scope='module')
+def parc(app, base_vide, gabarits_tolerants):
+    base_vide()
+    with app.app_context():
+        generer_parc(nb_clients=5, nb_equipements=50, historique=timedelta(days=2))
+        creer_admin(MOT_DE_PASSE_DEFAUT)
+
+@pytest.mark.parametrize('chemin', CHEMINS_FREQUENTS, ids=[origine for origine, _, _ in CHEMINS_FREQUENTS])
+def test_requetes_frequentes_indexees(app, parc, chemin, capsys):
+    from app import db
+
+    with app.app_context():
+        echecs = verifier_index(app, db, [chemin])
+
+    sortie = capsys.readouterr().out
+    assert 'ignoré' not in sortie, sortie
+    assert echecs == [], sortie
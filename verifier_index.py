@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Vérifie via EXPLAIN que les requêtes des routes fréquentes utilisent un index
+Les requêtes ne sont pas recopiées: les chemins fréquents (routes, réception des pings, tâches planifiées)
+sont exécutés et leurs requêtes SQL réelles capturées (before_cursor_execute), puis expliquées.
+Les écritures de ces chemins sont annulées (commit remplacé par un flush, puis rollback).
+Fonctionne sur SQLite (EXPLAIN QUERY PLAN) et PostgreSQL (EXPLAIN)
+Usage: DATABASE_URL=... python verifier_index.py
+"""
+import logging
+import sys
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Instructions expliquées (les INSERT n'ont pas de plan de parcours)
+INSTRUCTIONS_EXPLIQUEES = ('SELECT', 'UPDATE', 'DELETE')
+
+class CheminIgnore(Exception):
+    """Chemin non exécutable sur cette base (aucun compte ou équipement d'exemple)"""
+
+class Contexte:
+    """Comptes et équipement d'exemple avec lesquels les chemins fréquents sont exécutés"""
+
+    def __init__(self, app):
+        from models import User, Equipement
+
+        self.app = app
+        self.equipement = Equipement.query.filter_by(actif=True).first()
+        comptes = {
+            'admin': User.query.filter_by(role='admin', actif=True).first(),
+            'client': User.query.filter(User.role == 'client', User.client_id.isnot(None),
+                                        User.actif == True).first(),
+        }
+        self.clients_http = {role: self._client_http(user) for role, user in comptes.items() if user}
+
+    def _client_http(self, user):
+        """Client HTTP de test authentifié sans mot de passe (session Flask-Login)"""
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
+
+    def get(self, route, role='admin'):
+        client = self.clients_http.get(role)
+        if client is None:
+            raise CheminIgnore(f"aucun compte {role}")
+        client.get(route)
+
+    def exiger_equipement(self):
+        if self.equipement is None:
+            raise CheminIgnore("aucun équipement actif")
+        return self.equipement
+
+def _recevoir_ping(contexte):
+    from ingestion import enregistrer_ping
+    enregistrer_ping(adresse_ip=contexte.exiger_equipement().adresse_ip)
+
+def _camera_detail(contexte):
+    contexte.get(f"/camera/{contexte.exiger_equipement().id}")
+
+def _verifier_hors_ligne(contexte):
+    from scheduler import _generer_alertes_hors_ligne
+    _generer_alertes_hors_ligne()
+
+def _nettoyer_historique(contexte):
+    from scheduler import _supprimer_historique_ancien
+    _supprimer_historique_ancien()
+
+# Chemins fréquents: (origine, tables dont l'accès doit passer par un index, exécution)
+CHEMINS_FREQUENTS = [
+    ("dashboard / api_stats / equipements (client)", ("equipements",),
+     lambda contexte: (contexte.get('/', 'client'), contexte.get('/api/stats', 'client'),
+                       contexte.get('/equipements', 'client'))),
+    ("recevoir_ping (par IP)", ("equipements",), _recevoir_ping),
+    ("camera_detail (historique récent)", ("historique_pings", "alertes"), _camera_detail),
+    ("historique (admin)", ("historique_pings",), lambda contexte: contexte.get('/historique')),
+    ("nettoyer_historique", ("historique_pings",), _nettoyer_historique),
+    ("verifier_equipements_hors_ligne (alertes récentes)", ("alertes",), _verifier_hors_ligne),
+    ("dashboard / api_stats (alertes non lues, dernières alertes)", ("alertes",),
+     lambda contexte: (contexte.get('/'), contexte.get('/api/stats'))),
+]
+
+@contextmanager
+def ecritures_annulees(db):
+    """db.session.commit() devient un flush: les écritures restent dans une transaction annulée à la sortie"""
+    db.session.commit = db.session.flush
+    try:
+        yield
+    finally:
+        del db.session.commit
+        db.session.rollback()
+
+@contextmanager
+def capturer_requetes(engines):
+    """Collecte les (engine, requête, paramètres) exécutés sur `engines`"""
+    requetes = []
+
+    def capturer(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(INSTRUCTIONS_EXPLIQUEES):
+            requetes.append((conn.engine, statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", capturer)
+    try:
+        yield requetes
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", capturer)
+
+def plan_sqlite(connection, sql, params):
+    """Retourne les lignes du plan SQLite"""
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + sql, params)
+    return [row[-1] for row in rows]
+
+def plan_postgresql(connection, sql, params):
+    """Retourne les lignes du plan PostgreSQL (scans séquentiels découragés sur les petites tables)"""
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    rows = connection.exec_driver_sql("EXPLAIN " + sql, params)
+    return [row[0] for row in rows]
+
+def expliquer(engine, sql, params):
+    """Plan d'exécution d'une requête capturée (dans une transaction annulée)"""
+    with engine.connect() as connection, connection.begin() as transaction:
+        if engine.dialect.name == 'postgresql':
+            plan = plan_postgresql(connection, sql, params)
+        else:
+            plan = plan_sqlite(connection, sql, params)
+        transaction.rollback()
+    return plan
+
+def parcourt(plan, table, dialecte):
+    """Indique si le plan lit la table (ou un de ses alias)"""
+    if dialecte == 'sqlite':
+        return any(ligne.split(' ')[1:2] and ligne.split(' ')[1].startswith(table) for ligne in plan)
+    return any(f" on {table}" in ligne for ligne in plan)
+
+def utilise_index(plan, table, dialecte):
+    """Indique si le plan évite un parcours complet de la table"""
+    for ligne in plan:
+        if dialecte == 'sqlite':
+            if ligne.startswith(f"SCAN {table}") and "USING" not in ligne:
+                return False
+        elif f"Seq Scan on {table}" in ligne:
+            return False
+    return True
+
+def executer_chemin(app, db, execution):
+    """Exécute un chemin fréquent (écritures annulées) et retourne ses requêtes capturées"""
+    contexte = Contexte(app)
+    niveau = logging.root.manager.disable
+    logging.disable(logging.ERROR)  # alertes et pings simulés, pages de test: pas de journalisation
+    try:
+        with capturer_requetes(list(db.engines.values())) as requetes, ecritures_annulees(db):
+            execution(contexte)
+    finally:
+        logging.disable(niveau)
+    return requetes
+
+def verifier_index(app, db, chemins=CHEMINS_FREQUENTS):
+    """Exécute chaque chemin fréquent et explique ses requêtes, retourne la liste des échecs"""
+    echecs = []
+
+    for origine, tables, execution in chemins:
+        try:
+            requetes = executer_chemin(app, db, execution)
+        except CheminIgnore as e:
+            print(f"⚠️  {origine}: ignoré ({e})")
+            continue
+
+        ok = True
+        verifiees = 0
+        for engine, sql, params in requetes:
+            dialecte = engine.dialect.name
+            plan = expliquer(engine, sql, params)
+            tables_lues = [table for table in tables if parcourt(plan, table, dialecte)]
+            if not tables_lues:
+                continue
+            verifiees += 1
+            requete_ok = all(utilise_index(plan, table, dialecte) for table in tables_lues)
+            ok = ok and requete_ok
+            print(f"   {'✅' if requete_ok else '❌'} {' '.join(sql.split())[:160]}")
+            for ligne in plan:
+                print(f"         {ligne}")
+
+        if not verifiees:
+            # Le chemin n'a pas lu les tables attendues: la liste des chemins n'est plus à jour
+            print(f"❌ {origine}: aucune requête sur {', '.join(tables)}")
+            ok = False
+        else:
+            print(f"{'✅' if ok else '❌'} {origine}")
+
+        if not ok:
+            echecs.append(origine)
+
+    return echecs
+
+if __name__ == "__main__":
+    from app import app, db
+
+    with app.app_context():
+        print(f"🔍 Vérification des index ({db.engine.dialect.name})")
+        print("=" * 50)
+
+        echecs = verifier_index(app, db)
+
+        print("=" * 50)
+        if echecs:
+            print(f"❌ {len(echecs)} chemin(s) avec une requête sans index: {', '.join(echecs)}")
+            sys.exit(1)
+
+        print("✅ Toutes les requêtes fréquentes utilisent un index")
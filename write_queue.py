@@ -0,0 +1,105 @@
+"""
+File d'écriture à thread unique
+Sérialise les écritures (ingestion des pings, tâches planifiées) pour éviter
+les erreurs "database is locked" de SQLite
+"""
+import os
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+
+from query_stats import compteurs_actifs, compter_pour
+
+logger = logging.getLogger(__name__)
+
+class WriteQueue:
+    """Exécute les fonctions d'écriture une par une dans un thread dédié"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.queue = queue.Queue()
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Active la file pour les bases SQLite (désactivable avec SQLITE_WRITE_QUEUE=0)"""
+        self.app = app
+        uri = app.config.get("SQLALCHEMY_DATABASE_URI", "")
+        self.enabled = uri.startswith("sqlite") and os.environ.get('SQLITE_WRITE_QUEUE', '1') != '0'
+        if self.enabled:
+            atexit.register(self.stop)
+            logger.info("File d'écriture SQLite activée")
+
+    def _ensure_started(self):
+        """Démarre le thread d'écriture (une fois par processus, compatible fork de gunicorn)"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return
+
+            self.queue = queue.Queue()
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        """Boucle du thread d'écriture (privé)"""
+        from app import db
+
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            fonction, args, kwargs, compteurs, future = job
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # Requêtes comptées pour la requête HTTP qui a soumis l'écriture (Server-Timing, /admin/perf)
+            with self.app.app_context(), compter_pour(compteurs):
+                try:
+                    future.set_result(fonction(*args, **kwargs))
+                except BaseException as e:
+                    db.session.rollback()
+                    future.set_exception(e)
+
+    def submit(self, fonction, *args, **kwargs):
+        """Place une fonction d'écriture dans la file et retourne un Future"""
+        if not self.enabled:
+            future = Future()
+            try:
+                future.set_result(fonction(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            return future
+
+        self._ensure_started()
+        future = Future()
+        self.queue.put((fonction, args, kwargs, compteurs_actifs(), future))
+        return future
+
+    def execute(self, fonction, *args, timeout=30, **kwargs):
+        """Exécute une fonction d'écriture et attend son résultat
+
+        Appelée depuis le thread d'écriture lui-même, la fonction est exécutée directement.
+        Sinon elle s'exécute dans le thread d'écriture, avec son propre contexte d'application.
+        """
+        if not self.enabled or threading.current_thread() is self.thread:
+            return fonction(*args, **kwargs)
+
+        return self.submit(fonction, *args, **kwargs).result(timeout=timeout)
+
+    def stop(self):
+        """Arrête le thread d'écriture après les écritures en attente"""
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5.0)
+        self.thread = None
+
+# Instance globale de la file d'écriture
+write_queue = WriteQueue()